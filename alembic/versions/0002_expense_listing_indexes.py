@@ -0,0 +1,35 @@
+from alembic import op
+
+revision = '0002_expense_listing_indexes'
+down_revision = '0001_init'
+branch_labels = None
+depends_on = None
+
+# Composite indexes backing keyset pagination on (txn_date, id) for each
+# GET /expenses filter; each supersedes the single-column index it starts with
+LISTING_INDEXES = {
+    'idx_expenses_txn_date_id': ['txn_date', 'id'],
+    'idx_expenses_status_txn_date': ['reimbursement_status', 'txn_date', 'id'],
+    'idx_expenses_currency_txn_date': ['currency', 'txn_date', 'id'],
+    'idx_expenses_category_txn_date': ['category_id', 'txn_date', 'id'],
+    'idx_expenses_vendor_txn_date': ['vendor_id', 'txn_date', 'id'],
+    'idx_expenses_kirkland_te_txn_date': ['kirkland_te_report', 'txn_date', 'id'],
+}
+
+SUPERSEDED_INDEXES = {
+    'idx_expenses_txn_date': ['txn_date'],
+    'idx_expenses_status': ['reimbursement_status'],
+    'idx_expenses_kirkland_te_report': ['kirkland_te_report'],
+}
+
+def upgrade():
+    for name, columns in LISTING_INDEXES.items():
+        op.create_index(name, 'expenses', columns)
+    for name in SUPERSEDED_INDEXES:
+        op.drop_index(name, table_name='expenses')
+
+def downgrade():
+    for name, columns in SUPERSEDED_INDEXES.items():
+        op.create_index(name, 'expenses', columns)
+    for name in LISTING_INDEXES:
+        op.drop_index(name, table_name='expenses')
@@ -0,0 +1,38 @@
+from alembic import op
+
+revision = '0003_expense_totals_view'
+down_revision = '0002_expense_listing_indexes'
+branch_labels = None
+depends_on = None
+
+# Pre-aggregated totals behind /reports/summary, /outstanding and /ageing.
+# Group keys are COALESCEd so the unique index below covers every row, which
+# REFRESH MATERIALIZED VIEW CONCURRENTLY requires (category_id 0 = none).
+def upgrade():
+    op.execute("""
+    CREATE MATERIALIZED VIEW expense_totals AS
+    SELECT
+      currency,
+      COALESCE(category_id, 0) AS category_id,
+      COALESCE(reimbursement_status, '') AS reimbursement_status,
+      COALESCE(reimbursable, false) AS reimbursable,
+      CASE
+        WHEN CURRENT_DATE - txn_date <= 30 THEN '0-30'
+        WHEN CURRENT_DATE - txn_date <= 60 THEN '31-60'
+        WHEN CURRENT_DATE - txn_date <= 90 THEN '61-90'
+        ELSE '90+'
+      END AS ageing_bucket,
+      COUNT(*) AS n,
+      SUM(amount) AS total_amount,
+      SUM(amount_home) AS total_home,
+      CURRENT_DATE AS as_of
+    FROM expenses
+    GROUP BY 1, 2, 3, 4, 5
+    """)
+    op.execute("""
+    CREATE UNIQUE INDEX uq_expense_totals_group ON expense_totals
+      (currency, category_id, reimbursement_status, reimbursable, ageing_bucket)
+    """)
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS expense_totals")
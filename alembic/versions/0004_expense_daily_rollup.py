@@ -0,0 +1,32 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0004_expense_daily_rollup'
+down_revision = '0003_expense_totals_view'
+branch_labels = None
+depends_on = None
+
+# Per-day totals behind /reports/by_category, /by_merchant and /trends.
+# run_sync rebuilds only the days it touched (app.aggregates.refresh_daily_rollup);
+# category_id / vendor_id 0 stand for "none" so they can be part of the key.
+def upgrade():
+    op.create_table('expense_daily_rollup',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('currency', sa.Text(), nullable=False),
+        sa.Column('category_id', sa.BigInteger(), nullable=False),
+        sa.Column('vendor_id', sa.BigInteger(), nullable=False),
+        sa.Column('n', sa.Integer(), nullable=False),
+        sa.Column('total_amount', sa.Numeric(18,2)),
+        sa.Column('total_home', sa.Numeric(18,2)),
+        sa.PrimaryKeyConstraint('day', 'currency', 'category_id', 'vendor_id'),
+    )
+    op.execute("""
+    INSERT INTO expense_daily_rollup (day, currency, category_id, vendor_id, n, total_amount, total_home)
+    SELECT txn_date, currency, COALESCE(category_id, 0), COALESCE(vendor_id, 0),
+           COUNT(*), SUM(amount), SUM(amount_home)
+    FROM expenses
+    GROUP BY 1, 2, 3, 4
+    """)
+
+def downgrade():
+    op.drop_table('expense_daily_rollup')
@@ -0,0 +1,61 @@
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0005_merchant_trigram_index'
+down_revision = '0004_expense_daily_rollup'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 5000
+
+# Frozen copy of app.matching.normalize_merchant as of this revision, so
+# re-running the migration always backfills the same values
+PROCESSOR_PREFIX = re.compile(
+    r"^(sq|tst|sp|pp|paypal|iz|izettle|zettle|sumup|google|gpay|apple pay|pos|debit|purchase|ckcd|chk)\s*\*\s*"
+)
+STORE_NUMBER = re.compile(r"#\s*\d+|\b\d{3,}\b|\bstore\s+\d+\b")
+CORPORATE_SUFFIX = re.compile(r"\b(inc|llc|ltd|limited|bv|b v|gmbh|sa|sas|plc|corp|co|company|pty|ag|nv)\b")
+NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def normalize_merchant(name):
+    if not name:
+        return ""
+    s = name.lower().strip()
+    s = PROCESSOR_PREFIX.sub("", s)
+    s = s.split("*", 1)[0]
+    s = STORE_NUMBER.sub(" ", s)
+    s = NON_ALNUM.sub(" ", s)
+    s = CORPORATE_SUFFIX.sub(" ", s)
+    return " ".join(s.split())
+
+# Normalized merchant key (see normalize_merchant above) with a pg_trgm GIN
+# index so /recon/match-candidates can rank by similarity() without a seq scan.
+# The sync upsert keeps it populated; existing rows are backfilled here.
+def upgrade():
+    op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+    op.add_column('expenses', sa.Column('merchant_normalized', sa.Text()))
+
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text(
+            "SELECT id, merchant FROM expenses WHERE id > :last_id ORDER BY id LIMIT :n"
+        ), {"last_id": last_id, "n": BACKFILL_BATCH}).all()
+        if not rows:
+            break
+        conn.execute(
+            sa.text("UPDATE expenses SET merchant_normalized = :norm WHERE id = :id"),
+            [{"id": r.id, "norm": normalize_merchant(r.merchant)} for r in rows],
+        )
+        last_id = rows[-1].id
+
+    op.execute(
+        "CREATE INDEX idx_expenses_merchant_trgm ON expenses "
+        "USING gin (merchant_normalized gin_trgm_ops)"
+    )
+
+def downgrade():
+    op.drop_index('idx_expenses_merchant_trgm', table_name='expenses')
+    op.drop_column('expenses', 'merchant_normalized')
@@ -0,0 +1,24 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0006_recon_staged_rows'
+down_revision = '0005_merchant_trigram_index'
+branch_labels = None
+depends_on = None
+
+# Validated company statement rows, written with COPY by app.staging.stage_upload
+# and grouped by the upload_id returned from POST /recon/upload.
+def upgrade():
+    op.create_table('recon_staged_rows',
+        sa.Column('id', sa.BigInteger(), primary_key=True),
+        sa.Column('upload_id', sa.Uuid(), nullable=False),
+        sa.Column('row_number', sa.Integer(), nullable=False),
+        sa.Column('txn_date', sa.Date(), nullable=False),
+        sa.Column('merchant', sa.Text()),
+        sa.Column('amount', sa.Numeric(18,2), nullable=False),
+        sa.Column('reference', sa.Text()),
+    )
+    op.create_index('idx_recon_staged_rows_upload', 'recon_staged_rows', ['upload_id', 'row_number'])
+
+def downgrade():
+    op.drop_table('recon_staged_rows')
@@ -0,0 +1,50 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0007_recon_sessions'
+down_revision = '0006_recon_staged_rows'
+branch_labels = None
+depends_on = None
+
+# Reconciliation sessions: one per /recon/upload (id = upload_id). Staged rows
+# carry the proposed / accepted expense; POST /recon/sessions/{id}/commit applies
+# accepted pairs to expenses in one statement (app.reconcile.commit_matches).
+def upgrade():
+    op.create_table('recon_sessions',
+        sa.Column('id', sa.Uuid(), primary_key=True),
+        sa.Column('filename', sa.Text()),
+        sa.Column('status', sa.Text(), nullable=False, server_default='staged'),
+        sa.Column('total_rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('staged_rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('error_rows', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('created_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text('now()')),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text('now()')),
+    )
+    # Uploads staged before sessions existed become sessions of their own
+    op.execute("""
+    INSERT INTO recon_sessions (id, total_rows, staged_rows)
+    SELECT upload_id, COUNT(*), COUNT(*) FROM recon_staged_rows GROUP BY upload_id
+    """)
+    op.create_foreign_key('fk_recon_staged_rows_session', 'recon_staged_rows', 'recon_sessions',
+                          ['upload_id'], ['id'], ondelete='CASCADE')
+
+    op.add_column('recon_staged_rows', sa.Column('matched_expense_id', sa.BigInteger(),
+                  sa.ForeignKey('expenses.id', ondelete='SET NULL')))
+    op.add_column('recon_staged_rows', sa.Column('match_score', sa.Numeric(6,4)))
+    op.add_column('recon_staged_rows', sa.Column('match_status', sa.Text()))  # proposed | accepted | committed | conflict
+    op.create_index('uq_recon_staged_rows_row', 'recon_staged_rows', ['upload_id', 'row_number'], unique=True)
+    op.drop_index('idx_recon_staged_rows_upload', table_name='recon_staged_rows')
+    # An expense can be accepted for at most one row of a session
+    op.create_index('uq_recon_staged_rows_accepted_expense', 'recon_staged_rows',
+                    ['upload_id', 'matched_expense_id'], unique=True,
+                    postgresql_where=sa.text("match_status IN ('accepted', 'committed')"))
+
+def downgrade():
+    op.drop_index('uq_recon_staged_rows_accepted_expense', table_name='recon_staged_rows')
+    op.create_index('idx_recon_staged_rows_upload', 'recon_staged_rows', ['upload_id', 'row_number'])
+    op.drop_index('uq_recon_staged_rows_row', table_name='recon_staged_rows')
+    op.drop_column('recon_staged_rows', 'match_status')
+    op.drop_column('recon_staged_rows', 'match_score')
+    op.drop_column('recon_staged_rows', 'matched_expense_id')
+    op.drop_constraint('fk_recon_staged_rows_session', 'recon_staged_rows', type_='foreignkey')
+    op.drop_table('recon_sessions')
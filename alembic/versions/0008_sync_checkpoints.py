@@ -0,0 +1,36 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0008_sync_checkpoints'
+down_revision = '0007_recon_sessions'
+branch_labels = None
+depends_on = None
+
+# Per-resource sync progress, written after every committed page so an
+# interrupted run resumes from the newest modified time it committed
+# (see app.sync._load_checkpoint).
+# `cursor` is the max last_modified_time of the last completed pass.
+def upgrade():
+    op.create_table('sync_checkpoints',
+        sa.Column('resource', sa.Text(), primary_key=True),
+        sa.Column('cursor', sa.TIMESTAMP(timezone=True)),
+        sa.Column('since', sa.TIMESTAMP(timezone=True)),
+        sa.Column('page', sa.Integer(), nullable=False, server_default='0'),
+        sa.Column('max_modified', sa.TIMESTAMP(timezone=True)),
+        sa.Column('in_progress', sa.Boolean(), nullable=False, server_default=sa.false()),
+        sa.Column('updated_at', sa.TIMESTAMP(timezone=True), nullable=False, server_default=sa.text('now()')),
+    )
+    # Carry the last successful wall-clock cursor over to both resources
+    op.execute("""
+    INSERT INTO sync_checkpoints (resource, cursor)
+    SELECT r.resource, s.cursor::timestamptz
+    FROM (VALUES ('reports'), ('expenses')) AS r(resource)
+    LEFT JOIN LATERAL (
+      SELECT cursor FROM sync_state
+      WHERE provider = 'zoho_expense' AND status = 'success' AND cursor IS NOT NULL
+      ORDER BY id DESC LIMIT 1
+    ) s ON TRUE
+    """)
+
+def downgrade():
+    op.drop_table('sync_checkpoints')
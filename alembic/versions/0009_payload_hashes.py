@@ -0,0 +1,18 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0009_payload_hashes'
+down_revision = '0008_sync_checkpoints'
+branch_labels = None
+depends_on = None
+
+# Content hash of the normalized row written by the sync (app.sync._payload_hash);
+# upserts skip rows whose hash is unchanged. NULL for existing rows, so each is
+# rewritten once on its next sync.
+def upgrade():
+    op.add_column('expenses', sa.Column('payload_hash', sa.Text()))
+    op.add_column('expense_reports', sa.Column('payload_hash', sa.Text()))
+
+def downgrade():
+    op.drop_column('expense_reports', 'payload_hash')
+    op.drop_column('expenses', 'payload_hash')
@@ -0,0 +1,70 @@
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+revision = '0010_fx_rates'
+down_revision = '0009_payload_hashes'
+branch_labels = None
+depends_on = None
+
+TOTALS_VIEW = """
+CREATE MATERIALIZED VIEW expense_totals AS
+SELECT
+  currency,
+  COALESCE(category_id, 0) AS category_id,
+  COALESCE(reimbursement_status, '') AS reimbursement_status,
+  COALESCE(reimbursable, false) AS reimbursable,
+  CASE
+    WHEN CURRENT_DATE - txn_date <= 30 THEN '0-30'
+    WHEN CURRENT_DATE - txn_date <= 60 THEN '31-60'
+    WHEN CURRENT_DATE - txn_date <= 90 THEN '61-90'
+    ELSE '90+'
+  END AS ageing_bucket,
+  COUNT(*) AS n,
+  SUM(amount) AS total_amount,
+  SUM(amount_home) AS total_home,
+  {extra}CURRENT_DATE AS as_of
+FROM expenses
+GROUP BY 1, 2, 3, 4, 5
+"""
+TOTALS_INDEX = """
+CREATE UNIQUE INDEX uq_expense_totals_group ON expense_totals
+  (currency, category_id, reimbursement_status, reimbursable, ageing_bucket)
+"""
+ROLLUP_REBUILD = """
+INSERT INTO expense_daily_rollup (day, currency, category_id, vendor_id, n, total_amount, total_home)
+SELECT txn_date, currency, COALESCE(category_id, 0), COALESCE(vendor_id, 0),
+       COUNT(*), SUM(amount), SUM(amount_home)
+FROM expenses
+GROUP BY 1, 2, 3, 4
+"""
+
+# Daily FX rates (app.fx) used to fill amount_home when Zoho doesn't send it.
+# Home-currency rows are backfilled here; foreign ones once rates are loaded
+# (python -m app.fx rates.csv). expense_totals gains n_home, the number of
+# rows that have a home amount, so reports can show what is not converted yet.
+def upgrade():
+    op.create_table('fx_rates',
+        sa.Column('base_currency', sa.Text(), nullable=False),
+        sa.Column('quote_currency', sa.Text(), nullable=False),
+        sa.Column('rate_date', sa.Date(), nullable=False),
+        sa.Column('rate', sa.Numeric(18,8), nullable=False),
+        sa.PrimaryKeyConstraint('base_currency', 'quote_currency', 'rate_date'),
+    )
+    op.execute(sa.text(
+        "UPDATE expenses SET amount_home = amount "
+        "WHERE amount_home IS NULL AND upper(currency) = :home"
+    ).bindparams(home=settings.HOME_CURRENCY.upper()))
+
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS expense_totals")
+    op.execute(TOTALS_VIEW.format(extra="COUNT(amount_home) AS n_home,\n  "))
+    op.execute(TOTALS_INDEX)
+    op.execute("DELETE FROM expense_daily_rollup")
+    op.execute(ROLLUP_REBUILD)
+
+def downgrade():
+    op.execute("DROP MATERIALIZED VIEW IF EXISTS expense_totals")
+    op.execute(TOTALS_VIEW.format(extra=""))
+    op.execute(TOTALS_INDEX)
+    op.drop_table('fx_rates')
@@ -0,0 +1,30 @@
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0011_attachment_mirror'
+down_revision = '0010_fx_rates'
+branch_labels = None
+depends_on = None
+
+# Receipt mirroring (app.attachments): one row per Zoho document, keyed by
+# (expense_id, zoho_file_id) so sync can register them with ON CONFLICT;
+# content_sha256 names the stored file once it has been downloaded.
+def upgrade():
+    op.add_column('attachments', sa.Column('content_sha256', sa.Text()))
+    op.add_column('attachments', sa.Column('mirrored_at', sa.TIMESTAMP(timezone=True)))
+    op.add_column('attachments', sa.Column('failed_attempts', sa.Integer(), nullable=False, server_default='0'))
+    op.execute("UPDATE attachments SET zoho_file_id = '' WHERE zoho_file_id IS NULL")
+    op.alter_column('attachments', 'zoho_file_id', nullable=False, server_default='')
+    op.create_index('uq_attachments_expense_file', 'attachments', ['expense_id', 'zoho_file_id'], unique=True)
+    op.create_index(
+        'idx_attachments_pending', 'attachments', ['id'],
+        postgresql_where=sa.text('content_sha256 IS NULL'),
+    )
+
+def downgrade():
+    op.drop_index('idx_attachments_pending', table_name='attachments')
+    op.drop_index('uq_attachments_expense_file', table_name='attachments')
+    op.alter_column('attachments', 'zoho_file_id', nullable=True, server_default=None)
+    op.drop_column('attachments', 'failed_attempts')
+    op.drop_column('attachments', 'mirrored_at')
+    op.drop_column('attachments', 'content_sha256')
@@ -0,0 +1,33 @@
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from app.search import SEARCH_DOCUMENT, SEARCH_SOURCE
+
+revision = '0012_expense_search'
+down_revision = '0011_attachment_mirror'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 20000
+
+# Weighted tsvector over merchant, description, category name and report title
+# behind GET /expenses/search. It spans joined tables, so it is a plain column
+# kept current by the sync (app.search.refresh_search_vectors), not a
+# generated one. Existing rows are backfilled by id range, then GIN-indexed.
+def upgrade():
+    op.add_column('expenses', sa.Column('search_vector', postgresql.TSVECTOR()))
+
+    conn = op.get_bind()
+    max_id = conn.execute(sa.text("SELECT COALESCE(MAX(id), 0) FROM expenses")).scalar()
+    for start in range(0, max_id, BACKFILL_BATCH):
+        conn.execute(sa.text(
+            f"UPDATE expenses e SET search_vector = {SEARCH_DOCUMENT} {SEARCH_SOURCE} "
+            "WHERE x.id = e.id AND e.id > :lo AND e.id <= :hi"
+        ), {"lo": start, "hi": start + BACKFILL_BATCH})
+
+    op.create_index('idx_expenses_search_vector', 'expenses', ['search_vector'], postgresql_using='gin')
+
+def downgrade():
+    op.drop_index('idx_expenses_search_vector', table_name='expenses')
+    op.drop_column('expenses', 'search_vector')
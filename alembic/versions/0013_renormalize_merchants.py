@@ -0,0 +1,56 @@
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0013_renormalize_merchants'
+down_revision = '0012_expense_search'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH = 5000
+
+# Frozen copy of app.matching.normalize_merchant as of this revision: corporate
+# suffixes are stripped only at the end of the name, so "Co Op Cafe" stays whole.
+# Unchanged expenses are never rewritten by the sync (payload hashes), so the
+# stored keys are recomputed here.
+PROCESSOR_PREFIX = re.compile(
+    r"^(sq|tst|sp|pp|paypal|iz|izettle|zettle|sumup|google|gpay|apple pay|pos|debit|purchase|ckcd|chk)\s*\*\s*"
+)
+STORE_NUMBER = re.compile(r"#\s*\d+|\b\d{3,}\b|\bstore\s+\d+\b")
+_SUFFIXES = r"(?:inc|llc|ltd|limited|bv|b v|gmbh|sa|sas|plc|corp|co|company|pty|ag|nv)"
+CORPORATE_SUFFIX = re.compile(rf"\b{_SUFFIXES}(?:\s+{_SUFFIXES})*\s*$")
+NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def normalize_merchant(name):
+    if not name:
+        return ""
+    s = name.lower().strip()
+    s = PROCESSOR_PREFIX.sub("", s)
+    s = s.split("*", 1)[0]
+    s = STORE_NUMBER.sub(" ", s)
+    s = NON_ALNUM.sub(" ", s)
+    s = CORPORATE_SUFFIX.sub(" ", s)
+    return " ".join(s.split())
+
+def upgrade():
+    conn = op.get_bind()
+    last_id = 0
+    while True:
+        rows = conn.execute(sa.text(
+            "SELECT id, merchant, merchant_normalized FROM expenses WHERE id > :last_id ORDER BY id LIMIT :n"
+        ), {"last_id": last_id, "n": BACKFILL_BATCH}).all()
+        if not rows:
+            break
+        changed = [
+            {"id": r.id, "norm": norm} for r in rows
+            if (norm := normalize_merchant(r.merchant)) != r.merchant_normalized
+        ]
+        if changed:
+            conn.execute(sa.text("UPDATE expenses SET merchant_normalized = :norm WHERE id = :id"), changed)
+        last_id = rows[-1].id
+
+def downgrade():
+    # The previous keys only differ for names with a suffix-like word mid-name;
+    # matching degrades gracefully, so they are not restored
+    pass
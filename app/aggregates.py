@@ -0,0 +1,57 @@
+# Materialized report aggregates, refreshed after writes instead of per request
+import logging
+from datetime import date
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+# See alembic/versions/0003_expense_totals_view.py
+AGGREGATE_VIEWS = ("expense_totals",)
+
+def refresh_daily_rollup(db: Session, days: Iterable[date]):
+    """Rebuild expense_daily_rollup rows for just the given days."""
+    days = sorted(set(days))
+    if not days:
+        return
+    db.execute(text("DELETE FROM expense_daily_rollup WHERE day = ANY(:days)"), {"days": days})
+    db.execute(
+        text(
+            "INSERT INTO expense_daily_rollup (day, currency, category_id, vendor_id, n, total_amount, total_home) "
+            "SELECT txn_date, currency, COALESCE(category_id, 0), COALESCE(vendor_id, 0), "
+            "COUNT(*), SUM(amount), SUM(amount_home) "
+            "FROM expenses WHERE txn_date = ANY(:days) GROUP BY 1, 2, 3, 4"
+        ),
+        {"days": days},
+    )
+
+def aggregates_outdated(db: Session) -> bool:
+    """
+    True once expense_totals was last refreshed on an earlier day: its
+    ageing_bucket is computed against CURRENT_DATE at refresh time, so
+    buckets only move when the view is refreshed.
+    """
+    return bool(db.execute(
+        text("SELECT COALESCE(MAX(as_of) < CURRENT_DATE, false) FROM expense_totals")
+    ).scalar())
+
+def refresh_aggregates(db: Session, days: Optional[Iterable[date]] = None):
+    """
+    Recompute the report views (CONCURRENTLY keeps them readable meanwhile)
+    and, when `days` is given, the daily rollup rows for those days.
+    """
+    if days:
+        refresh_daily_rollup(db, days)
+    for view in AGGREGATE_VIEWS:
+        db.execute(text(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {view}"))
+    db.commit()
+
+def try_refresh_aggregates(db: Session, days: Optional[Iterable[date]] = None):
+    """Refresh, but never fail the write that triggered it."""
+    try:
+        refresh_aggregates(db, days)
+    except Exception as e:
+        db.rollback()
+        logger.warning("Refreshing report aggregates failed: %s", e)
@@ -0,0 +1,84 @@
+# Chart aggregates computed in SQL from the expense_daily_rollup table
+from datetime import date
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+GRANULARITIES = ("day", "week", "month", "quarter", "year")
+
+# dimension -> (rollup key column, lookup table, label for key 0)
+DIMENSIONS = {
+    "category": ("category_id", "categories", "Uncategorized"),
+    "merchant": ("vendor_id", "vendors", "Unknown"),
+}
+
+def _filters(date_from: Optional[date], date_to: Optional[date], currency: Optional[str]) -> tuple[str, str, dict]:
+    """WHERE clause, metric column and params. Without a currency filter
+    totals are in home currency, since mixing raw amounts is meaningless."""
+    where, params = ["TRUE"], {}
+    if date_from:
+        where.append("day >= :date_from")
+        params["date_from"] = date_from
+    if date_to:
+        where.append("day <= :date_to")
+        params["date_to"] = date_to
+    if currency:
+        where.append("currency = :currency")
+        params["currency"] = currency
+    return " AND ".join(where), ("total_amount" if currency else "total_home"), params
+
+def columnar(rows, columns: list[str]) -> dict[str, list]:
+    """[(a, b), (c, d)] -> {"x": [a, c], "y": [b, d]}; keeps chart payloads small."""
+    return {name: [r[i] for r in rows] for i, name in enumerate(columns)}
+
+def top_n_breakdown(db: Session, dimension: str, date_from: Optional[date] = None,
+                    date_to: Optional[date] = None, granularity: Optional[str] = None,
+                    top: int = 10, currency: Optional[str] = None) -> dict[str, list]:
+    """
+    Totals per category or merchant, optionally per period. The `top` keys by
+    total over the whole range keep their name; the rest roll up into "Other".
+    """
+    key, lookup, unknown = DIMENSIONS[dimension]
+    where, metric, params = _filters(date_from, date_to, currency)
+    params.update(top=top, unknown=unknown, granularity=granularity)
+    period = "date_trunc(:granularity, day)::date" if granularity else "NULL::date"
+    q = f"""
+    WITH base AS (
+      SELECT {period} AS period, {key} AS key, SUM({metric}) AS total, SUM(n) AS n
+      FROM expense_daily_rollup
+      WHERE {where}
+      GROUP BY 1, 2
+    ), ranked AS (
+      SELECT key, ROW_NUMBER() OVER (ORDER BY SUM(total) DESC NULLS LAST, key) AS rnk
+      FROM base
+      GROUP BY key
+    )
+    SELECT b.period,
+           CASE WHEN r.rnk <= :top THEN COALESCE(l.name, :unknown) ELSE 'Other' END AS label,
+           SUM(b.total) AS total,
+           SUM(b.n)::bigint AS n
+    FROM base b
+    JOIN ranked r ON r.key = b.key
+    LEFT JOIN {lookup} l ON l.id = b.key
+    GROUP BY 1, 2
+    ORDER BY 1, MIN(r.rnk)
+    """
+    rows = db.execute(text(q), params).all()
+    data = columnar(rows, ["period", dimension, "total", "count"])
+    if not granularity:
+        del data["period"]
+    return data
+
+def trends(db: Session, date_from: Optional[date] = None, date_to: Optional[date] = None,
+           granularity: str = "month", currency: Optional[str] = None) -> dict[str, list]:
+    where, metric, params = _filters(date_from, date_to, currency)
+    params["granularity"] = granularity
+    q = f"""
+    SELECT date_trunc(:granularity, day)::date AS period, SUM({metric}) AS total, SUM(n)::bigint AS n
+    FROM expense_daily_rollup
+    WHERE {where}
+    GROUP BY 1
+    ORDER BY 1
+    """
+    return columnar(db.execute(text(q), params).all(), ["period", "total", "count"])
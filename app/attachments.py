@@ -0,0 +1,251 @@
+# Receipt mirroring: Zoho attachment discovery, streamed downloads and content-addressed storage
+import asyncio
+import hashlib
+import logging
+import os
+import stat
+import tempfile
+from contextlib import suppress
+from pathlib import Path
+from typing import AsyncIterator, Optional
+
+import anyio
+from fastapi.responses import FileResponse
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Attachment
+from app.zoho import ZohoUnavailable, open_receipt
+
+logger = logging.getLogger(__name__)
+
+class AttachmentStore:
+    """
+    Files named by the SHA-256 of their content under `root` (ab/cd/abcd...),
+    so identical receipts are stored once. Downloads land in root/tmp and are
+    renamed into place, so a reader never sees a partial file.
+    """
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+
+    def path_for(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / digest
+
+    async def save_stream(self, chunks: AsyncIterator[bytes]) -> tuple[str, int]:
+        """Write chunks to disk as they arrive; returns (sha256 hex, size in bytes)."""
+        tmp_dir = self.root / "tmp"
+        tmp_dir.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        digest = hashlib.sha256()
+        size = 0
+        try:
+            # Plain writes: downloads run on the sync worker's loop, not the API's
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in chunks:
+                    digest.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            final = self.path_for(digest.hexdigest())
+            if final.exists():
+                os.unlink(tmp)  # already stored: dedupe
+            else:
+                final.parent.mkdir(parents=True, exist_ok=True)
+                os.replace(tmp, final)
+        except BaseException:
+            with suppress(FileNotFoundError):
+                os.unlink(tmp)
+            raise
+        return digest.hexdigest(), size
+
+store = AttachmentStore(settings.ATTACHMENT_DIR)
+
+# ---------- Discovery ----------
+
+def _documents(zoho: dict) -> list[dict]:
+    """Attachment rows described by a Zoho expense (documents[], else has_attachment)."""
+    docs = [
+        {
+            "zoho_file_id": str(d.get("document_id") or ""),
+            "filename": d.get("file_name"),
+            "mime_type": d.get("file_type"),
+            "size_bytes": d.get("file_size") if isinstance(d.get("file_size"), int) else None,
+        }
+        for d in zoho.get("documents") or []
+        if isinstance(d, dict) and d.get("document_id")
+    ]
+    if not docs and (zoho.get("has_attachment") or zoho.get("receipt_name")):
+        # List responses may only flag the receipt; "" stands for the primary one
+        docs.append({"zoho_file_id": "", "filename": zoho.get("receipt_name"), "mime_type": None, "size_bytes": None})
+    return docs
+
+def register_attachments(db: Session, items: list[dict]) -> int:
+    """
+    Record the attachments of a page of Zoho expenses (already upserted) in
+    one INSERT ... ON CONFLICT DO NOTHING; downloads happen later in
+    mirror batches. Returns how many rows were new.
+    """
+    by_zoho_id = {}
+    for it in items:
+        docs = _documents(it)
+        if docs:
+            by_zoho_id[str(it.get("expense_id") or it.get("id"))] = docs
+    if not by_zoho_id:
+        return 0
+    ids = db.execute(
+        text("SELECT zoho_expense_id, id FROM expenses WHERE zoho_expense_id = ANY(:ids)"),
+        {"ids": list(by_zoho_id)},
+    ).all()
+    rows = [dict(doc, expense_id=eid) for z_id, eid in ids for doc in by_zoho_id[z_id]]
+    if not rows:
+        return 0
+    stmt = (
+        insert(Attachment).values(rows)
+        .on_conflict_do_nothing(index_elements=["expense_id", "zoho_file_id"])
+        .returning(Attachment.id)
+    )
+    added = len(db.execute(stmt).all())
+    db.commit()
+    return added
+
+# ---------- Mirroring ----------
+
+def pending_attachments(db: Session, limit: int) -> list[dict]:
+    rows = db.execute(
+        text(
+            "SELECT a.id, a.zoho_file_id, e.zoho_expense_id FROM attachments a "
+            "JOIN expenses e ON e.id = a.expense_id "
+            "WHERE a.content_sha256 IS NULL AND a.failed_attempts < :max_attempts "
+            "ORDER BY a.id LIMIT :limit"
+        ),
+        {"max_attempts": settings.ATTACHMENT_MAX_ATTEMPTS, "limit": limit},
+    )
+    return [dict(r._mapping) for r in rows]
+
+async def _download(db: Session, att: dict, semaphore: asyncio.Semaphore,
+                    target: AttachmentStore) -> dict:
+    async with semaphore:
+        response = await open_receipt(db, att["zoho_expense_id"], att["zoho_file_id"] or None)
+        try:
+            response.raise_for_status()
+            digest, size = await target.save_stream(response.aiter_bytes(settings.ATTACHMENT_CHUNK_BYTES))
+        finally:
+            await response.aclose()
+    mime = response.headers.get("content-type", "").split(";")[0].strip() or None
+    return {"id": att["id"], "sha": digest, "size": size, "mime": mime}
+
+async def download_attachments(db: Session, pending: list[dict], concurrency: Optional[int] = None,
+                               target: Optional[AttachmentStore] = None) -> tuple[list[dict], list[int]]:
+    """
+    Stream the given attachments to the store with at most `concurrency`
+    downloads in flight, so memory stays at one chunk per download.
+    Returns (stored rows, ids that failed). Files skipped because the
+    circuit breaker is open are in neither list, so they keep their attempts.
+    """
+    semaphore = asyncio.Semaphore(concurrency or settings.ATTACHMENT_DOWNLOAD_CONCURRENCY)
+    target = target or store
+    results = await asyncio.gather(
+        *(_download(db, att, semaphore, target) for att in pending), return_exceptions=True,
+    )
+    stored, failed = [], []
+    for att, result in zip(pending, results):
+        if isinstance(result, ZohoUnavailable):
+            continue
+        if isinstance(result, BaseException):
+            logger.warning("Downloading attachment %s of expense %s failed: %s",
+                           att["id"], att["zoho_expense_id"], result)
+            failed.append(att["id"])
+        else:
+            stored.append(result)
+    return stored, failed
+
+def record_downloads(db: Session, stored: list[dict], failed: list[int]):
+    """One UPDATE for the stored files and one for the failures, then commit."""
+    if stored:
+        db.execute(
+            text(
+                "UPDATE attachments a SET content_sha256 = v.sha, size_bytes = v.size, "
+                "mime_type = COALESCE(v.mime, a.mime_type), mirrored_at = now() "
+                "FROM unnest(CAST(:ids AS bigint[]), CAST(:shas AS text[]), "
+                "CAST(:sizes AS bigint[]), CAST(:mimes AS text[])) AS v(id, sha, size, mime) "
+                "WHERE a.id = v.id"
+            ),
+            {
+                "ids": [r["id"] for r in stored],
+                "shas": [r["sha"] for r in stored],
+                "sizes": [r["size"] for r in stored],
+                "mimes": [r["mime"] for r in stored],
+            },
+        )
+    if failed:
+        db.execute(
+            text("UPDATE attachments SET failed_attempts = failed_attempts + 1 WHERE id = ANY(:ids)"),
+            {"ids": failed},
+        )
+    db.commit()
+
+# ---------- Serving ----------
+
+def parse_range(header: Optional[str], size: int) -> Optional[tuple[int, int]]:
+    """
+    (start, end) inclusive for a single "bytes=" range, None to serve the
+    whole file (no header, or several ranges). Raises ValueError when the
+    range cannot be satisfied.
+    """
+    if not header or not header.startswith("bytes=") or "," in header:
+        return None
+    first, _, last = header[len("bytes="):].strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            start, end = max(size - int(last), 0), size - 1  # suffix: the last N bytes
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise ValueError(f"bytes */{size}")
+    return start, min(end, size - 1)
+
+class RangeFileResponse(FileResponse):
+    """
+    FileResponse that answers a single byte range with 206 Partial Content.
+    Ranged reads are deliberately buffered: the range is read in chunk_size
+    pieces through anyio, so memory stays at one chunk. ASGI gives no access
+    to the socket for os.sendfile, and this Starlette has no pathsend support.
+    """
+
+    def __init__(self, path, byte_range: tuple[int, int], stat_result: os.stat_result, **kwargs):
+        start, end = byte_range
+        headers = dict(kwargs.pop("headers", None) or {})
+        headers["content-range"] = f"bytes {start}-{end}/{stat_result.st_size}"
+        headers["content-length"] = str(end - start + 1)
+        super().__init__(path, status_code=206, headers=headers, stat_result=stat_result, **kwargs)
+        self.byte_range = byte_range
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        start, end = self.byte_range
+        if scope["method"].upper() != "HEAD":
+            remaining = end - start + 1
+            async with await anyio.open_file(self.path, mode="rb") as file:
+                await file.seek(start)
+                while remaining > 0:
+                    chunk = await file.read(min(self.chunk_size, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+        if self.background is not None:
+            await self.background()
+
+def stored_stat(path: Path) -> Optional[os.stat_result]:
+    """stat() of a stored file, or None if it is missing from this host's store."""
+    try:
+        st = path.stat()
+    except FileNotFoundError:
+        return None
+    return st if stat.S_ISREG(st.st_mode) else None
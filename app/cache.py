@@ -0,0 +1,146 @@
+# Response cache for report endpoints, invalidated by a data generation counter
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Any, Callable, Optional
+
+from fastapi import Request, Response
+from fastapi.encoders import jsonable_encoder
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+class MemoryBackend:
+    """Process-local TTL + LRU store."""
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[float, dict]] = OrderedDict()
+        self._generation = 0
+        self._changed_at = time.time()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, entry = item
+            if expires < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, entry: dict, ttl: int):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + ttl, entry)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def generation(self) -> tuple[int, float]:
+        return self._generation, self._changed_at
+
+    def bump(self):
+        with self._lock:
+            self._generation += 1
+            self._changed_at = time.time()
+            self._entries.clear()
+
+class RedisBackend:
+    """Shared store so every worker process sees the same generation."""
+
+    PREFIX = "report-cache:"
+
+    def __init__(self, url: str):
+        import redis
+        self._r = redis.Redis.from_url(url)
+
+    def get(self, key: str) -> Optional[dict]:
+        raw = self._r.get(self.PREFIX + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key: str, entry: dict, ttl: int):
+        self._r.set(self.PREFIX + key, json.dumps(entry), ex=ttl)
+
+    def generation(self) -> tuple[int, float]:
+        gen, changed_at = self._r.mget(self.PREFIX + "generation", self.PREFIX + "changed_at")
+        return int(gen or 0), float(changed_at or 0)
+
+    def bump(self):
+        pipe = self._r.pipeline()
+        pipe.incr(self.PREFIX + "generation")
+        pipe.set(self.PREFIX + "changed_at", time.time())
+        pipe.execute()
+
+class ResponseCache:
+    """
+    Caches rendered JSON keyed by route + query params under the current
+    data generation. invalidate() bumps the generation, orphaning every entry.
+    Responses carry ETag / Last-Modified so clients can revalidate with 304s.
+    """
+
+    def __init__(self, backend, ttl: int):
+        self.backend = backend
+        self.ttl = ttl
+
+    def invalidate(self):
+        try:
+            self.backend.bump()
+        except Exception as e:
+            logger.warning("Report cache invalidation failed: %s", e)
+
+    def _key(self, request: Request, generation: int) -> str:
+        query = "&".join(f"{k}={v}" for k, v in sorted(request.query_params.multi_items()))
+        return f"{generation}:{request.url.path}?{query}"
+
+    def respond(self, request: Request, compute: Callable[[], Any]) -> Response:
+        generation, changed_at = self.backend.generation()
+        key = self._key(request, generation)
+        entry = self.backend.get(key)
+        if entry is None:
+            body = json.dumps(jsonable_encoder(compute()), separators=(",", ":"))
+            entry = {
+                "body": body,
+                "etag": '"%s"' % hashlib.sha1(body.encode()).hexdigest()[:20],
+                "last_modified": changed_at,
+            }
+            self.backend.set(key, entry, self.ttl)
+
+        headers = {
+            "ETag": entry["etag"],
+            "Last-Modified": formatdate(entry["last_modified"], usegmt=True),
+            "Cache-Control": "no-cache",
+        }
+        if _not_modified(request, entry):
+            return Response(status_code=304, headers=headers)
+        return Response(content=entry["body"], media_type="application/json", headers=headers)
+
+def _not_modified(request: Request, entry: dict) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+        return entry["etag"] in tags or "*" in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(entry["last_modified"]) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+def _make_backend():
+    if settings.REDIS_URL:
+        try:
+            return RedisBackend(settings.REDIS_URL)
+        except ImportError:
+            logger.warning("REDIS_URL is set but redis is not installed; using in-process report cache")
+    return MemoryBackend(settings.REPORT_CACHE_MAX_ENTRIES)
+
+report_cache = ResponseCache(_make_backend(), settings.REPORT_CACHE_TTL_SECONDS)
@@ -12,10 +12,67 @@ class Settings(BaseSettings):
     ZOHO_ACCOUNTS_BASE: str = "https://accounts.zoho.com"
     ZOHO_SCOPES: str = "ZohoExpense.expenses.READ,ZohoExpense.reports.READ,ZohoExpense.files.READ"
 
+    # Shared Zoho HTTP client (HTTP/2 is used only when the h2 package is installed)
+    ZOHO_HTTP_TIMEOUT: float = 30.0
+    ZOHO_HTTP2: bool = True
+    ZOHO_MAX_CONNECTIONS: int = 10
+    ZOHO_MAX_KEEPALIVE_CONNECTIONS: int = 5
+    ZOHO_KEEPALIVE_EXPIRY: float = 60.0
+
+    # Zoho request pacing and resilience (app.zoho._request)
+    ZOHO_RATE_LIMIT_PER_MINUTE: int = 100  # sustained request budget shared by all callers
+    ZOHO_RATE_LIMIT_BURST: int = 10
+    ZOHO_MAX_RETRIES: int = 5  # for 429 / 5xx / transport errors
+    ZOHO_BACKOFF_BASE_SECONDS: float = 1.0
+    ZOHO_BACKOFF_MAX_SECONDS: float = 60.0
+    ZOHO_CIRCUIT_FAILURE_THRESHOLD: int = 3  # consecutive requests failed after all retries before failing fast
+    ZOHO_CIRCUIT_RESET_SECONDS: float = 60.0
+
+    # Currency of amount_home; rows without a Zoho-supplied amount_home are
+    # converted with fx_rates (loaded by `python -m app.fx rates.csv`)
+    HOME_CURRENCY: str = "USD"
+
     ENCRYPTION_KEY: str = ""
     SYNC_INTERVAL_MINUTES: int = 15
+    SYNC_BATCH_SIZE: int = 200  # expenses per multi-row upsert / commit
+    SYNC_FETCH_CONCURRENCY: int = 3  # Zoho page requests in flight during sync
+    SYNC_PREFETCH_PAGES: int = 4  # fetched pages buffered ahead of the DB writer
+    SYNC_RESUME_OVERLAP_SECONDS: int = 300  # a resumed pass re-reads changes this far before its last commit
+    LOOKUP_CACHE_SIZE: int = 10000  # vendor/category name -> id entries kept per sync
     ADMIN_TOKEN: str = "dev_admin_token"
 
+    # Zoho webhooks (/webhooks/zoho). When a secret is set, changed records are
+    # synced on push and the full poll only runs as a safety net.
+    ZOHO_WEBHOOK_SECRET: str = ""
+    SYNC_SAFETY_NET_INTERVAL_MINUTES: int = 360
+    WEBHOOK_DRAIN_BATCH_SIZE: int = 100  # changed record ids fetched per drain pass
+
+    # Company statement uploads (/recon/upload) are streamed into recon_staged_rows
+    RECON_UPLOAD_CHUNK_BYTES: int = 64 * 1024
+    RECON_STAGE_BATCH_SIZE: int = 5000  # rows per COPY
+    RECON_MAX_ERRORS: int = 50  # row errors returned in the response
+
+    # Receipt mirroring (app.attachments): files are kept under ATTACHMENT_DIR
+    # by SHA-256 and served from /expenses/{id}/attachments/{aid}
+    ATTACHMENT_MIRROR_ENABLED: bool = True
+    ATTACHMENT_DIR: str = "data/attachments"
+    ATTACHMENT_DOWNLOAD_CONCURRENCY: int = 4  # receipt downloads in flight
+    ATTACHMENT_CHUNK_BYTES: int = 64 * 1024
+    ATTACHMENT_MIRROR_BATCH: int = 200  # pending files downloaded per sync
+    ATTACHMENT_MAX_ATTEMPTS: int = 5  # failed downloads before a file is skipped
+
+    # Per-request SQL profiling (app.profiling). Statement counts are always
+    # checked against the route budgets; shapes and Server-Timing headers are
+    # added when QUERY_PROFILING is on or the request sends X-Query-Profile: 1
+    QUERY_PROFILING: bool = False
+    QUERY_BUDGET_DEFAULT: int = 20  # statements per request for routes without their own budget
+    QUERY_REPEAT_THRESHOLD: int = 5  # identical statements in one request flagged as a likely N+1
+
+    # Report response cache (in-process unless REDIS_URL is set and redis is installed)
+    REPORT_CACHE_TTL_SECONDS: int = 300
+    REPORT_CACHE_MAX_ENTRIES: int = 256
+    REDIS_URL: str = ""
+
     class Config:
         env_file = ".env"
 
@@ -0,0 +1,129 @@
+# Streaming expense export (CSV / NDJSON / Parquet) in constant memory
+import csv
+import io
+import json
+from datetime import date
+from decimal import Decimal
+from typing import Iterable, Iterator, Sequence
+
+from sqlalchemy import select
+
+from app.db import SessionLocal
+from app.models import Expense
+
+EXPORT_BATCH_SIZE = 1000
+
+EXPORT_COLUMNS = (
+    "id", "zoho_expense_id", "report_id", "txn_date", "merchant", "vendor_id",
+    "category_id", "description", "amount", "currency", "exchange_rate",
+    "amount_home", "payment_mode", "reimbursable", "company_report_status",
+    "reimbursement_status", "reimbursed_amount", "reimbursed_date",
+    "external_ref", "kirkland_te_report",
+)
+
+MEDIA_TYPES = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+def export_batches(filters) -> Iterator[Sequence[tuple]]:
+    """
+    Yield filtered expense rows in batches from a server-side cursor.
+    Opens its own session: the request-scoped one is closed before a
+    StreamingResponse body starts.
+    """
+    db = SessionLocal()
+    try:
+        stmt = filters.apply(select(*(getattr(Expense, c) for c in EXPORT_COLUMNS)))
+        stmt = stmt.order_by(Expense.txn_date, Expense.id).execution_options(yield_per=EXPORT_BATCH_SIZE)
+        for batch in db.execute(stmt).partitions():
+            yield batch
+    finally:
+        db.close()
+
+def to_csv(batches: Iterable[Sequence[tuple]]) -> Iterator[str]:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(EXPORT_COLUMNS)
+    for batch in batches:
+        writer.writerows(batch)
+        yield buf.getvalue()
+        buf.seek(0)
+        buf.truncate(0)
+    if buf.tell():
+        yield buf.getvalue()
+
+def _json_value(v):
+    if isinstance(v, Decimal):
+        return float(v)
+    if isinstance(v, date):
+        return v.isoformat()
+    return v
+
+def to_ndjson(batches: Iterable[Sequence[tuple]]) -> Iterator[str]:
+    for batch in batches:
+        yield "".join(
+            json.dumps({c: _json_value(v) for c, v in zip(EXPORT_COLUMNS, row)}) + "\n"
+            for row in batch
+        )
+
+class _ChunkSink:
+    """Write-only file object that hands written bytes back chunk by chunk."""
+
+    closed = False
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        # Parquet footers record absolute offsets, so report bytes written so far
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+def parquet_schema():
+    import pyarrow as pa
+    money = pa.decimal128(18, 2)
+    return pa.schema([
+        ("id", pa.int64()), ("zoho_expense_id", pa.string()), ("report_id", pa.int64()),
+        ("txn_date", pa.date32()), ("merchant", pa.string()), ("vendor_id", pa.int64()),
+        ("category_id", pa.int64()), ("description", pa.string()), ("amount", money),
+        ("currency", pa.string()), ("exchange_rate", pa.decimal128(18, 6)),
+        ("amount_home", money), ("payment_mode", pa.string()), ("reimbursable", pa.bool_()),
+        ("company_report_status", pa.string()), ("reimbursement_status", pa.string()),
+        ("reimbursed_amount", money), ("reimbursed_date", pa.date32()),
+        ("external_ref", pa.string()), ("kirkland_te_report", pa.string()),
+    ])
+
+def to_parquet(batches: Iterable[Sequence[tuple]]) -> Iterator[bytes]:
+    """One Parquet row group per DB batch; requires pyarrow."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = parquet_schema()
+    sink = _ChunkSink()
+    with pq.ParquetWriter(sink, schema) as writer:
+        for batch in batches:
+            columns = list(zip(*batch)) or [[] for _ in EXPORT_COLUMNS]
+            writer.write_batch(pa.record_batch(
+                [pa.array(col, type=field.type) for col, field in zip(columns, schema)],
+                schema=schema,
+            ))
+            yield sink.drain()
+    yield sink.drain()
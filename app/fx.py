@@ -0,0 +1,226 @@
+# FX rates: the fx_rates table, a CSV loader and the in-memory as-of cache used by sync
+import argparse
+import csv
+import io
+import logging
+from bisect import bisect_right
+from datetime import date
+from decimal import Decimal, InvalidOperation
+from typing import IO, Iterator, Optional
+
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import FxRate
+
+logger = logging.getLogger(__name__)
+
+CSV_COLUMNS = ("date", "base_currency", "quote_currency", "rate")
+LOAD_BATCH = 5000
+CENT = Decimal("0.01")
+
+class FxCsvError(ValueError):
+    """The rate file is missing columns or has an unparseable row."""
+
+def _as_date(value) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+class FxRates:
+    """
+    Date-indexed rates into the home currency. Each currency keeps parallel
+    sorted lists of dates and rates, so a lookup is one bisect: the rate in
+    effect on a day is the latest one published on or before it.
+    """
+
+    def __init__(self, home: Optional[str] = None):
+        self.home = (home or settings.HOME_CURRENCY).upper()
+        self._dates: dict[str, list[date]] = {}
+        self._rates: dict[str, list[Decimal]] = {}
+
+    def __len__(self) -> int:
+        return sum(len(d) for d in self._dates.values())
+
+    def add(self, currency: str, on: date, rate: Decimal):
+        """Insert (or replace) the rate currency -> home for one day, keeping order."""
+        dates = self._dates.setdefault(currency.upper(), [])
+        rates = self._rates.setdefault(currency.upper(), [])
+        i = bisect_right(dates, on)
+        if i and dates[i - 1] == on:
+            rates[i - 1] = rate
+        else:
+            dates.insert(i, on)
+            rates.insert(i, rate)
+
+    @classmethod
+    def load(cls, db: Session, home: Optional[str] = None) -> "FxRates":
+        """One query for every rate that converts into (or out of) the home currency."""
+        rates = cls(home)
+        rows = db.execute(
+            text(
+                "SELECT rate_date, base_currency, quote_currency, rate FROM fx_rates "
+                "WHERE quote_currency = :home OR base_currency = :home "
+                "ORDER BY rate_date"
+            ),
+            {"home": rates.home},
+        )
+        direct = set()
+        inverse = []
+        for on, base, quote, rate in rows:
+            if quote == rates.home:
+                rates.add(base, on, Decimal(rate))
+                direct.add((base, on))
+            elif rate:
+                inverse.append((quote, on, Decimal(1) / Decimal(rate)))
+        # A home -> X rate only fills days with no X -> home rate
+        for currency, on, rate in inverse:
+            if (currency, on) not in direct:
+                rates.add(currency, on, rate)
+        return rates
+
+    def rate(self, currency: Optional[str], on) -> Optional[Decimal]:
+        """Rate currency -> home as of `on`, or None when no rate is known yet."""
+        if not currency:
+            return None
+        currency = currency.upper()
+        if currency == self.home:
+            return Decimal(1)
+        day = _as_date(on)
+        dates = self._dates.get(currency)
+        if day is None or not dates:
+            return None
+        i = bisect_right(dates, day)
+        return self._rates[currency][i - 1] if i else None
+
+    def convert(self, amount, currency: Optional[str], on) -> Optional[Decimal]:
+        """`amount` in the home currency, rounded to cents; None if it can't be converted."""
+        if amount is None:
+            return None
+        rate = self.rate(currency, on)
+        if rate is None:
+            return None
+        try:
+            return (Decimal(str(amount)) * rate).quantize(CENT)
+        except InvalidOperation:
+            return None
+
+# ---------- CSV loading ----------
+
+def parse_rates_csv(fileobj: IO[str]) -> Iterator[dict]:
+    """Rows of date,base_currency,quote_currency,rate (extra columns are ignored)."""
+    reader = csv.DictReader(fileobj)
+    missing = [c for c in CSV_COLUMNS if c not in (reader.fieldnames or [])]
+    if missing:
+        raise FxCsvError(f"Missing columns: {', '.join(missing)}")
+    for line, row in enumerate(reader, start=2):
+        on = _as_date((row["date"] or "").strip())
+        base = (row["base_currency"] or "").strip().upper()
+        quote = (row["quote_currency"] or "").strip().upper()
+        try:
+            rate = Decimal((row["rate"] or "").strip())
+        except InvalidOperation:
+            rate = None
+        if on is None or not base or not quote or rate is None or rate <= 0:
+            raise FxCsvError(f"Line {line}: invalid rate row {dict(row)}")
+        yield {"rate_date": on, "base_currency": base, "quote_currency": quote, "rate": rate}
+
+def _upsert_rates(db: Session, rows: list[dict]):
+    stmt = insert(FxRate).values(rows)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["base_currency", "quote_currency", "rate_date"],
+        set_={"rate": stmt.excluded.rate},
+    ))
+
+def load_rates_csv(db: Session, fileobj: IO[str], batch_size: int = LOAD_BATCH) -> int:
+    """Upsert every row of a rate file in multi-row batches; commits once at the end."""
+    total = 0
+    batch: dict[tuple, dict] = {}
+    try:
+        for row in parse_rates_csv(fileobj):
+            # Keyed: one statement cannot upsert the same rate twice
+            batch[(row["base_currency"], row["quote_currency"], row["rate_date"])] = row
+            if len(batch) >= batch_size:
+                _upsert_rates(db, list(batch.values()))
+                total += len(batch)
+                batch.clear()
+        if batch:
+            _upsert_rates(db, list(batch.values()))
+            total += len(batch)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    return total
+
+# ---------- Home-amount backfill ----------
+
+# Same-currency rows take their amount; the rest the latest direct rate on or
+# before txn_date, else the inverse of a home -> currency rate
+BACKFILL_SQL = """
+WITH conv AS (
+  SELECT e.id, ROUND(e.amount * r.rate, 2) AS amount_home
+  FROM expenses e
+  CROSS JOIN LATERAL (
+    SELECT rate FROM (
+      SELECT 1::numeric AS rate, e.txn_date AS rate_date, 0 AS pref
+      WHERE upper(e.currency) = :home
+      UNION ALL
+      SELECT rate, rate_date, 1 FROM fx_rates
+      WHERE base_currency = upper(e.currency) AND quote_currency = :home AND rate_date <= e.txn_date
+      UNION ALL
+      SELECT 1 / rate, rate_date, 2 FROM fx_rates
+      WHERE base_currency = :home AND quote_currency = upper(e.currency) AND rate_date <= e.txn_date
+    ) candidates
+    ORDER BY rate_date DESC, pref
+    LIMIT 1
+  ) r
+  WHERE e.amount_home IS NULL
+)
+UPDATE expenses SET amount_home = conv.amount_home
+FROM conv WHERE expenses.id = conv.id
+RETURNING expenses.txn_date
+"""
+
+def backfill_amount_home(db: Session, home: Optional[str] = None) -> list[date]:
+    """
+    Fill amount_home for every row still missing it, in one set-based UPDATE.
+    Returns the txn_date of each filled row (for the daily rollup).
+    """
+    days = db.execute(text(BACKFILL_SQL), {"home": (home or settings.HOME_CURRENCY).upper()}).scalars().all()
+    db.commit()
+    return days
+
+def main(argv: Optional[list[str]] = None):
+    """python -m app.fx rates.csv [...]: load rate files, then backfill amount_home."""
+    from app.aggregates import try_refresh_aggregates
+    from app.cache import report_cache
+    from app.db import SessionLocal
+
+    parser = argparse.ArgumentParser(description="Load FX rate CSV files into fx_rates")
+    parser.add_argument("files", nargs="+", help="CSV with columns " + ",".join(CSV_COLUMNS))
+    parser.add_argument("--no-backfill", action="store_true", help="skip filling amount_home")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    db = SessionLocal()
+    try:
+        for path in args.files:
+            with io.open(path, newline="", encoding="utf-8-sig") as f:
+                logger.info("Loaded %d rates from %s", load_rates_csv(db, f), path)
+        if not args.no_backfill:
+            days = backfill_amount_home(db)
+            logger.info("Filled amount_home on %d expenses", len(days))
+            if days:
+                try_refresh_aggregates(db, days)
+                report_cache.invalidate()
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# In-process sync job queue with progress reporting
+import logging
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Callable, Iterable, Optional
+
+from app.config import settings
+from app.sync import SyncProgress, run_change_job
+from app.worker import SyncWorker, sync_worker
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ("queued", "running")
+
+class SyncJob:
+    def __init__(self):
+        self.id = uuid.uuid4().hex
+        self.status = "queued"
+        self.created_at = datetime.now(timezone.utc)
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+        self.progress = SyncProgress()
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "created_at": self.created_at.isoformat(),
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "progress": self.progress.snapshot(),
+            "result": self.result,
+            "error": self.error,
+        }
+
+class SyncJobQueue:
+    """
+    Runs sync jobs on the sync worker thread. At most one job is queued or
+    running per process; enqueueing while one is active returns that job.
+    Cross-process dedup is left to the advisory lock (see app.sync.LOCK_KEY).
+    """
+
+    def __init__(self, worker: SyncWorker, history: int = 50):
+        self._worker = worker
+        self._history = history
+        self._jobs: OrderedDict[str, SyncJob] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, job_id: str) -> Optional[SyncJob]:
+        return self._jobs.get(job_id)
+
+    def active(self) -> Optional[SyncJob]:
+        with self._lock:
+            return self._active()
+
+    def _active(self) -> Optional[SyncJob]:
+        for job in reversed(self._jobs.values()):
+            if job.status in ACTIVE_STATUSES:
+                return job
+        return None
+
+    def enqueue(self, run: Callable[[SyncProgress], Any]) -> tuple[SyncJob, bool]:
+        """Queue `run(progress)`; returns (job, created)."""
+        with self._lock:
+            job = self._active()
+            if job is not None:
+                return job, False
+            job = SyncJob()
+            self._jobs[job.id] = job
+            while len(self._jobs) > self._history:
+                self._jobs.popitem(last=False)
+        self._worker.submit(self._execute, job, run)
+        return job, True
+
+    def _execute(self, job: SyncJob, run: Callable[[SyncProgress], Any]):
+        job.status = "running"
+        job.started_at = datetime.now(timezone.utc)
+        try:
+            job.result = run(job.progress)
+            status = (job.result or {}).get("status") if isinstance(job.result, dict) else None
+            job.status = status if status in ("error", "skipped") else "success"
+            if status == "error":
+                job.error = job.result.get("message")
+        except Exception as e:
+            logger.exception("Sync job %s failed", job.id)
+            job.status = "error"
+            job.error = str(e)
+        finally:
+            job.finished_at = datetime.now(timezone.utc)
+
+class ChangeQueue:
+    """
+    Deduplicating set of changed Zoho record ids (from webhooks), drained on
+    the sync worker thread in batches of up to `batch_size` ids. Ids that
+    arrive while a drain is running are picked up by the same drain; an id
+    queued several times before it is fetched is fetched once.
+    """
+
+    KINDS = ("expense", "report")
+
+    def __init__(self, worker: SyncWorker, apply: Callable[[list[str], list[str]], Any],
+                 batch_size: int = 100):
+        self._worker = worker
+        self._apply = apply
+        self._batch_size = batch_size
+        # dicts as ordered sets: oldest change first
+        self._pending: dict[str, dict[str, None]] = {kind: {} for kind in self.KINDS}
+        self._draining = False
+        self._lock = threading.Lock()
+        self.last_error: Optional[str] = None
+
+    def pending(self) -> dict[str, int]:
+        with self._lock:
+            return {kind: len(ids) for kind, ids in self._pending.items()}
+
+    def add(self, changes: dict[str, Iterable[str]]) -> dict[str, int]:
+        """Queue ids per kind; returns how many were not already pending."""
+        added = {}
+        with self._lock:
+            for kind in self.KINDS:
+                pending = self._pending[kind]
+                before = len(pending)
+                pending.update(dict.fromkeys(str(i) for i in changes.get(kind, ())))
+                added[kind] = len(pending) - before
+            start = not self._draining and any(self._pending.values())
+            if start:
+                self._draining = True
+        if start:
+            self._worker.submit(self._drain)
+        return added
+
+    def _take(self) -> tuple[list[str], list[str]]:
+        taken = {}
+        budget = self._batch_size
+        for kind in ("report", "expense"):  # reports first, so new expenses can link to them
+            ids = list(self._pending[kind])[:budget]
+            for i in ids:
+                del self._pending[kind][i]
+            taken[kind] = ids
+            budget -= len(ids)
+        return taken["expense"], taken["report"]
+
+    def _drain(self):
+        while True:
+            with self._lock:
+                expense_ids, report_ids = self._take()
+                if not expense_ids and not report_ids:
+                    self._draining = False
+                    return
+            try:
+                self._apply(expense_ids, report_ids)
+                self.last_error = None
+            except Exception as e:
+                logger.exception("Applying %d expense / %d report changes failed",
+                                 len(expense_ids), len(report_ids))
+                self.last_error = str(e)
+                # Keep the ids for the next webhook-triggered drain; the
+                # safety-net poll covers them if none arrives
+                with self._lock:
+                    self._pending["expense"].update(dict.fromkeys(expense_ids))
+                    self._pending["report"].update(dict.fromkeys(report_ids))
+                    self._draining = False
+                return
+
+sync_jobs = SyncJobQueue(sync_worker)
+change_queue = ChangeQueue(sync_worker, run_change_job, settings.WEBHOOK_DRAIN_BATCH_SIZE)
@@ -0,0 +1,89 @@
+# Name -> id caches for the vendor/category lookup tables used during sync
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+from sqlalchemy import select, text
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.postgresql import insert
+
+from app.config import settings
+from app.models import Vendor, Category
+
+class NameIdCache:
+    """
+    Bounded LRU cache of name -> id for a table with a unique `name` column.
+    Unseen names are resolved in bulk: one INSERT ... ON CONFLICT DO NOTHING
+    RETURNING for new names plus one SELECT ... = ANY(:names) for the rest.
+    """
+
+    def __init__(self, model, maxsize: int):
+        self.model = model
+        self.maxsize = maxsize
+        self._ids: OrderedDict[str, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def get(self, name: str) -> Optional[int]:
+        vid = self._ids.get(name)
+        if vid is not None:
+            self._ids.move_to_end(name)
+        return vid
+
+    def put(self, name: str, vid: int):
+        self._ids[name] = vid
+        self._ids.move_to_end(name)
+        while len(self._ids) > self.maxsize:
+            self._ids.popitem(last=False)
+
+    def preload(self, db: Session):
+        rows = db.execute(select(self.model.name, self.model.id).limit(self.maxsize))
+        for name, vid in rows:
+            if name:
+                self.put(name, vid)
+
+    def resolve(self, db: Session, names: Iterable[Optional[str]]) -> dict[str, int]:
+        found: dict[str, int] = {}
+        missing: list[str] = []
+        for name in sorted({n for n in names if n}):  # sorted: stable lock order
+            vid = self.get(name)
+            if vid is None:
+                missing.append(name)
+            else:
+                found[name] = vid
+        if not missing:
+            return found
+
+        stmt = (
+            insert(self.model)
+            .values([{"name": n} for n in missing])
+            .on_conflict_do_nothing(index_elements=["name"])
+            .returning(self.model.name, self.model.id)
+        )
+        fetched = dict(db.execute(stmt).all())
+        rest = [n for n in missing if n not in fetched]
+        if rest:
+            # Already exists — fetch ids
+            fetched.update(db.execute(
+                text(f"SELECT name, id FROM {self.model.__tablename__} WHERE name = ANY(:names)"),
+                {"names": rest},
+            ).all())
+        # Commit now so cached ids never outlive a rolled-back expense batch
+        db.commit()
+
+        for name, vid in fetched.items():
+            self.put(name, vid)
+        found.update(fetched)
+        return found
+
+class SyncLookups:
+    """Vendor and category caches shared by every page of one sync run."""
+
+    def __init__(self, maxsize: Optional[int] = None):
+        maxsize = maxsize or settings.LOOKUP_CACHE_SIZE
+        self.vendors = NameIdCache(Vendor, maxsize)
+        self.categories = NameIdCache(Category, maxsize)
+
+    def preload(self, db: Session):
+        self.vendors.preload(db)
+        self.categories.preload(db)
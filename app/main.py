@@ -1,18 +1,25 @@
-from fastapi import FastAPI, Response
+from fastapi import FastAPI, Request, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import JSONResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 from apscheduler.schedulers.asyncio import AsyncIOScheduler
 from sqlalchemy.orm import Session
 from app.config import settings
-from app.db import get_db, SessionLocal
-from app.sync import run_sync
+from app import metrics, profiling
+from app.db import engine, get_db, SessionLocal
+from app.sync import run_sync_job, close_thread_loop
+from app.jobs import sync_jobs
+from app.worker import sync_worker
+from app.zoho import open_client, close_client, telemetry as zoho_telemetry
 from app.oauth import router as oauth_router
 from app.routers.reports import router as reports_router
 from app.routers.expenses import router as expenses_router
 from app.routers.recon import router as recon_router
+from app.routers.webhooks import router as webhooks_router
 
 app = FastAPI(title="T&E Master Ledger")
 
@@ -34,49 +41,88 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "Server-Timing"],
 )
 
-@app.get("/health")
-@limiter.limit("60/minute")
-async def health(request, response: Response):
-    # Add HSTS header for production HTTPS
-    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+# Prometheus instrumentation (GET /metrics). The last middleware added runs
+# first: profiling reads the per-request stats the metrics middleware opens.
+metrics.instrument_engine(engine)
+metrics.instrument_sessions(SessionLocal)
+app.add_middleware(profiling.QueryProfilingMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
 
-    # Get last sync status from database
+def _sync_status() -> dict:
+    # Blocking DB read; called via the threadpool so it never stalls the event loop
     db = SessionLocal()
     try:
         from app.models import SyncState
-        sync_status = db.query(SyncState).filter(SyncState.provider == "zoho").first()
-        sync_info = {
+        sync_status = (
+            db.query(SyncState)
+            .filter(SyncState.provider == "zoho_expense")
+            .order_by(SyncState.id.desc())
+            .first()
+        )
+        return {
             "last_run": sync_status.last_run_at.isoformat() if sync_status and sync_status.last_run_at else None,
             "status": sync_status.status if sync_status else "Never run",
             "cursor": sync_status.cursor if sync_status else None,
         }
     except Exception:
-        sync_info = {"status": "Database not available"}
+        return {"status": "Database not available"}
     finally:
         db.close()
 
+@app.get("/health")
+@limiter.limit("60/minute")
+async def health(request: Request, response: Response):
+    # Add HSTS header for production HTTPS
+    response.headers["Strict-Transport-Security"] = "max-age=31536000; includeSubDomains"
+
+    # Get last sync status from database
+    sync_info = await run_in_threadpool(_sync_status)
+
     return {
         "ok": True,
         "sync": sync_info,
+        "zoho": zoho_telemetry.snapshot(),
         "service": "T&E Master Ledger"
     }
 
+@app.get("/metrics", include_in_schema=False)
+def prometheus_metrics():
+    return Response(generate_latest(metrics.registry), media_type=CONTENT_TYPE_LATEST)
+
 # Routers
 app.include_router(oauth_router)
 app.include_router(reports_router)
 app.include_router(expenses_router)
 app.include_router(recon_router)
+app.include_router(webhooks_router)
 
 # Background scheduler for sync
 scheduler = AsyncIOScheduler()
 
+async def scheduled_sync():
+    # Queued onto the dedicated worker thread; shares dedup and progress with manual runs
+    sync_jobs.enqueue(run_sync_job)
+
 @app.on_event("startup")
 async def startup_event():
-    scheduler.add_job(lambda: run_sync(SessionLocal()), "interval", minutes=settings.SYNC_INTERVAL_MINUTES)
+    await open_client()
+    sync_worker.start()
+    # With webhooks pushing changes, the full poll is only a safety net
+    interval = (
+        settings.SYNC_SAFETY_NET_INTERVAL_MINUTES if settings.ZOHO_WEBHOOK_SECRET
+        else settings.SYNC_INTERVAL_MINUTES
+    )
+    scheduler.add_job(
+        scheduled_sync, "interval", minutes=interval,
+        max_instances=1, coalesce=True,
+    )
     scheduler.start()
 
 @app.on_event("shutdown")
 async def shutdown_event():
     scheduler.shutdown(wait=False)
+    sync_worker.shutdown(cleanup=close_thread_loop)
+    await close_client()
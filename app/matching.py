@@ -0,0 +1,109 @@
+# Batch reconciliation matcher: scores every company row against every candidate at once
+import re
+import zlib
+from datetime import date
+from typing import Optional, Sequence
+
+import numpy as np
+
+TRIGRAM_DIMS = 1024  # hashed trigram space for merchant vectors
+
+# Card-processor / wallet prefixes that precede the real merchant name
+PROCESSOR_PREFIX = re.compile(
+    r"^(sq|tst|sp|pp|paypal|iz|izettle|zettle|sumup|google|gpay|apple pay|pos|debit|purchase|ckcd|chk)\s*\*\s*"
+)
+STORE_NUMBER = re.compile(r"#\s*\d+|\b\d{3,}\b|\bstore\s+\d+\b")
+# Only trailing ones ("Acme Co Ltd"), so "Co Op Cafe" keeps its "co"
+_SUFFIXES = r"(?:inc|llc|ltd|limited|bv|b v|gmbh|sa|sas|plc|corp|co|company|pty|ag|nv)"
+CORPORATE_SUFFIX = re.compile(rf"\b{_SUFFIXES}(?:\s+{_SUFFIXES})*\s*$")
+NON_ALNUM = re.compile(r"[^a-z0-9]+")
+
+def normalize_merchant(name: Optional[str]) -> str:
+    """
+    Canonical merchant key: lowercase, card-processor prefix removed, text
+    after the first '*' (transaction descriptors) dropped, store numbers and
+    corporate suffixes stripped. "SQ *BLUE BOTTLE #123" -> "blue bottle",
+    "UBER *TRIP" and "Uber BV" -> "uber".
+    """
+    if not name:
+        return ""
+    s = name.lower().strip()
+    s = PROCESSOR_PREFIX.sub("", s)
+    s = s.split("*", 1)[0]
+    s = STORE_NUMBER.sub(" ", s)
+    s = NON_ALNUM.sub(" ", s)
+    s = CORPORATE_SUFFIX.sub(" ", s)
+    return " ".join(s.split())
+
+def trigram_matrix(names: Sequence[str], dims: int = TRIGRAM_DIMS) -> np.ndarray:
+    """L2-normalised hashed character-trigram counts, one row per name."""
+    m = np.zeros((len(names), dims), dtype=np.float32)
+    for i, name in enumerate(names):
+        if not name:
+            continue
+        padded = f"  {name} "
+        for k in range(len(padded) - 2):
+            m[i, zlib.crc32(padded[k:k + 3].encode()) % dims] += 1.0
+    norms = np.linalg.norm(m, axis=1, keepdims=True)
+    np.divide(m, norms, out=m, where=norms > 0)
+    return m
+
+def _day_numbers(dates: Sequence[date]) -> np.ndarray:
+    return np.array(dates, dtype="datetime64[D]").astype(np.int64)
+
+def match(
+    rows: Sequence[dict],
+    candidates: Sequence[dict],
+    amount_tolerance: float = 0.05,
+    date_window_days: int = 7,
+    min_score: float = 0.5,
+    weights: tuple[float, float, float] = (0.5, 0.2, 0.3),
+) -> list[dict]:
+    """
+    One-to-one assignment of company rows ({date, merchant, amount}) to
+    candidate expenses ({id, txn_date, merchant, amount}).
+
+    Amount, date and merchant scores are computed for the whole
+    rows x candidates grid with NumPy. Pairs outside the amount tolerance or
+    date window are infeasible; the remaining sparse pairs are assigned
+    greedily by descending score. Returns one proposal per matched row.
+    """
+    if not rows or not candidates:
+        return []
+
+    row_amounts = np.array([r["amount"] for r in rows], dtype=np.float64)[:, None]
+    cand_amounts = np.array([float(c["amount"]) for c in candidates], dtype=np.float64)[None, :]
+    rel_diff = np.abs(row_amounts - cand_amounts) / np.maximum(np.abs(row_amounts), 0.01)
+    amount_score = 1.0 - rel_diff / amount_tolerance if amount_tolerance > 0 else (rel_diff == 0).astype(float)
+
+    day_diff = np.abs(_day_numbers([r["date"] for r in rows])[:, None]
+                      - _day_numbers([c["txn_date"] for c in candidates])[None, :])
+    date_score = 1.0 - day_diff / (date_window_days + 1)
+
+    merchant_score = trigram_matrix([normalize_merchant(r["merchant"]) for r in rows]) @ \
+        trigram_matrix([normalize_merchant(c["merchant"]) for c in candidates]).T
+
+    w_amount, w_date, w_merchant = weights
+    score = w_amount * amount_score + w_date * date_score + w_merchant * merchant_score
+    feasible = (rel_diff <= amount_tolerance) & (day_diff <= date_window_days) & (score >= min_score)
+
+    ri, ci = np.nonzero(feasible)
+    order = np.argsort(-score[ri, ci], kind="stable")
+    used_rows, used_cands = set(), set()
+    proposals = []
+    for k in order:
+        i, j = int(ri[k]), int(ci[k])
+        if i in used_rows or j in used_cands:
+            continue
+        used_rows.add(i)
+        used_cands.add(j)
+        proposals.append({
+            "row_index": i,
+            "expense_id": candidates[j]["id"],
+            "score": round(float(score[i, j]), 4),
+            "amount_score": round(float(amount_score[i, j]), 4),
+            "date_score": round(float(date_score[i, j]), 4),
+            "merchant_score": round(float(merchant_score[i, j]), 4),
+        })
+    proposals.sort(key=lambda p: p["row_index"])
+    return proposals
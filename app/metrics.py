@@ -0,0 +1,244 @@
+# Prometheus instrumentation: per-route HTTP latency, SQL statement timing, sync and Zoho counters
+import time
+from collections import Counter as CounterType
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator, Optional
+
+from prometheus_client import CollectorRegistry, Counter, Histogram, ProcessCollector
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily, HistogramMetricFamily
+from sqlalchemy import event
+
+from app import zoho
+
+registry = CollectorRegistry()
+ProcessCollector(registry=registry)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0, 5.0)
+OPERATIONS = {"SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "REFRESH", "COPY", "CREATE", "DROP", "ALTER"}
+UNMATCHED_ROUTE = "unmatched"  # 404s etc., so arbitrary paths can't blow up label cardinality
+
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "HTTP requests by route template and status",
+    ["method", "route", "status"], registry=registry,
+)
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "HTTP request latency by route template",
+    ["method", "route"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+HTTP_STATEMENTS = Histogram(
+    "http_request_db_statements", "SQL statements executed per HTTP request",
+    ["route"], buckets=(0, 1, 2, 3, 5, 10, 20, 50, 100), registry=registry,
+)
+DB_STATEMENTS = Histogram(
+    "db_statement_duration_seconds", "SQL statement execution time",
+    ["scope", "operation"], buckets=STATEMENT_BUCKETS, registry=registry,
+)
+DB_COMMITS = Histogram(
+    "db_commit_duration_seconds", "Session flush + COMMIT time",
+    ["scope"], buckets=STATEMENT_BUCKETS, registry=registry,
+)
+SYNC_RUNS = Counter("sync_runs_total", "Completed sync runs by status", ["status"], registry=registry)
+SYNC_DURATION = Histogram(
+    "sync_duration_seconds", "Wall time of full sync runs",
+    buckets=(1, 5, 15, 30, 60, 120, 300, 600, 1800), registry=registry,
+)
+SYNC_PAGES = Counter("sync_pages_total", "Zoho pages fetched by the sync", ["resource"], registry=registry)
+SYNC_PAGE_FETCH = Histogram(
+    "sync_page_fetch_seconds", "Time to fetch one Zoho page (incl. pacing and retries)",
+    ["resource"], buckets=LATENCY_BUCKETS, registry=registry,
+)
+SYNC_ROWS = Counter("sync_rows_total", "Synced rows by outcome", ["resource", "outcome"], registry=registry)
+
+# ---------- Per-request statement accounting ----------
+
+class StatementStats:
+    """
+    SQL statements and DB time attributed to one request (or other scope).
+    `shapes` counts each distinct statement text when profiling turns it on
+    (see app.profiling); bound parameters keep the text the same across values.
+    """
+
+    def __init__(self, scope: str = "http"):
+        self.scope = scope
+        self.statements = 0
+        self.db_seconds = 0.0
+        self.shapes: Optional[CounterType[str]] = None
+
+    def record(self, statement: str, seconds: float):
+        self.statements += 1
+        self.db_seconds += seconds
+        if self.shapes is not None:
+            self.shapes[statement] += 1
+
+_current: ContextVar[Optional[StatementStats]] = ContextVar("statement_stats", default=None)
+
+@contextmanager
+def statement_stats(scope: str = "http") -> Iterator[StatementStats]:
+    """
+    Attribute statements run in this context (including threadpool calls it
+    makes, which copy the context) to a fresh StatementStats.
+    """
+    stats = StatementStats(scope)
+    token = _current.set(stats)
+    try:
+        yield stats
+    finally:
+        _current.reset(token)
+
+def current_stats() -> Optional[StatementStats]:
+    return _current.get()
+
+def _operation(statement: str) -> str:
+    head = statement.lstrip()[:10].split(None, 1)
+    op = head[0].upper() if head else ""
+    return op if op in OPERATIONS else "OTHER"
+
+# Label children are looked up once per combination, not per observation
+_statement_children: dict[tuple[str, str], Histogram] = {}
+_commit_children: dict[str, Histogram] = {}
+
+def _observe_statement(statement: str, seconds: float):
+    stats = _current.get()
+    scope = stats.scope if stats is not None else "background"
+    key = (scope, _operation(statement))
+    child = _statement_children.get(key)
+    if child is None:
+        child = _statement_children[key] = DB_STATEMENTS.labels(*key)
+    child.observe(seconds)
+    if stats is not None:
+        stats.record(statement, seconds)
+
+def instrument_engine(engine):
+    """Time every statement the engine runs (idempotent)."""
+    if event.contains(engine, "after_cursor_execute", _after_cursor_execute):
+        return
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("metrics_started", []).append(time.perf_counter())
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["metrics_started"].pop()
+    _observe_statement(statement, time.perf_counter() - started)
+
+def instrument_sessions(session_factory):
+    """Time flush + COMMIT of sessions made by `session_factory` (idempotent)."""
+    if event.contains(session_factory, "after_commit", _after_commit):
+        return
+    event.listen(session_factory, "before_commit", _before_commit)
+    event.listen(session_factory, "after_commit", _after_commit)
+
+def _before_commit(session):
+    session.info["metrics_commit_started"] = time.perf_counter()
+
+def _after_commit(session):
+    started = session.info.pop("metrics_commit_started", None)
+    if started is None:
+        return
+    stats = _current.get()
+    scope = stats.scope if stats is not None else "background"
+    child = _commit_children.get(scope)
+    if child is None:
+        child = _commit_children[scope] = DB_COMMITS.labels(scope)
+    child.observe(time.perf_counter() - started)
+
+# ---------- HTTP ----------
+
+def route_template(scope) -> str:
+    """
+    Path template of the route that handled the request (e.g.
+    /expenses/{expense_id}/attachments/{attachment_id}), from the endpoint
+    the router stored in the scope; built once per app.
+    """
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return UNMATCHED_ROUTE
+    app = scope["app"]
+    paths = getattr(app.state, "route_paths", None)
+    if paths is None:
+        paths = {r.endpoint: r.path for r in app.router.routes if hasattr(r, "endpoint")}
+        app.state.route_paths = paths
+    return paths.get(endpoint, UNMATCHED_ROUTE)
+
+class MetricsMiddleware:
+    """
+    Pure ASGI middleware: request count and latency per route template plus
+    the number of SQL statements each request ran.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        with statement_stats("http") as stats:
+            try:
+                await self.app(scope, receive, send_with_status)
+            finally:
+                route = route_template(scope)
+                method = scope["method"]
+                HTTP_REQUESTS.labels(method, route, str(status)).inc()
+                HTTP_LATENCY.labels(method, route).observe(time.perf_counter() - started)
+                HTTP_STATEMENTS.labels(route).observe(stats.statements)
+
+# ---------- Sync ----------
+
+@contextmanager
+def sync_run() -> Iterator[dict]:
+    """Time a sync run; the caller stores its result dict under "result"."""
+    outcome: dict = {}
+    started = time.perf_counter()
+    with statement_stats("sync"):
+        try:
+            yield outcome
+        finally:
+            SYNC_DURATION.observe(time.perf_counter() - started)
+            status = (outcome.get("result") or {}).get("status", "error")
+            SYNC_RUNS.labels(status).inc()
+
+def record_sync_rows(resource: str, counts: dict):
+    """Add an UpsertCounts.to_dict() to the per-outcome row counters."""
+    for outcome, n in counts.items():
+        if n:
+            SYNC_ROWS.labels(resource, outcome).inc(n)
+
+# ---------- Zoho ----------
+
+class ZohoCollector:
+    """Exposes app.zoho.telemetry (kept for /health) in Prometheus form at scrape time."""
+
+    def collect(self):
+        snap = zoho.telemetry.snapshot()
+        for name in ("requests", "throttles", "retries", "failures", "rejected"):
+            yield CounterMetricFamily(f"zoho_{name}", f"Zoho API {name}", value=snap[name])
+        statuses = CounterMetricFamily("zoho_responses", "Zoho API responses by status", labels=["status"])
+        for status, n in snap["statuses"].items():
+            statuses.add_metric([status], n)
+        yield statuses
+        latency = snap["latency_seconds"]
+        yield HistogramMetricFamily(
+            "zoho_request_duration_seconds", "Zoho API call latency",
+            buckets=list(latency["buckets"].items()), sum_value=latency["sum"],
+        )
+        yield CounterMetricFamily(
+            "zoho_rate_limit_wait_seconds", "Time spent waiting on the request token bucket",
+            value=snap["rate_limit_wait_seconds"],
+        )
+        yield GaugeMetricFamily("zoho_circuit_open", "1 while the Zoho circuit breaker is open",
+                                value=1 if snap["circuit"] == "open" else 0)
+
+registry.register(ZohoCollector())
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, BigInteger, Text, Date, Boolean, Numeric, TIMESTAMP, ForeignKey
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy import Column, BigInteger, Integer, Text, Date, Boolean, Numeric, TIMESTAMP, ForeignKey, func
+from sqlalchemy.dialects.postgresql import TSVECTOR, UUID
 from sqlalchemy.orm import relationship
 from app.db import Base
 
@@ -40,6 +40,7 @@ class ExpenseReport(Base):
     status = Column(Text)
     total_amount = Column(Numeric(18,2))
     currency = Column(Text)
+    payload_hash = Column(Text)  # hash of the last synced payload; unchanged rows are not rewritten
 
 class Expense(Base):
     __tablename__ = "expenses"
@@ -48,6 +49,7 @@ class Expense(Base):
     report_id = Column(BigInteger, ForeignKey("expense_reports.id", ondelete="SET NULL"))
     txn_date = Column(Date, nullable=False)
     merchant = Column(Text)
+    merchant_normalized = Column(Text)  # app.matching.normalize_merchant(merchant); trigram-indexed
     vendor_id = Column(BigInteger, ForeignKey("vendors.id"))
     category_id = Column(BigInteger, ForeignKey("categories.id"))
     description = Column(Text)
@@ -63,16 +65,45 @@ class Expense(Base):
     reimbursed_date = Column(Date)
     external_ref = Column(Text)
     kirkland_te_report = Column(Text)  # Kirkland T&E report reference/number
+    search_vector = Column(TSVECTOR)  # app.search.SEARCH_DOCUMENT; GIN-indexed
+    payload_hash = Column(Text)  # hash of the last synced payload; unchanged rows are not rewritten
 
 class Attachment(Base):
     __tablename__ = "attachments"
     id = Column(BigInteger, primary_key=True)
     expense_id = Column(BigInteger, ForeignKey("expenses.id", ondelete="CASCADE"), nullable=False)
-    zoho_file_id = Column(Text)
+    zoho_file_id = Column(Text, nullable=False, default="")  # "" = the expense's primary receipt
     filename = Column(Text)
     mime_type = Column(Text)
     size_bytes = Column(BigInteger)
     url = Column(Text)
+    content_sha256 = Column(Text)  # app.attachments.store key; NULL until mirrored
+    mirrored_at = Column(TIMESTAMP(timezone=True))
+    failed_attempts = Column(Integer, default=0)
+
+class ReconSession(Base):
+    __tablename__ = "recon_sessions"
+    id = Column(UUID(as_uuid=True), primary_key=True)  # the upload_id returned by /recon/upload
+    filename = Column(Text)
+    status = Column(Text, default="staged")  # staged | matched | committed
+    total_rows = Column(Integer, default=0)
+    staged_rows = Column(Integer, default=0)
+    error_rows = Column(Integer, default=0)
+    created_at = Column(TIMESTAMP(timezone=True), server_default=func.now())
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class ReconStagedRow(Base):
+    __tablename__ = "recon_staged_rows"
+    id = Column(BigInteger, primary_key=True)
+    upload_id = Column(UUID(as_uuid=True), ForeignKey("recon_sessions.id", ondelete="CASCADE"), nullable=False)
+    row_number = Column(Integer, nullable=False)
+    txn_date = Column(Date, nullable=False)
+    merchant = Column(Text)
+    amount = Column(Numeric(18,2), nullable=False)
+    reference = Column(Text)
+    matched_expense_id = Column(BigInteger, ForeignKey("expenses.id", ondelete="SET NULL"))
+    match_score = Column(Numeric(6,4))
+    match_status = Column(Text)  # proposed | accepted | committed | conflict
 
 class SyncState(Base):
     __tablename__ = "sync_state"
@@ -82,3 +113,20 @@ class SyncState(Base):
     last_run_at = Column(TIMESTAMP(timezone=True))
     status = Column(Text)
     message = Column(Text)
+
+class SyncCheckpoint(Base):
+    __tablename__ = "sync_checkpoints"
+    resource = Column(Text, primary_key=True)  # "reports" | "expenses"
+    cursor = Column(TIMESTAMP(timezone=True))  # max last_modified_time of the last completed pass
+    since = Column(TIMESTAMP(timezone=True))  # modified_after of the pass in progress (max_modified once resumed)
+    page = Column(Integer, default=0)  # last committed page of the current run's pass
+    max_modified = Column(TIMESTAMP(timezone=True))
+    in_progress = Column(Boolean, default=False)
+    updated_at = Column(TIMESTAMP(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class FxRate(Base):
+    __tablename__ = "fx_rates"
+    base_currency = Column(Text, primary_key=True)
+    quote_currency = Column(Text, primary_key=True)
+    rate_date = Column(Date, primary_key=True)
+    rate = Column(Numeric(18,8), nullable=False)  # 1 base_currency = rate quote_currency
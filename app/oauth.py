@@ -2,12 +2,13 @@ from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.responses import RedirectResponse
 from sqlalchemy.orm import Session
 from datetime import datetime, timedelta
-import httpx, urllib.parse
+import urllib.parse
 
 from app.config import settings
 from app.db import get_db
 from app.models import User, OAuthCredentials
 from app.utils import encrypt
+from app.zoho import get_client, invalidate_token_cache
 
 router = APIRouter(prefix="/oauth/zoho", tags=["oauth"])
 
@@ -40,11 +41,10 @@ async def callback(request: Request, code: str, db: Session = Depends(get_db)):
         "redirect_uri": f"{settings.APP_BASE_URL}/oauth/zoho/callback",
         "code": code,
     }
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(token_url, data=data)
-        if r.status_code != 200:
-            raise HTTPException(status_code=400, detail=f"Token exchange failed: {r.text}")
-        payload = r.json()
+    r = await get_client().post(token_url, data=data)
+    if r.status_code != 200:
+        raise HTTPException(status_code=400, detail=f"Token exchange failed: {r.text}")
+    payload = r.json()
     access_token = payload["access_token"]
     refresh_token = payload.get("refresh_token")
     expires_in = int(payload.get("expires_in", 3600))
@@ -73,4 +73,5 @@ async def callback(request: Request, code: str, db: Session = Depends(get_db)):
         )
         db.add(cred)
     db.commit()
+    invalidate_token_cache()
     return RedirectResponse(url="/health")
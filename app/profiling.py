@@ -0,0 +1,101 @@
+# Per-request SQL profiling: Server-Timing headers, repeated statement shapes and per-route query budgets
+import logging
+import re
+import time
+from collections import Counter
+
+from starlette.datastructures import MutableHeaders
+
+from app import metrics
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-query-profile"
+
+# Statement budgets per "METHOD route"; everything else gets QUERY_BUDGET_DEFAULT.
+# Bulk updates run one UPDATE per 1000 ids plus the report view refresh.
+ROUTE_BUDGETS = {
+    "GET /health": 1,
+    "GET /expenses": 1,
+    "GET /expenses/search": 1,
+    "GET /reports/summary": 1,
+    "GET /reports/outstanding": 1,
+    "GET /reports/ageing": 1,
+    "POST /expenses/reimburse/mark": 5,
+    "POST /expenses/kirkland-te/assign": 5,
+    "POST /expenses/admin/sync": 1,
+    "POST /recon/match": 2,
+}
+
+_WHITESPACE = re.compile(r"\s+")
+
+def statement_shape(statement: str) -> str:
+    return _WHITESPACE.sub(" ", statement).strip()
+
+def repeated_shapes(stats: metrics.StatementStats, threshold: int) -> list[tuple[str, int]]:
+    """Statements run at least `threshold` times, most repeated first."""
+    if not stats.shapes:
+        return []
+    merged: dict[str, int] = {}
+    for statement, n in stats.shapes.items():
+        shape = statement_shape(statement)
+        merged[shape] = merged.get(shape, 0) + n
+    return sorted(((s, n) for s, n in merged.items() if n >= threshold), key=lambda item: -item[1])
+
+def server_timing(stats: metrics.StatementStats, elapsed: float) -> str:
+    """Server-Timing value: DB time and statement count, distinct shapes, total app time."""
+    parts = [f'db;dur={stats.db_seconds * 1000:.2f};desc="{stats.statements} statements"']
+    if stats.shapes is not None:
+        top = max(stats.shapes.values(), default=0)
+        parts.append(f'db-shapes;desc="{len(stats.shapes)} distinct, max repeat {top}"')
+    parts.append(f"app;dur={elapsed * 1000:.2f}")
+    return ", ".join(parts)
+
+def check_budget(key: str, stats: metrics.StatementStats):
+    """Log when a request ran more statements than its route allows, or repeated one."""
+    budget = ROUTE_BUDGETS.get(key, settings.QUERY_BUDGET_DEFAULT)
+    repeats = repeated_shapes(stats, settings.QUERY_REPEAT_THRESHOLD)
+    if stats.statements > budget:
+        logger.warning("%s ran %d SQL statements (budget %d, %.1f ms)",
+                       key, stats.statements, budget, stats.db_seconds * 1000)
+    for shape, n in repeats[:3]:
+        logger.warning("%s ran the same statement %d times (likely N+1): %.200s", key, n, shape)
+
+def _profile_requested(scope) -> bool:
+    for name, value in scope.get("headers", ()):
+        if name == PROFILE_HEADER:
+            return value.strip() in (b"1", b"true")
+    return False
+
+class QueryProfilingMiddleware:
+    """
+    Runs inside MetricsMiddleware and reuses the StatementStats it opened.
+    Every request is checked against its route budget; profiled requests
+    also track statement shapes and get a Server-Timing header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        stats = metrics.current_stats()
+        if scope["type"] != "http" or stats is None:
+            await self.app(scope, receive, send)
+            return
+        profiled = settings.QUERY_PROFILING or _profile_requested(scope)
+        if profiled:
+            stats.shapes = Counter()
+        started = time.perf_counter()
+
+        async def send_with_timing(message):
+            if profiled and message["type"] == "http.response.start":
+                # Streaming bodies may run more statements after this point
+                timing = server_timing(stats, time.perf_counter() - started)
+                MutableHeaders(scope=message).append("Server-Timing", timing)
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            check_budget(f"{scope['method']} {metrics.route_template(scope)}", stats)
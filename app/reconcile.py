@@ -0,0 +1,214 @@
+# Reconciliation sessions: proposals, acceptance and bulk commit over recon_staged_rows
+import logging
+import uuid
+from datetime import date, timedelta
+from typing import Any, Optional, Sequence
+
+from sqlalchemy import select, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.matching import match
+from app.models import Expense, ReconSession
+
+logger = logging.getLogger(__name__)
+
+VALUES_CHUNK = 1000  # rows per UPDATE ... FROM (VALUES ...)
+
+class SessionNotFound(LookupError):
+    pass
+
+class MatchConflict(ValueError):
+    pass
+
+def load_match_candidates(db: Session, date_from: date, date_to: date) -> list[dict[str, Any]]:
+    """All unmatched expenses in the window, in one query."""
+    rows = db.execute(
+        select(Expense.id, Expense.txn_date, Expense.merchant, Expense.amount)
+        .where(Expense.external_ref.is_(None), Expense.txn_date.between(date_from, date_to))
+    ).all()
+    return [dict(r._mapping) for r in rows]
+
+def values_clause(rows: Sequence[tuple], casts: Sequence[str]) -> tuple[str, dict]:
+    """`VALUES (...), ...` with one bind per cell; casts type each column for Postgres."""
+    params, tuples = {}, []
+    for i, row in enumerate(rows):
+        cells = []
+        for j, (value, cast) in enumerate(zip(row, casts)):
+            params[f"v{i}_{j}"] = value
+            cells.append(f"CAST(:v{i}_{j} AS {cast})")
+        tuples.append(f"({', '.join(cells)})")
+    return "VALUES " + ", ".join(tuples), params
+
+def _chunks(items: Sequence, size: int = VALUES_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+def _lock_session(db: Session, session_id: uuid.UUID) -> ReconSession:
+    """Row-lock the session so propose / accept / commit on it run one at a time."""
+    session = db.get(ReconSession, session_id, with_for_update=True)
+    if session is None:
+        raise SessionNotFound(str(session_id))
+    return session
+
+def _session_dict(session: ReconSession) -> dict:
+    return {
+        'session_id': str(session.id),
+        'filename': session.filename,
+        'status': session.status,
+        'total_rows': session.total_rows,
+        'staged_rows': session.staged_rows,
+        'error_rows': session.error_rows,
+        'created_at': session.created_at,
+        'updated_at': session.updated_at,
+    }
+
+def session_summary(db: Session, session_id: uuid.UUID, after: int = 0, limit: int = 500) -> dict:
+    """Session state, per-status counts and one page of staged rows (keyset on row_number)."""
+    session = db.get(ReconSession, session_id)
+    if session is None:
+        raise SessionNotFound(str(session_id))
+    counts = db.execute(text("""
+        SELECT COALESCE(match_status, 'unmatched') AS status, COUNT(*) AS n
+        FROM recon_staged_rows WHERE upload_id = :sid GROUP BY 1
+    """), {"sid": session_id}).all()
+    rows = db.execute(text("""
+        SELECT row_number, txn_date, merchant, amount, reference,
+               matched_expense_id, match_score, match_status
+        FROM recon_staged_rows
+        WHERE upload_id = :sid AND row_number > :after
+        ORDER BY row_number
+        LIMIT :limit
+    """), {"sid": session_id, "after": after, "limit": limit}).all()
+    return {
+        'session': _session_dict(session),
+        'counts': {r.status: r.n for r in counts},
+        'rows': [dict(r._mapping) for r in rows],
+        'next_after': rows[-1].row_number if len(rows) == limit else None,
+    }
+
+def propose_matches(db: Session, session_id: uuid.UUID, amount_tolerance: float = 0.05,
+                    date_window_days: int = 7, min_score: float = 0.5) -> dict:
+    """
+    (Re)compute proposals for every row not yet accepted or committed. Expenses
+    already accepted in this session are not offered again. Proposals are
+    written back with one UPDATE per VALUES_CHUNK rows.
+    """
+    session = _lock_session(db, session_id)
+    params = {"sid": session_id}
+    rows = db.execute(text("""
+        SELECT row_number, txn_date AS date, merchant, amount::float8 AS amount
+        FROM recon_staged_rows
+        WHERE upload_id = :sid AND (match_status IS NULL OR match_status IN ('proposed', 'conflict'))
+        ORDER BY row_number
+    """), params).mappings().all()
+
+    candidates, proposals = [], []
+    if rows:
+        taken = set(db.execute(text("""
+            SELECT matched_expense_id FROM recon_staged_rows
+            WHERE upload_id = :sid AND match_status IN ('accepted', 'committed')
+        """), params).scalars())
+        window = timedelta(days=date_window_days)
+        candidates = [
+            c for c in load_match_candidates(db, min(r["date"] for r in rows) - window,
+                                             max(r["date"] for r in rows) + window)
+            if c["id"] not in taken
+        ]
+        proposals = match(rows, candidates, amount_tolerance, date_window_days, min_score)
+
+    db.execute(text("""
+        UPDATE recon_staged_rows
+        SET matched_expense_id = NULL, match_score = NULL, match_status = NULL
+        WHERE upload_id = :sid AND match_status IN ('proposed', 'conflict')
+    """), params)
+    for chunk in _chunks(proposals):
+        values, vparams = values_clause(
+            [(rows[p["row_index"]]["row_number"], p["expense_id"], p["score"]) for p in chunk],
+            ("integer", "bigint", "numeric"),
+        )
+        db.execute(text(f"""
+            UPDATE recon_staged_rows r
+            SET matched_expense_id = v.expense_id, match_score = v.score, match_status = 'proposed'
+            FROM ({values}) AS v(row_number, expense_id, score)
+            WHERE r.upload_id = :sid AND r.row_number = v.row_number
+        """), {**params, **vparams})
+    session.status = "matched"
+    db.commit()
+    return {'rows_considered': len(rows), 'candidates': len(candidates), 'proposed': len(proposals)}
+
+def accept_matches(db: Session, session_id: uuid.UUID, row_numbers: Optional[list[int]] = None,
+                   overrides: Sequence[tuple[int, int]] = ()) -> dict:
+    """
+    Accept proposals for row_numbers (all proposed rows when neither argument
+    is given) and/or set explicit (row_number, expense_id) pairs. Committed
+    rows are never touched, so repeating a call is harmless.
+    """
+    _lock_session(db, session_id)
+    params = {"sid": session_id}
+    accepted: set[int] = set()
+    try:
+        for chunk in _chunks(list(overrides)):
+            values, vparams = values_clause(chunk, ("integer", "bigint"))
+            accepted.update(db.execute(text(f"""
+                UPDATE recon_staged_rows r
+                SET matched_expense_id = v.expense_id, match_score = NULL, match_status = 'accepted'
+                FROM ({values}) AS v(row_number, expense_id)
+                WHERE r.upload_id = :sid AND r.row_number = v.row_number
+                  AND r.match_status IS DISTINCT FROM 'committed'
+                RETURNING r.row_number
+            """), {**params, **vparams}).scalars())
+        # [] accepts nothing; only an omitted list (with no overrides) means all
+        if row_numbers or (row_numbers is None and not overrides):
+            row_filter = "AND row_number = ANY(:rows)" if row_numbers is not None else ""
+            accepted.update(db.execute(text(f"""
+                UPDATE recon_staged_rows SET match_status = 'accepted'
+                WHERE upload_id = :sid AND match_status = 'proposed' {row_filter}
+                RETURNING row_number
+            """), {**params, "rows": row_numbers or []}).scalars())
+        db.commit()
+    except IntegrityError as e:
+        db.rollback()
+        logger.info("Rejected match acceptance for session %s: %s", session_id, e.orig)
+        raise MatchConflict("Each expense can be accepted for only one row, and must exist")
+    return {'accepted': len(accepted), 'row_numbers': sorted(accepted)}
+
+def commit_matches(db: Session, session_id: uuid.UUID) -> dict:
+    """
+    Apply every accepted pair to expenses: external_ref is set to the row's
+    reference (or "<session>#<row>" when blank) and company_report_status to
+    "Matched", one UPDATE ... FROM (VALUES ...) per VALUES_CHUNK pairs.
+    Expenses matched elsewhere in the meantime are left alone and their rows
+    marked 'conflict'. Applied rows become 'committed', so a retry is a no-op.
+    """
+    session = _lock_session(db, session_id)
+    params = {"sid": session_id}
+    pairs = db.execute(text("""
+        SELECT row_number, matched_expense_id,
+               COALESCE(NULLIF(reference, ''), CAST(upload_id AS text) || '#' || row_number) AS reference
+        FROM recon_staged_rows
+        WHERE upload_id = :sid AND match_status = 'accepted'
+        ORDER BY row_number
+    """), params).all()
+
+    updated: set[int] = set()
+    for chunk in _chunks(pairs):
+        values, vparams = values_clause([(p.matched_expense_id, p.reference) for p in chunk], ("bigint", "text"))
+        updated.update(db.execute(text(f"""
+            UPDATE expenses e
+            SET external_ref = v.reference, company_report_status = 'Matched'
+            FROM ({values}) AS v(expense_id, reference)
+            WHERE e.id = v.expense_id AND (e.external_ref IS NULL OR e.external_ref = v.reference)
+            RETURNING e.id
+        """), vparams).scalars())
+
+    conflicts = [p.row_number for p in pairs if p.matched_expense_id not in updated]
+    if pairs:
+        db.execute(text("""
+            UPDATE recon_staged_rows
+            SET match_status = CASE WHEN matched_expense_id = ANY(:ids) THEN 'committed' ELSE 'conflict' END
+            WHERE upload_id = :sid AND match_status = 'accepted'
+        """), {**params, "ids": list(updated)})
+        session.status = "committed"
+    db.commit()
+    return {'committed': len(pairs) - len(conflicts), 'conflicts': conflicts}
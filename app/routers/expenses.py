@@ -1,25 +1,106 @@
-from fastapi import APIRouter, Depends, HTTPException, Header, Request
+import base64
+import importlib.util
+import json
+from datetime import date
+
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import select
+from sqlalchemy import select, text, tuple_
 from pydantic import BaseModel
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from app import attachments, export
+from app.aggregates import try_refresh_aggregates
+from app.cache import report_cache
 from app.db import get_db
-from app.models import Expense
+from app.models import Attachment, Expense
+from app.search import search_expenses
 from app.config import settings
-from app.sync import run_sync
+from app.jobs import sync_jobs
+from app.sync import run_sync_job, sync_lock_held
 
 limiter = Limiter(key_func=get_remote_address)
 
 router = APIRouter(prefix="/expenses", tags=["expenses"])
 
+class ExpenseFilters:
+    """Query filters shared by the expense listing endpoints."""
+
+    def __init__(
+        self,
+        status: str | None = None,
+        date_from: date | None = None,
+        date_to: date | None = None,
+        currency: str | None = None,
+        category_id: int | None = None,
+        vendor_id: int | None = None,
+        kirkland_te_report: str | None = None,
+    ):
+        self.status = status
+        self.date_from = date_from
+        self.date_to = date_to
+        self.currency = currency
+        self.category_id = category_id
+        self.vendor_id = vendor_id
+        self.kirkland_te_report = kirkland_te_report
+
+    def apply(self, q):
+        if self.status:
+            q = q.filter(Expense.reimbursement_status == self.status)
+        if self.date_from:
+            q = q.filter(Expense.txn_date >= self.date_from)
+        if self.date_to:
+            q = q.filter(Expense.txn_date <= self.date_to)
+        if self.currency:
+            q = q.filter(Expense.currency == self.currency)
+        if self.category_id is not None:
+            q = q.filter(Expense.category_id == self.category_id)
+        if self.vendor_id is not None:
+            q = q.filter(Expense.vendor_id == self.vendor_id)
+        if self.kirkland_te_report:
+            q = q.filter(Expense.kirkland_te_report == self.kirkland_te_report)
+        return q
+
+def _pack_cursor(values: list) -> str:
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def _unpack_cursor(cursor: str) -> list:
+    return json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+
+def _encode_cursor(row: Expense) -> str:
+    return _pack_cursor([row.txn_date.isoformat(), row.id])
+
+def _decode_cursor(cursor: str) -> tuple[date, int]:
+    try:
+        txn_date, last_id = _unpack_cursor(cursor)
+        return date.fromisoformat(txn_date), int(last_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
 @router.get("")
-def list_expenses(status: str | None = None, limit: int = 100, db: Session = Depends(get_db)):
-    q = db.query(Expense)
-    if status:
-        q = q.filter(Expense.reimbursement_status == status)
-    q = q.order_by(Expense.txn_date.desc()).limit(min(limit, 500))
-    rows = q.all()
+def list_expenses(
+    response: Response,
+    limit: int = 100,
+    cursor: str | None = None,
+    filters: ExpenseFilters = Depends(),
+    db: Session = Depends(get_db),
+):
+    """
+    Newest-first expenses with keyset pagination on (txn_date, id).
+    When more rows exist, the X-Next-Cursor response header carries the
+    opaque cursor for the next page.
+    """
+    limit = max(1, min(limit, 500))
+    q = filters.apply(db.query(Expense))
+    if cursor:
+        after_date, after_id = _decode_cursor(cursor)
+        q = q.filter(tuple_(Expense.txn_date, Expense.id) < tuple_(after_date, after_id))
+    rows = q.order_by(Expense.txn_date.desc(), Expense.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _encode_cursor(rows[-1])
     return [{
         "id": r.id,
         "date": r.txn_date,
@@ -31,13 +112,101 @@ def list_expenses(status: str | None = None, limit: int = 100, db: Session = Dep
         "kirkland_te_report": r.kirkland_te_report,
     } for r in rows]
 
-@router.post("/reimburse/mark")
-def mark_reimbursed(expense_ids: list[int], amount: float | None = None, db: Session = Depends(get_db)):
-    rows = db.query(Expense).filter(Expense.id.in_(expense_ids)).all()
-    for r in rows:
-        r.reimbursement_status = "Reimbursed"
+@router.get("/search")
+def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = 20,
+    cursor: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """
+    Full-text search over merchant, description, category and report title
+    (web-search syntax: "quoted phrases", OR, -exclusions). Results are
+    ranked, carry a <mark>-highlighted snippet, and page with the
+    X-Next-Cursor header like GET /expenses.
+    """
+    limit = max(1, min(limit, 100))
+    after = None
+    if cursor:
+        try:
+            rank, last_id = _unpack_cursor(cursor)
+            after = (float(rank), int(last_id))
+        except (ValueError, TypeError):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+    rows = search_expenses(db, q, limit + 1, after)
+    if len(rows) > limit:
+        rows = rows[:limit]
+        response.headers["X-Next-Cursor"] = _pack_cursor([rows[-1]["rank"], rows[-1]["id"]])
+    return [{
+        "id": r["id"],
+        "date": r["txn_date"],
+        "merchant": r["merchant"],
+        "amount": float(r["amount"]) if r["amount"] is not None else None,
+        "currency": r["currency"],
+        "status": r["reimbursement_status"],
+        "category": r["category"],
+        "report_title": r["report_title"],
+        "rank": r["rank"],
+        "snippet": r["snippet"],
+    } for r in rows]
+
+@router.get("/export")
+def export_expenses(
+    fmt: str = Query("csv", alias="format", pattern="^(csv|ndjson|parquet)$"),
+    filters: ExpenseFilters = Depends(),
+):
+    """
+    Stream every expense matching the listing filters as CSV, NDJSON or
+    Parquet (needs pyarrow). Rows come from a server-side cursor, so memory
+    use does not grow with the size of the ledger.
+    """
+    if fmt == "parquet" and importlib.util.find_spec("pyarrow") is None:
+        raise HTTPException(status_code=501, detail="Parquet export requires pyarrow")
+    encoders = {"csv": export.to_csv, "ndjson": export.to_ndjson, "parquet": export.to_parquet}
+    return StreamingResponse(
+        encoders[fmt](export.export_batches(filters)),
+        media_type=export.MEDIA_TYPES[fmt],
+        headers={"Content-Disposition": f'attachment; filename="expenses.{fmt}"'},
+    )
+
+BULK_UPDATE_CHUNK = 1000  # ids per UPDATE ... WHERE id = ANY(:ids)
+
+def _bulk_update(db: Session, expense_ids: list[int], assignments: str, params: dict) -> dict:
+    """
+    Apply `SET {assignments}` to the given expenses with one set-based UPDATE
+    per chunk, all in one transaction. Returns per-ID outcomes in request order.
+    """
+    ids = list(dict.fromkeys(expense_ids))
+    updated: set[int] = set()
+    stmt = text(f"UPDATE expenses SET {assignments} WHERE id = ANY(:ids) RETURNING id")
+    for i in range(0, len(ids), BULK_UPDATE_CHUNK):
+        updated.update(db.execute(stmt, {**params, "ids": ids[i:i + BULK_UPDATE_CHUNK]}).scalars())
     db.commit()
-    return {"updated": len(rows)}
+    if updated:
+        try_refresh_aggregates(db)
+        report_cache.invalidate()
+    return {
+        "updated": len(updated),
+        "not_found": len(ids) - len(updated),
+        "results": [{"id": i, "status": "updated" if i in updated else "not_found"} for i in ids],
+    }
+
+@router.post("/reimburse/mark")
+def mark_reimbursed(
+    expense_ids: list[int],
+    amount: float | None = None,
+    reimbursed_date: date | None = None,
+    db: Session = Depends(get_db),
+):
+    """Mark expenses reimbursed; reimbursed_amount defaults to each expense's amount, the date to today"""
+    return _bulk_update(
+        db, expense_ids,
+        "reimbursement_status = 'Reimbursed', "
+        "reimbursed_amount = COALESCE(CAST(:amount AS numeric), amount), "
+        "reimbursed_date = COALESCE(CAST(:reimbursed_date AS date), CURRENT_DATE)",
+        {"amount": amount, "reimbursed_date": reimbursed_date},
+    )
 
 class KirklandTERequest(BaseModel):
     expense_ids: list[int]
@@ -46,14 +215,15 @@ class KirklandTERequest(BaseModel):
 @router.post("/kirkland-te/assign")
 def assign_kirkland_te_report(request: KirklandTERequest, db: Session = Depends(get_db)):
     """Assign Kirkland T&E report number to expenses"""
-    rows = db.query(Expense).filter(Expense.id.in_(request.expense_ids)).all()
-    for r in rows:
-        r.kirkland_te_report = request.te_report_number
-        # Optionally mark as reimbursed when assigned to T&E report
-        if r.reimbursement_status == "Not Reimbursed":
-            r.reimbursement_status = "Submitted for Reimbursement"
-    db.commit()
-    return {"updated": len(rows), "te_report": request.te_report_number}
+    result = _bulk_update(
+        db, request.expense_ids,
+        # Assigning to a T&E report submits expenses that were not reimbursed yet
+        "kirkland_te_report = :te_report, "
+        "reimbursement_status = CASE WHEN reimbursement_status = 'Not Reimbursed' "
+        "THEN 'Submitted for Reimbursement' ELSE reimbursement_status END",
+        {"te_report": request.te_report_number},
+    )
+    return {**result, "te_report": request.te_report_number}
 
 @router.get("/kirkland-te/{te_report_number}")
 def get_expenses_by_te_report(te_report_number: str, db: Session = Depends(get_db)):
@@ -96,10 +266,78 @@ def list_te_reports(db: Session = Depends(get_db)):
         }
     } for r in results]
 
+# ---------- Receipt attachments (mirrored by app.attachments) ----------
+
+@router.get("/{expense_id}/attachments")
+def list_attachments(expense_id: int, db: Session = Depends(get_db)):
+    """Receipts of an expense; `url` is set once the file has been mirrored"""
+    rows = db.query(Attachment).filter(Attachment.expense_id == expense_id).order_by(Attachment.id).all()
+    return [{
+        "id": a.id,
+        "filename": a.filename,
+        "mime_type": a.mime_type,
+        "size_bytes": a.size_bytes,
+        "url": f"/expenses/{expense_id}/attachments/{a.id}" if a.content_sha256 else None,
+    } for a in rows]
+
+@router.get("/{expense_id}/attachments/{attachment_id}")
+def get_attachment(expense_id: int, attachment_id: int, request: Request, db: Session = Depends(get_db)):
+    """
+    Serve a mirrored receipt from local storage. Single byte ranges get
+    206 Partial Content; the file is content-addressed, so its hash is a
+    strong ETag and responses can be cached for good.
+    """
+    att = db.query(Attachment).filter(
+        Attachment.id == attachment_id, Attachment.expense_id == expense_id,
+    ).first()
+    if not att:
+        raise HTTPException(status_code=404, detail="Attachment not found")
+    path = attachments.store.path_for(att.content_sha256) if att.content_sha256 else None
+    stat_result = attachments.stored_stat(path) if path else None
+    if stat_result is None:
+        raise HTTPException(status_code=404, detail="Attachment not mirrored yet")
+
+    etag = f'"{att.content_sha256}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=31536000, immutable"}
+    kwargs = {
+        "headers": headers,
+        "media_type": att.mime_type or None,
+        "filename": att.filename or att.content_sha256,
+        "stat_result": stat_result,
+        "content_disposition_type": "inline",
+    }
+    if_range = request.headers.get("if-range")
+    range_header = request.headers.get("range") if if_range in (None, etag) else None
+    try:
+        byte_range = attachments.parse_range(range_header, stat_result.st_size)
+    except ValueError as e:
+        raise HTTPException(status_code=416, detail="Range not satisfiable", headers={"Content-Range": str(e)})
+    if byte_range is None:
+        return FileResponse(path, **kwargs)
+    return attachments.RangeFileResponse(path, byte_range, **kwargs)
+
 @router.post("/admin/sync")
 @limiter.limit("10/minute")  # Strict limit for admin operations
 def admin_sync(request: Request, x_admin_token: str = Header(default=""), db: Session = Depends(get_db)):
     if x_admin_token != settings.ADMIN_TOKEN:
         raise HTTPException(status_code=401, detail="Unauthorized")
-    run_sync(db)
-    return {"ok": True, "message": "Sync started"}
+    # Another replica holding the advisory lock would only make our job skip
+    if sync_jobs.active() is None and sync_lock_held(db):
+        raise HTTPException(status_code=409, detail="Sync already running in another process")
+    job, created = sync_jobs.enqueue(run_sync_job)
+    return {
+        "ok": True,
+        "message": "Sync started" if created else "Sync already in progress",
+        "job_id": job.id,
+        "status_url": f"/expenses/admin/sync/{job.id}",
+    }
+
+@router.get("/admin/sync/{job_id}")
+def admin_sync_status(job_id: str, x_admin_token: str = Header(default="")):
+    """Progress of a sync job: pages fetched, rows upserted, throughput and ETA"""
+    if x_admin_token != settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    job = sync_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Sync job not found")
+    return job.to_dict()
@@ -1,17 +1,44 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Request
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from slowapi import Limiter
 from slowapi.util import get_remote_address
+from app.cache import report_cache
+from app.config import settings
 from app.db import get_db
+from app.matching import match, normalize_merchant
 from app.models import Expense
-import csv
-import io
-from typing import List, Dict, Any
+from app.reconcile import (
+    MatchConflict, SessionNotFound, accept_matches, commit_matches,
+    load_match_candidates, propose_matches, session_summary,
+)
+from app.staging import CsvFormatError, iter_company_rows, stage_upload
+from datetime import timedelta
+from typing import List, Dict, Any, Optional
+import uuid
 
 limiter = Limiter(key_func=get_remote_address)
 
 router = APIRouter(prefix="/recon", tags=["reconciliation"])
 
+def _require_csv(file: UploadFile):
+    if not (file.filename or '').endswith('.csv'):
+        raise HTTPException(status_code=400, detail="File must be CSV format")
+
+def _read_company_rows(file: UploadFile) -> tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """Parse an upload into (valid rows, first K error rows, total rows)."""
+    valid, errors, total = [], [], 0
+    for row_number, row, error in iter_company_rows(file.file):
+        total += 1
+        if error:
+            if len(errors) < settings.RECON_MAX_ERRORS:
+                errors.append({'row_number': row_number, 'status': 'error', 'error': error})
+        else:
+            valid.append({'row_number': row_number, **row})
+    return valid, errors, total
+
 @router.post("/upload")
 @limiter.limit("5/minute")  # Limited uploads to prevent abuse
 async def upload_company_report(
@@ -23,62 +50,71 @@ async def upload_company_report(
     Upload company T&E report CSV for reconciliation with Zoho expenses.
 
     Expected CSV columns: date, merchant, amount, reference
-    """
-    if not file.filename.endswith('.csv'):
-        raise HTTPException(status_code=400, detail="File must be CSV format")
 
+    The file is streamed through the parser and valid rows are COPYed into
+    the staging table in batches under a new reconciliation session; the
+    response carries counts, the first RECON_MAX_ERRORS row errors and the
+    upload_id, which is also the session id.
+    """
+    _require_csv(file)
     try:
-        # Read CSV content
-        content = await file.read()
-        csv_content = content.decode('utf-8')
-
-        # Parse CSV
-        reader = csv.DictReader(io.StringIO(csv_content))
-        rows = list(reader)
-
-        # Basic validation
-        required_columns = {'date', 'merchant', 'amount'}
-        if not required_columns.issubset(set(reader.fieldnames or [])):
-            raise HTTPException(
-                status_code=400,
-                detail=f"CSV must contain columns: {required_columns}"
-            )
-
-        # Process each row (stub for now)
-        processed_rows = []
-        for i, row in enumerate(rows):
-            try:
-                processed_row = {
-                    'row_number': i + 1,
-                    'date': row['date'],
-                    'merchant': row['merchant'],
-                    'amount': float(row['amount']),
-                    'reference': row.get('reference', ''),
-                    'status': 'ready_for_matching'
-                }
-                processed_rows.append(processed_row)
-            except ValueError as e:
-                processed_rows.append({
-                    'row_number': i + 1,
-                    'status': 'error',
-                    'error': f"Invalid amount: {row.get('amount', 'missing')}"
-                })
-
-        # Return summary
-        successful_rows = [r for r in processed_rows if r['status'] == 'ready_for_matching']
-        error_rows = [r for r in processed_rows if r['status'] == 'error']
-
-        return {
-            'total_rows': len(rows),
-            'successful_rows': len(successful_rows),
-            'error_rows': len(error_rows),
-            'errors': error_rows,
-            'message': f"Processed {len(successful_rows)} rows ready for matching"
-        }
-
+        result = await run_in_threadpool(stage_upload, db, file.file, file.filename)
+    except CsvFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing CSV: {str(e)}")
 
+    result['session_url'] = f"/recon/sessions/{result['upload_id']}"
+    result['message'] = f"Processed {result['successful_rows']} rows ready for matching"
+    return result
+
+@router.post("/auto-match")
+@limiter.limit("5/minute")
+async def auto_match(
+    request: Request,
+    file: UploadFile = File(...),
+    amount_tolerance: float = Query(0.05, ge=0, le=1),
+    date_window_days: int = Query(7, ge=0, le=60),
+    min_score: float = Query(0.5, ge=0, le=1),
+    db: Session = Depends(get_db)
+):
+    """
+    Propose one-to-one matches for a whole company report in one call.
+
+    Candidates (unmatched expenses in the report's date window, widened by
+    date_window_days) are loaded once and scored against every CSV row on
+    amount tolerance, date proximity and normalized merchant similarity.
+    """
+    _require_csv(file)
+    try:
+        valid, errors, total = await run_in_threadpool(_read_company_rows, file)
+    except CsvFormatError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not valid:
+        return {'total_rows': total, 'candidates': 0, 'matches': [], 'unmatched_rows': [], 'errors': errors}
+
+    window = timedelta(days=date_window_days)
+    candidates = await run_in_threadpool(
+        load_match_candidates, db,
+        min(r['date'] for r in valid) - window,
+        max(r['date'] for r in valid) + window,
+    )
+    # NumPy scoring grids are CPU-bound: keep them off the event loop
+    proposals = await run_in_threadpool(match, valid, candidates, amount_tolerance, date_window_days, min_score)
+
+    matched = set()
+    for p in proposals:
+        row = valid[p.pop('row_index')]
+        matched.add(row['row_number'])
+        p.update(row_number=row['row_number'], reference=row['reference'])
+    return {
+        'total_rows': total,
+        'candidates': len(candidates),
+        'matches': proposals,
+        'unmatched_rows': [r['row_number'] for r in valid if r['row_number'] not in matched],
+        'errors': errors,
+    }
+
 @router.get("/match-candidates/{merchant}")
 async def get_match_candidates(
     merchant: str,
@@ -90,12 +126,14 @@ async def get_match_candidates(
     """
     Get potential Zoho expense matches for a company report entry.
 
-    This is a stub for fuzzy matching logic that would match by:
-    - Merchant name similarity
-    - Amount (with tolerance)
-    - Date proximity
+    The merchant is normalized the same way as expenses.merchant_normalized
+    and matched with the pg_trgm `%` operator, so the GIN trigram index is
+    used; candidates are ranked by similarity(), then amount (5% tolerance)
+    and date range narrow the result.
     """
-    query = db.query(Expense).filter(Expense.merchant.ilike(f"%{merchant}%"))
+    normalized = normalize_merchant(merchant)
+    score = func.similarity(Expense.merchant_normalized, normalized).label("score")
+    query = db.query(Expense, score).filter(Expense.merchant_normalized.op('%')(normalized))
 
     if amount:
         # Allow 5% tolerance on amount
@@ -114,11 +152,12 @@ async def get_match_candidates(
     # Limit to unmatched expenses
     query = query.filter(Expense.external_ref.is_(None))
 
-    candidates = query.limit(10).all()
+    candidates = query.order_by(score.desc(), Expense.id).limit(10).all() if normalized else []
 
     return {
         'query': {
             'merchant': merchant,
+            'normalized': normalized,
             'amount': amount,
             'date_range': f"{date_from} to {date_to}" if date_from and date_to else "any"
         },
@@ -129,7 +168,8 @@ async def get_match_candidates(
             'amount': float(c.amount) if c.amount else None,
             'status': c.reimbursement_status,
             'te_report': c.kirkland_te_report,
-        } for c in candidates],
+            'score': round(float(s), 4),
+        } for c, s in candidates],
         'count': len(candidates)
     }
 
@@ -151,10 +191,74 @@ async def create_match(
     expense.company_report_status = "Matched"
 
     db.commit()
+    report_cache.invalidate()
 
     return {
         'expense_id': expense_id,
         'company_reference': company_reference,
         'status': 'matched',
         'message': 'Expense successfully matched to company report'
-    }
\ No newline at end of file
+    }
+
+# ---------- Reconciliation sessions ----------
+
+class MatchPair(BaseModel):
+    row_number: int
+    expense_id: int
+
+class AcceptRequest(BaseModel):
+    row_numbers: Optional[List[int]] = None  # accept these proposals; omitted with no matches = all
+    matches: List[MatchPair] = []  # explicit pairs, overriding any proposal
+
+def _run_session_op(op, db: Session, session_id: uuid.UUID, *args, **kwargs):
+    try:
+        return op(db, session_id, *args, **kwargs)
+    except SessionNotFound:
+        raise HTTPException(status_code=404, detail="Reconciliation session not found")
+    except MatchConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@router.get("/sessions/{session_id}")
+async def get_session(
+    session_id: uuid.UUID,
+    after: int = Query(0, ge=0, description="Return rows after this row_number"),
+    limit: int = Query(500, ge=1, le=5000),
+    db: Session = Depends(get_db)
+):
+    """Resume a reconciliation session: status, counts per match status and staged rows."""
+    return await run_in_threadpool(_run_session_op, session_summary, db, session_id, after, limit)
+
+@router.post("/sessions/{session_id}/auto-match")
+async def auto_match_session(
+    session_id: uuid.UUID,
+    amount_tolerance: float = Query(0.05, ge=0, le=1),
+    date_window_days: int = Query(7, ge=0, le=60),
+    min_score: float = Query(0.5, ge=0, le=1),
+    db: Session = Depends(get_db)
+):
+    """Store match proposals for every staged row that is not accepted or committed yet."""
+    return await run_in_threadpool(
+        _run_session_op, propose_matches, db, session_id, amount_tolerance, date_window_days, min_score
+    )
+
+@router.post("/sessions/{session_id}/accept")
+async def accept_session_matches(
+    session_id: uuid.UUID,
+    request: AcceptRequest,
+    db: Session = Depends(get_db)
+):
+    """Accept proposed matches and/or set explicit row -> expense pairs."""
+    overrides = [(m.row_number, m.expense_id) for m in request.matches]
+    return await run_in_threadpool(_run_session_op, accept_matches, db, session_id, request.row_numbers, overrides)
+
+@router.post("/sessions/{session_id}/commit")
+async def commit_session_matches(session_id: uuid.UUID, db: Session = Depends(get_db)):
+    """
+    Apply all accepted matches to expenses in one statement. Safe to retry:
+    committed rows are skipped, and expenses matched elsewhere are reported
+    as conflicts instead of being overwritten.
+    """
+    result = await run_in_threadpool(_run_session_op, commit_matches, db, session_id)
+    if result['committed']:
+        report_cache.invalidate()
+    return result
@@ -1,47 +1,117 @@
-from fastapi import APIRouter, Depends
+from datetime import date
+
+from fastapi import APIRouter, Depends, Query, Request
 from sqlalchemy.orm import Session
+from app import analytics
+from app.cache import report_cache
+from app.config import settings
 from app.db import get_db
 from sqlalchemy import text
 
 router = APIRouter(prefix="/reports", tags=["reports"])
 
+# All three read the expense_totals materialized view (refreshed by
+# app.aggregates after syncs and expense mutations), so they scale with the
+# number of groups rather than the number of expenses. Responses go through
+# report_cache, which the same writes invalidate.
+
 @router.get("/summary")
-def summary(from_: str | None = None, to: str | None = None, db: Session = Depends(get_db)):
-    # Simple totals
+def summary(request: Request, from_: str | None = None, to: str | None = None, db: Session = Depends(get_db)):
+    # One pass over the groups: native totals per currency plus the home-currency
+    # grand total; `unconverted` counts rows that still lack an FX rate
     q = """
-    SELECT currency, SUM(amount) AS total_amount, COUNT(*) AS n
-    FROM expenses
+    SELECT currency, SUM(total_amount) AS total_amount, SUM(total_home) AS total_home,
+           SUM(n)::bigint AS n, SUM(n - n_home)::bigint AS unconverted
+    FROM expense_totals
     GROUP BY currency
     """
-    rows = list(db.execute(text(q)))
-    return {"by_currency": [dict(r._mapping) for r in rows]}
+
+    def build():
+        rows = [dict(r._mapping) for r in db.execute(text(q))]
+        return {
+            "home_currency": settings.HOME_CURRENCY,
+            "total_home": sum((r["total_home"] or 0 for r in rows), 0),
+            "unconverted": sum(r["unconverted"] or 0 for r in rows),
+            "by_currency": rows,
+        }
+    return report_cache.respond(request, build)
 
 @router.get("/outstanding")
-def outstanding(db: Session = Depends(get_db)):
+def outstanding(request: Request, db: Session = Depends(get_db)):
+    # '' is a NULL status folded by the view; NULL never matched != 'Reimbursed'
     q = """
-    SELECT category_id, SUM(amount_home) AS total_outstanding
-    FROM expenses
-    WHERE (reimbursable IS TRUE) AND (reimbursement_status != 'Reimbursed')
-    GROUP BY category_id
+    SELECT NULLIF(category_id, 0) AS category_id, SUM(total_home) AS total_outstanding
+    FROM expense_totals
+    WHERE reimbursable AND reimbursement_status NOT IN ('Reimbursed', '')
+    GROUP BY 1
     """
-    rows = list(db.execute(text(q)))
-    return {"outstanding": [dict(r._mapping) for r in rows]}
+    return report_cache.respond(request, lambda: {
+        "outstanding": [dict(r._mapping) for r in db.execute(text(q))]
+    })
 
 @router.get("/ageing")
-def ageing(db: Session = Depends(get_db)):
+def ageing(request: Request, db: Session = Depends(get_db)):
     q = """
-    SELECT 
-      CASE 
-        WHEN CURRENT_DATE - txn_date <= 30 THEN '0-30'
-        WHEN CURRENT_DATE - txn_date <= 60 THEN '31-60'
-        WHEN CURRENT_DATE - txn_date <= 90 THEN '61-90'
-        ELSE '90+'
-      END AS bucket,
-      SUM(amount_home) AS total
-    FROM expenses
-    WHERE (reimbursement_status != 'Reimbursed' OR reimbursement_status IS NULL)
+    SELECT ageing_bucket AS bucket, SUM(total_home) AS total
+    FROM expense_totals
+    WHERE reimbursement_status != 'Reimbursed'
     GROUP BY 1
     ORDER BY 1
     """
-    rows = list(db.execute(text(q)))
-    return {"ageing": [dict(r._mapping) for r in rows]}
+    return report_cache.respond(request, lambda: {
+        "ageing": [dict(r._mapping) for r in db.execute(text(q))]
+    })
+
+# ---------- Chart analytics (served from expense_daily_rollup) ----------
+
+GRANULARITY_PATTERN = "^(" + "|".join(analytics.GRANULARITIES) + ")$"
+
+def _chart(granularity, date_from, date_to, currency, data: dict) -> dict:
+    return {
+        "granularity": granularity,
+        "date_from": date_from,
+        "date_to": date_to,
+        "currency": currency,
+        "data": data,
+    }
+
+@router.get("/by_category")
+def by_category(
+    request: Request,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    granularity: str | None = Query(None, pattern=GRANULARITY_PATTERN),
+    top: int = Query(10, ge=1, le=100),
+    currency: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Spend per category (top N + "Other"), optionally split by period"""
+    return report_cache.respond(request, lambda: _chart(granularity, date_from, date_to, currency,
+        analytics.top_n_breakdown(db, "category", date_from, date_to, granularity, top, currency)))
+
+@router.get("/by_merchant")
+def by_merchant(
+    request: Request,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    granularity: str | None = Query(None, pattern=GRANULARITY_PATTERN),
+    top: int = Query(10, ge=1, le=100),
+    currency: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Spend per merchant (top N + "Other"), optionally split by period"""
+    return report_cache.respond(request, lambda: _chart(granularity, date_from, date_to, currency,
+        analytics.top_n_breakdown(db, "merchant", date_from, date_to, granularity, top, currency)))
+
+@router.get("/trends")
+def trends(
+    request: Request,
+    date_from: date | None = None,
+    date_to: date | None = None,
+    granularity: str = Query("month", pattern=GRANULARITY_PATTERN),
+    currency: str | None = None,
+    db: Session = Depends(get_db),
+):
+    """Spend per period"""
+    return report_cache.respond(request, lambda: _chart(granularity, date_from, date_to, currency,
+        analytics.trends(db, date_from, date_to, granularity, currency)))
@@ -0,0 +1,65 @@
+import hashlib
+import hmac
+import json
+from typing import Any
+
+from fastapi import APIRouter, HTTPException, Request
+from app.config import settings
+from app.jobs import change_queue
+
+router = APIRouter(prefix="/webhooks", tags=["webhooks"])
+
+SIGNATURE_HEADER = "X-Zoho-Webhook-Signature"
+
+def sign(body: bytes, secret: str) -> str:
+    """Hex HMAC-SHA256 of the raw request body."""
+    return hmac.new(secret.encode(), body, hashlib.sha256).hexdigest()
+
+def extract_changes(payload: Any) -> dict[str, set[str]]:
+    """
+    Changed expense / report ids from a webhook payload. Accepts a single
+    event, a list of events or {"events": [...]}; each event is either
+    {"expense": {...}}, {"report": {...}} or a flat record with expense_id
+    (taking precedence, since expenses also carry their report_id) or report_id.
+    """
+    events = payload.get("events", [payload]) if isinstance(payload, dict) else payload
+    changes: dict[str, set[str]] = {"expense": set(), "report": set()}
+    for event in events if isinstance(events, list) else []:
+        if not isinstance(event, dict):
+            continue
+        for kind in ("expense", "report"):
+            record = event.get(kind)
+            if isinstance(record, dict) and record.get(f"{kind}_id"):
+                changes[kind].add(str(record[f"{kind}_id"]))
+                break
+        else:
+            if event.get("expense_id"):
+                changes["expense"].add(str(event["expense_id"]))
+            elif event.get("report_id"):
+                changes["report"].add(str(event["report_id"]))
+    return changes
+
+@router.post("/zoho", status_code=202)
+async def zoho_webhook(request: Request):
+    """
+    Receive Zoho change notifications. The body must be signed with
+    ZOHO_WEBHOOK_SECRET (see `sign`). Only record ids are taken from the
+    payload: the records themselves are re-fetched from the Zoho API by the
+    change queue, so a replayed notification just re-syncs current data.
+    """
+    if not settings.ZOHO_WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Webhooks are not enabled")
+
+    body = await request.body()
+    signature = request.headers.get(SIGNATURE_HEADER, "")
+    # Bytes: compare_digest raises TypeError on non-ASCII str, which would be a 500
+    if not hmac.compare_digest(signature.encode(), sign(body, settings.ZOHO_WEBHOOK_SECRET).encode()):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid JSON payload")
+
+    queued = change_queue.add(extract_changes(payload))
+    return {"ok": True, "queued": queued}
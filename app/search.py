@@ -0,0 +1,90 @@
+# Full-text search over expenses: search_vector maintenance and the ranked, keyset-paginated query
+from typing import Iterable, Optional
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+TS_CONFIG = "english"  # documents and queries must share one config
+
+# Merchant ranks above category / report title, which rank above description.
+# Category and report live in other tables, so this can't be a generated
+# column; the sync refreshes it for the rows it writes (see refresh_search_vectors).
+SEARCH_DOCUMENT = f"""
+  setweight(to_tsvector('{TS_CONFIG}', coalesce(x.merchant, '')), 'A') ||
+  setweight(to_tsvector('{TS_CONFIG}', coalesce(c.name, '')), 'B') ||
+  setweight(to_tsvector('{TS_CONFIG}', coalesce(r.title, '')), 'B') ||
+  setweight(to_tsvector('{TS_CONFIG}', coalesce(x.description, '')), 'C')
+"""
+
+SEARCH_SOURCE = """
+  FROM expenses x
+  LEFT JOIN categories c ON c.id = x.category_id
+  LEFT JOIN expense_reports r ON r.id = x.report_id
+"""
+
+def refresh_search_vectors(db: Session, zoho_expense_ids: Iterable[str] = (),
+                           zoho_report_ids: Iterable[str] = ()) -> int:
+    """
+    Recompute search_vector in one set-based UPDATE for the given expenses
+    and for every expense of the given reports (their title is indexed too).
+    Commits; returns the number of rows updated.
+    """
+    expense_ids, report_ids = list(zoho_expense_ids), list(zoho_report_ids)
+    if not expense_ids and not report_ids:
+        return 0
+    result = db.execute(
+        text(
+            f"UPDATE expenses e SET search_vector = {SEARCH_DOCUMENT} {SEARCH_SOURCE} "
+            "WHERE x.id = e.id AND e.id IN ("
+            "SELECT id FROM expenses WHERE zoho_expense_id = ANY(CAST(:expense_ids AS text[])) "
+            "UNION SELECT ex.id FROM expenses ex JOIN expense_reports rr ON rr.id = ex.report_id "
+            "WHERE rr.zoho_report_id = ANY(CAST(:report_ids AS text[])))"
+        ),
+        {"expense_ids": expense_ids, "report_ids": report_ids},
+    )
+    db.commit()
+    return result.rowcount
+
+# ts_rank_cd is real (float4); a float4 rank sent back in the cursor is
+# compared as float8 and never equals the boundary row's rank, dropping every
+# row tied with it. Ranking in float8 throughout makes the cursor exact.
+RANK = "ts_rank_cd(e.search_vector, q.query)::float8"
+
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxFragments=2, MaxWords=20, MinWords=5"
+
+def search_expenses(db: Session, q: str, limit: int,
+                    after: Optional[tuple[float, int]] = None) -> list[dict]:
+    """
+    Expenses matching a web-search style query (quotes, OR, -term), best
+    first by ts_rank_cd, then newest id. `after` is the (rank, id) of the
+    last row of the previous page. Only the returned page is joined for
+    ts_headline, which is the expensive part.
+    """
+    keyset = f"AND ({RANK}, e.id) < (:after_rank, :after_id)" if after else ""
+    params = {"q": q, "limit": limit}
+    if after:
+        params["after_rank"], params["after_id"] = after
+    rows = db.execute(
+        text(f"""
+        WITH q AS (SELECT websearch_to_tsquery('{TS_CONFIG}', :q) AS query),
+        page AS (
+          SELECT e.id, {RANK} AS rank
+          FROM expenses e, q
+          WHERE e.search_vector @@ q.query {keyset}
+          ORDER BY rank DESC, e.id DESC
+          LIMIT :limit
+        )
+        SELECT x.id, x.txn_date, x.merchant, x.amount, x.currency, x.reimbursement_status,
+               c.name AS category, r.title AS report_title, page.rank,
+               ts_headline('{TS_CONFIG}',
+                           concat_ws(' | ', x.merchant, x.description, c.name, r.title),
+                           q.query, '{HEADLINE_OPTIONS}') AS snippet
+        FROM page JOIN q ON TRUE
+        JOIN expenses x ON x.id = page.id
+        LEFT JOIN categories c ON c.id = x.category_id
+        LEFT JOIN expense_reports r ON r.id = x.report_id
+        ORDER BY page.rank DESC, x.id DESC
+        """),
+        params,
+    )
+    return [dict(r._mapping) for r in rows]
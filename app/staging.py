@@ -0,0 +1,144 @@
+# Streaming ingestion of company T&E statements into recon_staged_rows
+import codecs
+import csv
+import io
+import logging
+import uuid
+from datetime import date
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from typing import IO, Any, Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ReconSession
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = {'date', 'merchant', 'amount'}
+STAGED_COLUMNS = ("upload_id", "row_number", "txn_date", "merchant", "amount", "reference")
+CENT = Decimal("0.01")
+MAX_AMOUNT = Decimal("1e16")  # recon_staged_rows.amount is numeric(18,2): 16 integer digits
+
+class CsvFormatError(ValueError):
+    """The upload as a whole is unusable (encoding, header, framing)."""
+
+def iter_lines(fileobj: IO[bytes], chunk_size: int) -> Iterator[str]:
+    """Decode a binary file chunk by chunk and yield lines with their endings."""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    while True:
+        chunk = fileobj.read(chunk_size)
+        try:
+            pending += decoder.decode(chunk, final=not chunk)
+        except UnicodeDecodeError:
+            raise CsvFormatError("File must be UTF-8 encoded")
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line + "\n"
+        if not chunk:
+            break
+    if pending:
+        yield pending
+
+def parse_company_row(row: dict[str, Optional[str]]) -> dict[str, Any]:
+    """Validate one CSV row; raises ValueError with a user-facing message."""
+    try:
+        amount = Decimal((row['amount'] or '').strip())
+    except (AttributeError, InvalidOperation):
+        raise ValueError(f"Invalid amount: {row.get('amount') or 'missing'}")
+    # One inf/NaN/oversized cell would otherwise fail the COPY for the whole upload
+    if not amount.is_finite() or abs(amount) >= MAX_AMOUNT:
+        raise ValueError(f"Invalid amount: {row['amount']}")
+    amount = amount.quantize(CENT, rounding=ROUND_HALF_UP)
+    if abs(amount) >= MAX_AMOUNT:
+        raise ValueError(f"Invalid amount: {row['amount']}")
+    try:
+        txn_date = date.fromisoformat((row['date'] or '').strip())
+    except ValueError:
+        raise ValueError(f"Invalid date: {row.get('date') or 'missing'}")
+    return {
+        'date': txn_date,
+        'merchant': row['merchant'],
+        'amount': amount,
+        'reference': row.get('reference') or '',
+    }
+
+def iter_company_rows(fileobj: IO[bytes], chunk_size: Optional[int] = None
+                      ) -> Iterator[tuple[int, Optional[dict], Optional[str]]]:
+    """Yield (row_number, parsed row, None) or (row_number, None, error) per data row."""
+    reader = csv.DictReader(iter_lines(fileobj, chunk_size or settings.RECON_UPLOAD_CHUNK_BYTES))
+    try:
+        if not REQUIRED_COLUMNS.issubset(reader.fieldnames or []):
+            raise CsvFormatError(f"CSV must contain columns: {REQUIRED_COLUMNS}")
+        for row_number, row in enumerate(reader, 1):
+            try:
+                yield row_number, parse_company_row(row), None
+            except ValueError as e:
+                yield row_number, None, str(e)
+    except csv.Error as e:
+        raise CsvFormatError(f"Malformed CSV at line {reader.line_num}: {e}")
+
+def copy_staged_rows(db: Session, upload_id: uuid.UUID, rows: list[dict]):
+    """Append rows to recon_staged_rows with COPY, inside the session's transaction."""
+    buf = io.StringIO()
+    csv.writer(buf).writerows(
+        (upload_id, r['row_number'], r['date'].isoformat(), r['merchant'], r['amount'], r['reference'])
+        for r in rows
+    )
+    buf.seek(0)
+    raw = db.connection().connection
+    with raw.cursor() as cur:
+        cur.copy_expert(
+            f"COPY recon_staged_rows ({', '.join(STAGED_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buf
+        )
+
+def stage_upload(db: Session, fileobj: IO[bytes], filename: Optional[str] = None,
+                 chunk_size: Optional[int] = None, batch_size: Optional[int] = None,
+                 max_errors: Optional[int] = None) -> dict:
+    """
+    Validate an uploaded statement row by row and COPY the valid rows into
+    recon_staged_rows under a new reconciliation session (id = upload_id),
+    batch_size rows at a time. Memory stays bounded by one chunk plus one
+    batch; only the first max_errors row errors are kept. The session and
+    all batches commit together.
+    """
+    batch_size = batch_size or settings.RECON_STAGE_BATCH_SIZE
+    max_errors = settings.RECON_MAX_ERRORS if max_errors is None else max_errors
+    upload_id = uuid.uuid4()
+    total = staged = error_count = 0
+    errors: list[dict] = []
+    batch: list[dict] = []
+    try:
+        session = ReconSession(id=upload_id, filename=filename, status="staged")
+        db.add(session)
+        db.flush()  # COPY goes through the raw connection; the session row must exist first
+        for row_number, row, error in iter_company_rows(fileobj, chunk_size):
+            total += 1
+            if error:
+                error_count += 1
+                if len(errors) < max_errors:
+                    errors.append({'row_number': row_number, 'status': 'error', 'error': error})
+                continue
+            batch.append({'row_number': row_number, **row})
+            if len(batch) >= batch_size:
+                copy_staged_rows(db, upload_id, batch)
+                staged += len(batch)
+                batch = []
+        if batch:
+            copy_staged_rows(db, upload_id, batch)
+            staged += len(batch)
+        session.total_rows, session.staged_rows, session.error_rows = total, staged, error_count
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    logger.info("Staged %d/%d rows for upload %s", staged, total, upload_id)
+    return {
+        'upload_id': str(upload_id),
+        'total_rows': total,
+        'successful_rows': staged,
+        'error_rows': error_count,
+        'errors': errors,
+        'errors_truncated': error_count > len(errors),
+    }
@@ -1,19 +1,86 @@
 # Production-grade sync engine with advisory locks and cursor persistence
 import asyncio
-from datetime import datetime, timezone
-from typing import Optional
+import hashlib
+import json
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import suppress
+from datetime import date, datetime, timedelta, timezone
+from typing import Awaitable, Callable, Optional
 
-from sqlalchemy import text, select
+from sqlalchemy import literal_column, text, select
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import DataError, IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.dialects.postgresql import insert
 
-from app.models import Expense, ExpenseReport, Vendor, Category
-from app.zoho import list_expenses, list_reports
+from app import metrics
+from app.aggregates import aggregates_outdated, try_refresh_aggregates
+from app.attachments import download_attachments, pending_attachments, record_downloads, register_attachments
+from app.cache import report_cache
+from app.config import settings
+from app.db import SessionLocal
+from app.fx import FxRates
+from app.lookups import SyncLookups
+from app.matching import normalize_merchant
+from app.search import refresh_search_vectors
+from app.models import Expense, ExpenseReport, SyncCheckpoint
+from app.zoho import get_expense, get_report, get_valid_token, list_expenses, list_reports, close_client
+
+logger = logging.getLogger(__name__)
 
 LOCK_KEY = 812739  # stable across deployments
+EXPENSE_REQUIRED_FIELDS = ("txn_date", "amount", "currency")
+
+_thread_loops = threading.local()
+
+class SyncProgress:
+    """Counters updated inside run_sync and read by the job status endpoint."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.phase = "pending"
+        self.pages_fetched = 0
+        self.rows_upserted = 0
+        self.rows_expected: Optional[int] = None
+        self.started_at: Optional[float] = None
+
+    def start(self, phase: str):
+        with self._lock:
+            self.phase = phase
+            if self.started_at is None:
+                self.started_at = time.monotonic()
 
-def _now_utc() -> datetime:
-    return datetime.now(timezone.utc)
+    def page_fetched(self, data: dict):
+        with self._lock:
+            self.pages_fetched += 1
+            # Zoho includes a total in page_context when it knows one
+            total = ((data or {}).get("page_context") or {}).get("total")
+            if isinstance(total, int):
+                self.rows_expected = max(self.rows_expected or 0, total)
+
+    def rows_written(self, n: int):
+        with self._lock:
+            self.rows_upserted += n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            elapsed = time.monotonic() - self.started_at if self.started_at else 0.0
+            rate = self.rows_upserted / elapsed if elapsed > 0 else None
+            eta = None
+            if rate and self.rows_expected:
+                eta = max(self.rows_expected - self.rows_upserted, 0) / rate
+            return {
+                "phase": self.phase,
+                "pages_fetched": self.pages_fetched,
+                "rows_upserted": self.rows_upserted,
+                "rows_expected": self.rows_expected,
+                "elapsed_seconds": round(elapsed, 1),
+                "rows_per_second": round(rate, 1) if rate else None,
+                "eta_seconds": round(eta, 1) if eta is not None else None,
+            }
 
 def _get_cursor(db: Session) -> Optional[datetime]:
     row = db.execute(
@@ -41,52 +108,84 @@ def _set_sync_state(db: Session, status: str, cursor: Optional[datetime], messag
     )
     db.commit()
 
-def _try_lock(db: Session) -> bool:
-    row = db.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_KEY}).first()
+def _try_lock(conn: Connection) -> bool:
+    row = conn.execute(text("SELECT pg_try_advisory_lock(:k)"), {"k": LOCK_KEY}).first()
+    conn.commit()
     return bool(row and row[0])
 
-def _unlock(db: Session):
-    db.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
-    db.commit()
+def _unlock(conn: Connection):
+    conn.execute(text("SELECT pg_advisory_unlock(:k)"), {"k": LOCK_KEY})
+    conn.commit()
+
+def sync_lock_held(db: Session) -> bool:
+    """True if any backend currently holds the sync advisory lock."""
+    # bigint advisory keys are split into classid (high 32 bits) / objid (low 32 bits)
+    row = db.execute(
+        text(
+            "SELECT EXISTS (SELECT 1 FROM pg_locks WHERE locktype = 'advisory' "
+            "AND classid = :hi AND objid = :lo AND objsubid = 1 AND granted)"
+        ),
+        {"hi": LOCK_KEY >> 32, "lo": LOCK_KEY & 0xFFFFFFFF},
+    ).first()
+    return bool(row and row[0])
 
 def _run_async(coro):
-    try:
-        loop = asyncio.get_event_loop()
-        if loop.is_running():
-            # nested: rarely happens in uvicorn main thread, but guard anyway
-            return asyncio.run(coro)
-        return loop.run_until_complete(coro)
-    except RuntimeError:
-        return asyncio.run(coro)
+    # One long-lived loop per thread, so the pooled Zoho client and its
+    # keep-alive connections are reused across pages and runs
+    loop = getattr(_thread_loops, "loop", None)
+    if loop is None or loop.is_closed():
+        loop = _thread_loops.loop = asyncio.new_event_loop()
+    return loop.run_until_complete(coro)
+
+def close_thread_loop():
+    """Close this thread's Zoho client and event loop (worker shutdown)."""
+    loop = getattr(_thread_loops, "loop", None)
+    if loop is not None and not loop.is_closed():
+        loop.run_until_complete(close_client())
+        loop.close()
 
 # ---------- Upsert helpers with ON CONFLICT ----------
 
-def upsert_vendor(db: Session, name: Optional[str]) -> Optional[int]:
-    if not name:
-        return None
-    stmt = insert(Vendor).values(name=name).on_conflict_do_nothing(index_elements=["name"]).returning(Vendor.id)
-    row = db.execute(stmt).first()
-    if row:
-        db.commit()
-        return row[0]
-    # Already exists — fetch id
-    vid = db.execute(text("SELECT id FROM vendors WHERE name=:n"), {"n": name}).scalar()
-    db.commit()
-    return vid
+class UpsertCounts:
+    """Per-row outcomes of upserts; `changed` holds the Zoho ids actually written."""
 
-def upsert_category(db: Session, name: Optional[str]) -> Optional[int]:
-    if not name:
-        return None
-    stmt = insert(Category).values(name=name).on_conflict_do_nothing(index_elements=["name"]).returning(Category.id)
-    row = db.execute(stmt).first()
-    if row:
-        db.commit()
-        return row[0]
-    cid = db.execute(text("SELECT id FROM categories WHERE name=:n"), {"n": name}).scalar()
-    db.commit()
-    return cid
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.skipped = 0
+        self.changed: set[str] = set()
+
+    def add(self, other: "UpsertCounts"):
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.unchanged += other.unchanged
+        self.skipped += other.skipped
+        self.changed |= other.changed
+
+    def record(self, z_id: str, inserted: bool):
+        if inserted:
+            self.inserted += 1
+        else:
+            self.updated += 1
+        self.changed.add(z_id)
 
-def upsert_report(db: Session, zoho: dict) -> Optional[int]:
+    @property
+    def processed(self) -> int:
+        return self.inserted + self.updated + self.unchanged
+
+    def to_dict(self) -> dict:
+        return {"inserted": self.inserted, "updated": self.updated,
+                "unchanged": self.unchanged, "skipped": self.skipped}
+
+def _payload_hash(payload: dict) -> str:
+    """Content hash of a normalized row; equal hashes mean the UPDATE can be skipped."""
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+# RETURNING (xmax = 0) is true for freshly inserted rows and false for updated ones
+INSERTED = literal_column("(xmax = 0)").label("inserted")
+
+def upsert_report(db: Session, zoho: dict, counts: Optional[UpsertCounts] = None) -> Optional[int]:
     z_id = str(zoho.get("report_id") or zoho.get("id") or "")
     if not z_id:
         return None
@@ -98,108 +197,573 @@ def upsert_report(db: Session, zoho: dict) -> Optional[int]:
         "total_amount": zoho.get("total"),
         "currency": (zoho.get("currency") or {}).get("code") if isinstance(zoho.get("currency"), dict) else zoho.get("currency"),
     }
-    stmt = insert(ExpenseReport).values(**payload).on_conflict_do_update(
+    payload["payload_hash"] = _payload_hash(payload)
+    stmt = insert(ExpenseReport).values(**payload)
+    stmt = stmt.on_conflict_do_update(
         index_elements=["zoho_report_id"],
         set_=payload,
-    ).returning(ExpenseReport.id)
-    rid = db.execute(stmt).scalar()
+        where=ExpenseReport.payload_hash.is_distinct_from(stmt.excluded.payload_hash),
+    ).returning(ExpenseReport.id, INSERTED)
+    row = db.execute(stmt).first()
+    if row is None:
+        # Unchanged: the conditional update returned nothing
+        rid = db.execute(text("SELECT id FROM expense_reports WHERE zoho_report_id=:z"), {"z": z_id}).scalar()
+        if counts is not None:
+            counts.unchanged += 1
+    else:
+        rid = row.id
+        if counts is not None:
+            counts.record(z_id, row.inserted)
     db.commit()
     return rid
 
-def upsert_expense(db: Session, zoho: dict, report_map: dict[str, int]):
-    z_id = str(zoho.get("expense_id") or zoho.get("id") or "")
-    if not z_id:
-        return
-    vendor_name = (zoho.get("merchant") or zoho.get("vendor") or "") or None
-    category_name = (
-        zoho.get("category_name")
-        or (zoho.get("category") or {}).get("name") if isinstance(zoho.get("category"), dict) else zoho.get("category")
-    )
-    vendor_id = upsert_vendor(db, vendor_name)
-    category_id = upsert_category(db, category_name)
+def _currency_code(zoho: dict) -> Optional[str]:
+    cur = zoho.get("currency")
+    return cur.get("code") if isinstance(cur, dict) else cur
 
+def _vendor_name(zoho: dict) -> Optional[str]:
+    return (zoho.get("merchant") or zoho.get("vendor") or "") or None
+
+def _category_name(zoho: dict) -> Optional[str]:
+    if zoho.get("category_name"):
+        return zoho["category_name"]
+    cat = zoho.get("category")
+    return cat.get("name") if isinstance(cat, dict) else cat
+
+def _amount_home(zoho: dict, rates: Optional[FxRates]):
+    """Zoho's own converted amount when sent, else amount at the as-of rate for txn_date."""
+    sent = zoho.get("amount_home") or zoho.get("converted_amount")
+    if sent is not None or rates is None:
+        return sent
+    return rates.convert(zoho.get("amount"), _currency_code(zoho), zoho.get("date") or zoho.get("txn_date"))
+
+def _expense_payload(zoho: dict, z_id: str, report_map: dict[str, int],
+                     vendor_id: Optional[int], category_id: Optional[int],
+                     rates: Optional[FxRates] = None) -> dict:
     rid = None
     raw_rid = zoho.get("report_id")
     if raw_rid and str(raw_rid) in report_map:
         rid = report_map[str(raw_rid)]
 
+    merchant = _vendor_name(zoho)
     payload = {
         "zoho_expense_id": z_id,
         "report_id": rid,
         "txn_date": zoho.get("date") or zoho.get("txn_date"),
-        "merchant": vendor_name,
+        "merchant": merchant,
+        "merchant_normalized": normalize_merchant(merchant),
         "vendor_id": vendor_id,
         "category_id": category_id,
         "description": zoho.get("description"),
         "amount": zoho.get("amount"),
-        "currency": (zoho.get("currency") or {}).get("code") if isinstance(zoho.get("currency"), dict) else zoho.get("currency"),
+        "currency": _currency_code(zoho),
         "exchange_rate": zoho.get("exchange_rate"),
-        "amount_home": zoho.get("amount_home") or zoho.get("converted_amount"),
+        "amount_home": _amount_home(zoho, rates),
         "payment_mode": zoho.get("payment_mode"),
     }
-    stmt = insert(Expense).values(**payload).on_conflict_do_update(
+    payload["payload_hash"] = _payload_hash(payload)
+    return payload
+
+def _expense_upsert_stmt(rows: list[dict]):
+    """Multi-row upsert that leaves rows with an unchanged payload_hash untouched
+    (no new tuple, no WAL); RETURNING lists only inserted / updated rows."""
+    stmt = insert(Expense).values(rows)
+    return stmt.on_conflict_do_update(
         index_elements=["zoho_expense_id"],
-        set_=payload,  # safe: only mutable fields are listed
+        # safe: only mutable fields are listed
+        set_={k: stmt.excluded[k] for k in rows[0] if k != "zoho_expense_id"},
+        where=Expense.payload_hash.is_distinct_from(stmt.excluded.payload_hash),
+    ).returning(Expense.zoho_expense_id, INSERTED)
+
+def _write_expense_batch(db: Session, rows: list[dict]) -> UpsertCounts:
+    """One multi-row upsert + one commit; falls back to per-row savepoints on bad data."""
+    counts = UpsertCounts()
+    try:
+        for z_id, inserted in db.execute(_expense_upsert_stmt(rows)):
+            counts.record(z_id, inserted)
+        db.commit()
+        counts.unchanged = len(rows) - len(counts.changed)
+        return counts
+    except (DataError, IntegrityError) as e:
+        db.rollback()
+        counts = UpsertCounts()
+        logger.warning("Batch upsert of %d expenses failed, retrying row by row: %s", len(rows), e.orig)
+
+    for row in rows:
+        try:
+            with db.begin_nested():
+                result = db.execute(_expense_upsert_stmt([row])).first()
+            if result is None:
+                counts.unchanged += 1
+            else:
+                counts.record(result.zoho_expense_id, result.inserted)
+        except (DataError, IntegrityError) as e:
+            counts.skipped += 1
+            logger.warning("Skipping expense %s: %s", row["zoho_expense_id"], e.orig)
+    db.commit()
+    return counts
+
+def _as_date(value) -> Optional[date]:
+    if isinstance(value, date):
+        return value
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+def _stored_txn_days(db: Session, zoho_ids: list[str]) -> dict[str, date]:
+    rows = db.execute(
+        text("SELECT zoho_expense_id, txn_date FROM expenses WHERE zoho_expense_id = ANY(:ids)"),
+        {"ids": zoho_ids},
+    )
+    return {r[0]: r[1] for r in rows}
+
+def upsert_expenses(db: Session, items: list[dict], report_map: dict[str, int],
+                    lookups: Optional[SyncLookups] = None,
+                    batch_size: Optional[int] = None,
+                    touched_days: Optional[set[date]] = None,
+                    rates: Optional[FxRates] = None) -> UpsertCounts:
+    """
+    Upsert a page of Zoho expenses in multi-row INSERT ... ON CONFLICT batches,
+    committing once per batch. Vendor/category ids for the whole page are
+    resolved in bulk through `lookups`, and amount_home is converted in memory
+    from `rates` when Zoho doesn't send it. Rows whose content hash is unchanged
+    are not rewritten; written rows get their search_vector refreshed in one
+    UPDATE. When `touched_days` is given it collects the old and new
+    txn_date of every changed row, for the daily rollup.
+    """
+    batch_size = batch_size or settings.SYNC_BATCH_SIZE
+    lookups = lookups or SyncLookups()
+    rates = rates or FxRates()  # no rates loaded: only home-currency rows convert
+    items = [it for it in items if it.get("expense_id") or it.get("id")]
+    vendor_ids = lookups.vendors.resolve(db, (_vendor_name(it) for it in items))
+    category_ids = lookups.categories.resolve(db, (_category_name(it) for it in items))
+
+    # Keyed by zoho id: a single statement cannot touch the same row twice
+    payloads: dict[str, dict] = {}
+    skipped = 0
+    for it in items:
+        z_id = str(it.get("expense_id") or it.get("id"))
+        payload = _expense_payload(
+            it, z_id, report_map,
+            vendor_ids.get(_vendor_name(it)),
+            category_ids.get(_category_name(it)),
+            rates,
+        )
+        missing = [k for k in EXPENSE_REQUIRED_FIELDS if payload[k] is None]
+        if missing:
+            logger.warning("Skipping expense %s: missing %s", z_id, ", ".join(missing))
+            skipped += 1
+            continue
+        payloads[z_id] = payload
+
+    rows = list(payloads.values())
+    old_days = _stored_txn_days(db, list(payloads)) if touched_days is not None and rows else {}
+    counts = UpsertCounts()
+    counts.skipped = skipped
+    for start in range(0, len(rows), batch_size):
+        counts.add(_write_expense_batch(db, rows[start:start + batch_size]))
+    if touched_days is not None:
+        for z_id in counts.changed:
+            touched_days.update(d for d in (old_days.get(z_id), _as_date(payloads[z_id]["txn_date"])) if d)
+    refresh_search_vectors(db, counts.changed)
+    register_attachments(db, [it for it in items if str(it.get("expense_id") or it.get("id")) in payloads])
+    return counts
+
+def mirror_attachments(db: Session, token_db: Optional[Session] = None) -> dict:
+    """
+    Download one batch of receipts that are registered but not stored yet
+    (see app.attachments). Failures are logged and retried on later runs;
+    they never fail the sync.
+    """
+    if not settings.ATTACHMENT_MIRROR_ENABLED:
+        return {"stored": 0, "failed": 0}
+    try:
+        pending = pending_attachments(db, settings.ATTACHMENT_MIRROR_BATCH)
+        if not pending:
+            return {"stored": 0, "failed": 0}
+        stored, failed = _run_async(download_attachments(token_db or db, pending))
+        record_downloads(db, stored, failed)
+        return {"stored": len(stored), "failed": len(failed)}
+    except Exception as e:
+        db.rollback()
+        logger.warning("Mirroring attachments failed: %s", e)
+        return {"stored": 0, "failed": 0, "error": str(e)}
+
+def _report_map_for(db: Session, items: list[dict]) -> dict[str, int]:
+    """zoho_report_id -> expense_reports.id for the reports the given expenses reference."""
+    ids = list({str(it["report_id"]) for it in items if it.get("report_id")})
+    if not ids:
+        return {}
+    rows = db.execute(
+        text("SELECT zoho_report_id, id FROM expense_reports WHERE zoho_report_id = ANY(:ids)"),
+        {"ids": ids},
+    )
+    return {r[0]: r[1] for r in rows}
+
+# ---------- Page pipeline ----------
+
+_DONE = object()
+
+def _page_items(data: dict, key: str) -> list[dict]:
+    return (data.get(key) or data.get("data") or []) if data else []
+
+async def _produce_pages(fetch: Callable[[int], Awaitable[dict]], queue: asyncio.Queue, concurrency: int):
+    """Fetch pages 1..n with up to `concurrency` requests in flight, queued in page order."""
+    in_flight: deque[tuple[int, asyncio.Task]] = deque()
+    page = 1
+    try:
+        while True:
+            while len(in_flight) < concurrency:
+                in_flight.append((page, asyncio.create_task(fetch(page))))
+                page += 1
+            number, task = in_flight.popleft()
+            data = await task
+            await queue.put((number, data))  # blocks while the writer is behind (back-pressure)
+            if not data or not data.get("has_more"):
+                break
+    except Exception as e:
+        await queue.put(e)
+    finally:
+        # Speculative requests past the last page are simply dropped
+        for _, task in in_flight:
+            task.cancel()
+    # Not in `finally`: once cancelled (the writer failed) nobody drains the
+    # queue, and waiting for room in it would hang the sync forever
+    await queue.put(_DONE)
+
+async def _run_pipeline(fetch: Callable[[int], Awaitable[dict]], write: Callable[[int, dict], int],
+                        concurrency: Optional[int] = None, prefetch: Optional[int] = None) -> int:
+    """
+    Overlap Zoho fetches with DB writes: a producer prefetches pages into a
+    bounded queue while blocking `write(page, data)` calls run in a worker
+    thread, one page at a time and in page order. Returns the sum of `write`
+    results.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=prefetch or settings.SYNC_PREFETCH_PAGES)
+    producer = asyncio.create_task(
+        _produce_pages(fetch, queue, concurrency or settings.SYNC_FETCH_CONCURRENCY)
     )
-    db.execute(stmt)
+    total = 0
+    try:
+        while True:
+            item = await queue.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            total += await asyncio.to_thread(write, *item)
+    finally:
+        producer.cancel()
+        with suppress(asyncio.CancelledError):
+            await producer
+    return total
+
+# ---------- Targeted sync of changed records (webhooks) ----------
+
+async def _fetch_records(db: Session, fetch: Callable[[Session, str], Awaitable[Optional[dict]]],
+                         ids: list[str], concurrency: int) -> list[dict]:
+    """Fetch records by id with bounded concurrency; records that no longer exist are dropped."""
+    await get_valid_token(db)  # refresh once up front rather than from every request
+    sem = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(record_id: str) -> Optional[dict]:
+        async with sem:
+            return await fetch(db, record_id)
+
+    return [r for r in await asyncio.gather(*(fetch_one(i) for i in ids)) if r]
+
+def apply_changes(db: Session, expense_ids: list[str], report_ids: list[str]) -> dict:
+    """
+    Fetch just the given reports and expenses from Zoho and upsert them with
+    the same helpers as the full sync, then refresh the aggregates for the
+    affected days. Deleted records (404) are skipped; the periodic full sync
+    remains the safety net for anything missed.
+    """
+    concurrency = settings.SYNC_FETCH_CONCURRENCY
+    reports = _run_async(_fetch_records(db, get_report, report_ids, concurrency)) if report_ids else []
+    report_counts = UpsertCounts()
+    for it in reports:
+        upsert_report(db, it, report_counts)
+    refresh_search_vectors(db, zoho_report_ids=report_counts.changed)
+
+    expenses = _run_async(_fetch_records(db, get_expense, expense_ids, concurrency)) if expense_ids else []
+    touched_days: set[date] = set()
+    expense_counts = upsert_expenses(db, expenses, _report_map_for(db, expenses),
+                                     touched_days=touched_days, rates=FxRates.load(db) if expenses else None)
+
+    if report_counts.changed or expense_counts.changed:
+        try_refresh_aggregates(db, touched_days)
+        report_cache.invalidate()
+    return {
+        "reports": report_counts.to_dict(),
+        "expenses": expense_counts.to_dict(),
+        "attachments": mirror_attachments(db) if expenses else {"stored": 0, "failed": 0},
+    }
+
+def run_change_job(expense_ids: list[str], report_ids: list[str]) -> dict:
+    """Entry point for the change queue drain: one short-lived session per batch."""
+    db = SessionLocal()
+    try:
+        with metrics.statement_stats("webhook"):
+            result = apply_changes(db, expense_ids, report_ids)
+        metrics.record_sync_rows("reports", result["reports"])
+        metrics.record_sync_rows("expenses", result["expenses"])
+        return result
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+# ---------- Checkpoints ----------
+
+SYNC_RESOURCES = ("reports", "expenses")
+
+def _utc(dt: Optional[datetime]) -> Optional[datetime]:
+    return dt.replace(tzinfo=timezone.utc) if dt is not None and dt.tzinfo is None else dt
+
+def _modified_time(item: dict) -> Optional[datetime]:
+    value = item.get("last_modified_time") or item.get("modified_time")
+    if not value:
+        return None
+    try:
+        return _utc(datetime.fromisoformat(str(value)))
+    except ValueError:
+        return None
+
+def _load_checkpoint(db: Session, resource: str, legacy_cursor: Optional[datetime]) -> SyncCheckpoint:
+    """
+    The resource's checkpoint, starting a new pass from its cursor. An
+    interrupted pass is resumed from page 1, listing from the newest modified
+    time it committed: page numbers are not stable across runs, since a row
+    edited meanwhile moves to the end and shifts every later row back a slot.
+    """
+    cp = db.get(SyncCheckpoint, resource)
+    if cp is None:
+        cp = SyncCheckpoint(resource=resource, cursor=legacy_cursor, page=0, in_progress=False)
+        db.add(cp)
+    if cp.in_progress:
+        # Overlap: ties at the boundary timestamp, and a filter that turns out
+        # to be exclusive or coarser than the stored times, lose nothing
+        overlap = timedelta(seconds=settings.SYNC_RESUME_OVERLAP_SECONDS)
+        cp.since, cp.page = (cp.max_modified - overlap if cp.max_modified else None), 0
+    else:
+        cp.since, cp.page, cp.max_modified, cp.in_progress = cp.cursor, 0, cp.cursor, True
     db.commit()
+    return cp
+
+def _checkpoint_page(db: Session, cp: SyncCheckpoint, page: int, items: list[dict]):
+    """Record a committed page: a resumed pass lists from its newest modified time."""
+    seen = [t for t in (_modified_time(it) for it in items) if t]
+    if cp.max_modified:
+        seen.append(_utc(cp.max_modified))
+    if seen:
+        cp.max_modified = max(seen)
+    cp.page = page
+    db.commit()
+
+def _finish_checkpoint(db: Session, cp: SyncCheckpoint, hold_back: Optional[datetime] = None):
+    """
+    Pass complete: the next one lists records modified since the newest one
+    seen, or since `hold_back` when the pass may have skipped records after it.
+    """
+    cursor = cp.max_modified
+    if hold_back is not None and (cursor is None or hold_back < _utc(cursor)):
+        logger.warning("Sync of %s saw records move mid-pass; next pass re-reads from %s",
+                       cp.resource, hold_back.isoformat())
+        cursor = hold_back
+    cp.cursor, cp.since, cp.page, cp.in_progress = cursor, None, 0, False
+    db.commit()
+
+class PassTracker:
+    """
+    Records listed so far in a pass. A record listed twice was edited
+    mid-pass and moved to the end of the (oldest-first) listing, shifting
+    every record after its old slot back one place; one of those may have
+    crossed a page boundary unread. `hold_back` is the earliest such slot.
+    """
+
+    def __init__(self, id_key: str):
+        self.id_key = id_key
+        self.first_seen: dict[str, Optional[datetime]] = {}
+        self.hold_back: Optional[datetime] = None
+
+    def add(self, items: list[dict]):
+        for it in items:
+            z_id = str(it.get(self.id_key) or it.get("id") or "")
+            if not z_id:
+                continue
+            if z_id not in self.first_seen:
+                self.first_seen[z_id] = _modified_time(it)
+                continue
+            first = self.first_seen[z_id]
+            if first is not None and (self.hold_back is None or first < self.hold_back):
+                self.hold_back = first
+
+def _check_modified_filter(resource: str, since: Optional[datetime], items: list[dict]):
+    """
+    Zoho's modified-time list filter (see app.zoho.list_expenses) is not in
+    its documented API; if the first page holds older changes the filter was
+    ignored and this "incremental" pass re-reads everything, so say so.
+    """
+    if since is None:
+        return
+    since = _utc(since)
+    older = [t for t in (_modified_time(it) for it in items) if t and t < since]
+    if older:
+        logger.warning("Zoho ignored the modified-time filter for %s (got changes from %s, asked since %s); "
+                       "this pass re-reads every record", resource, min(older).isoformat(), since.isoformat())
 
 # ---------- Main sync with advisory lock ----------
 
-def run_sync(db: Session):
+def run_sync(db: Session, progress: Optional[SyncProgress] = None):
     """
     Production-grade sync with PostgreSQL advisory lock to prevent concurrent runs.
     Uses cursor-based incremental sync and upserts for idempotent operations.
+
+    Each resource keeps a checkpoint (sync_checkpoints) updated after every
+    committed page; a run that dies mid-pass is resumed by the following run,
+    which lists from shortly before the newest modified time it committed.
+    Cursors are the newest last_modified_time seen, so they track the
+    source's clock rather than ours. Records modified exactly at the cursor
+    may be fetched again, which the upserts make harmless.
     """
-    if not _try_lock(db):
+    progress = progress or SyncProgress()
+    # The advisory lock is per connection, so hold it on one that the session
+    # can't hand back to the pool between commits
+    lock_conn = db.get_bind().connect()
+    if not _try_lock(lock_conn):
+        lock_conn.close()
         _set_sync_state(db, "skipped", _get_cursor(db), "Another sync is running")
         return {"status": "skipped", "message": "Another sync is running"}
 
+    # Fetches run on the event loop while writes use `db` from a worker thread,
+    # so token lookups get their own session
+    token_db = Session(bind=db.get_bind())
     try:
-        since = _get_cursor(db)
+        legacy_cursor = _get_cursor(db)
         report_map: dict[str, int] = {}
+        touched_days: set[date] = set()
+        lookups = SyncLookups()
+        lookups.preload(db)
+        rates = FxRates.load(db)
+
+        def fetching(list_fn, since: Optional[datetime], resource: str):
+            fetch_seconds = metrics.SYNC_PAGE_FETCH.labels(resource)
+            pages = metrics.SYNC_PAGES.labels(resource)
+
+            async def fetch(page: int) -> dict:
+                started = time.perf_counter()
+                data = await list_fn(token_db, since, page)
+                fetch_seconds.observe(time.perf_counter() - started)
+                pages.inc()
+                progress.page_fetched(data)
+                if page == 1:
+                    _check_modified_filter(resource, since, _page_items(data, resource))
+                return data
+            return fetch
 
         # 1) Reports (build mapping for expense.report_id)
-        page = 1
-        reports_count = 0
-        while True:
-            data = _run_async(list_reports(db, since, page))
-            items = (data.get("reports") or data.get("data") or [])
+        reports_cp = _load_checkpoint(db, "reports", legacy_cursor)
+
+        report_counts = UpsertCounts()
+        reports_pass = PassTracker("report_id")
+
+        def write_reports(page: int, data: dict) -> int:
+            items = _page_items(data, "reports")
+            count = 0
             for it in items:
-                rid = upsert_report(db, it)
+                rid = upsert_report(db, it, report_counts)
                 if rid:
                     key = str(it.get("report_id") or it.get("id"))
                     if key:
                         report_map[key] = rid
-                reports_count += 1
-            if not data or not data.get("has_more"):
-                break
-            page += 1
+                count += 1
+            reports_pass.add(items)
+            _checkpoint_page(db, reports_cp, page, items)
+            progress.rows_written(count)
+            return count
+
+        progress.start("reports")
+        reports_count = _run_async(_run_pipeline(
+            fetching(list_reports, reports_cp.since, "reports"), write_reports,
+        ))
+        _finish_checkpoint(db, reports_cp, reports_pass.hold_back)
+        metrics.record_sync_rows("reports", report_counts.to_dict())
+        # Report titles are part of their expenses' search_vector
+        refresh_search_vectors(db, zoho_report_ids=report_counts.changed)
 
         # 2) Expenses
-        page = 1
-        expenses_count = 0
-        new_cursor = _now_utc()
-        while True:
-            data = _run_async(list_expenses(db, since, page))
-            items = (data.get("expenses") or data.get("data") or [])
-            for it in items:
-                upsert_expense(db, it, report_map)
-                expenses_count += 1
-            if not data or not data.get("has_more"):
-                break
-            page += 1
+        expenses_cp = _load_checkpoint(db, "expenses", legacy_cursor)
+
+        expense_counts = UpsertCounts()
+        expenses_pass = PassTracker("expense_id")
+
+        def write_expenses(page: int, data: dict) -> int:
+            items = _page_items(data, "expenses")
+            # Reports synced by earlier (or resumed) runs are only in the database
+            report_map.update(_report_map_for(
+                db, [it for it in items if it.get("report_id") and str(it["report_id"]) not in report_map]
+            ))
+            counts = upsert_expenses(db, items, report_map, lookups, touched_days=touched_days, rates=rates)
+            expense_counts.add(counts)
+            count = counts.processed
+            expenses_pass.add(items)
+            _checkpoint_page(db, expenses_cp, page, items)
+            progress.rows_written(count)
+            return count
 
-        _set_sync_state(db, "success", new_cursor, f"Synced {reports_count} reports, {expenses_count} expenses")
+        progress.start("expenses")
+        expenses_count = _run_async(_run_pipeline(
+            fetching(list_expenses, expenses_cp.since, "expenses"), write_expenses,
+        ))
+        _finish_checkpoint(db, expenses_cp, expenses_pass.hold_back)
+        metrics.record_sync_rows("expenses", expense_counts.to_dict())
+        # Refresh even without changes on a new day, so the ageing buckets
+        # keep moving through quiet periods
+        changed = bool(report_counts.changed or expense_counts.changed) or aggregates_outdated(db)
+        if changed:
+            progress.start("aggregates")
+            try_refresh_aggregates(db, touched_days)
+        progress.start("attachments")
+        attachment_counts = mirror_attachments(db, token_db)
+        progress.start("done")
+
+        new_cursor = _utc(expenses_cp.cursor)
+        _set_sync_state(
+            db, "success", new_cursor,
+            f"Synced {reports_count} reports, {expenses_count} expenses "
+            f"({expense_counts.inserted} new, {expense_counts.updated} updated, "
+            f"{expense_counts.unchanged} unchanged)",
+        )
+        if changed:
+            report_cache.invalidate()
         return {
             "status": "success",
             "reports_synced": reports_count,
             "expenses_synced": expenses_count,
-            "cursor": new_cursor.isoformat()
+            "reports": report_counts.to_dict(),
+            "expenses": expense_counts.to_dict(),
+            "attachments": attachment_counts,
+            "cursor": new_cursor.isoformat() if new_cursor else None,
         }
 
     except Exception as e:
+        db.rollback()
         _set_sync_state(db, "error", _get_cursor(db), str(e))
         return {"status": "error", "message": str(e)}
     finally:
-        _unlock(db)
\ No newline at end of file
+        token_db.close()
+        _unlock(lock_conn)
+        lock_conn.close()
+
+def run_sync_job(progress: Optional[SyncProgress] = None):
+    """Entry point for the sync worker: one short-lived session per run."""
+    db = SessionLocal()
+    try:
+        with metrics.sync_run() as outcome:
+            outcome["result"] = run_sync(db, progress)
+        return outcome["result"]
+    finally:
+        db.close()
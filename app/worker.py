@@ -0,0 +1,36 @@
+# Dedicated worker thread for the blocking sync engine, kept off the API event loop
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+class SyncWorker:
+    """
+    Single long-lived thread that runs sync jobs one at a time. The thread
+    owns its own event loop (see app.sync._run_async), so Zoho calls and DB
+    writes never block uvicorn's loop.
+    """
+
+    def __init__(self):
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def start(self):
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="sync-worker")
+
+    def submit(self, fn: Callable[..., Any], *args, **kwargs) -> Future:
+        self.start()
+        return self._executor.submit(fn, *args, **kwargs)
+
+    async def run(self, fn: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    def shutdown(self, cleanup: Optional[Callable[[], Any]] = None):
+        """Stop accepting work; `cleanup` runs on the worker thread after queued jobs."""
+        if self._executor is None:
+            return
+        if cleanup is not None:
+            self._executor.submit(cleanup)
+        self._executor.shutdown(wait=False)
+        self._executor = None
+
+sync_worker = SyncWorker()
@@ -1,21 +1,319 @@
+import asyncio
+import importlib.util
+import logging
+import random
+import threading
+import time
+import weakref
 import httpx
-from datetime import datetime, timedelta
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from email.utils import parsedate_to_datetime
 from sqlalchemy.orm import Session
 from app.config import settings
 from app.models import OAuthCredentials
 from app.utils import decrypt, encrypt
 
+logger = logging.getLogger(__name__)
+
 ACCOUNTS_BASE = settings.ZOHO_ACCOUNTS_BASE.rstrip('/')
 API_BASE = settings.ZOHO_BASE.rstrip('/')
+PROVIDER = "zoho_expense"
+TOKEN_REFRESH_MARGIN = timedelta(seconds=120)
+
+# ---------- Shared HTTP client ----------
+
+# One pooled client per event loop: httpx connections cannot cross loops
+_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = weakref.WeakKeyDictionary()
+
+def _build_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        timeout=settings.ZOHO_HTTP_TIMEOUT,
+        http2=settings.ZOHO_HTTP2 and importlib.util.find_spec("h2") is not None,
+        limits=httpx.Limits(
+            max_connections=settings.ZOHO_MAX_CONNECTIONS,
+            max_keepalive_connections=settings.ZOHO_MAX_KEEPALIVE_CONNECTIONS,
+            keepalive_expiry=settings.ZOHO_KEEPALIVE_EXPIRY,
+        ),
+    )
+
+def get_client() -> httpx.AsyncClient:
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.is_closed:
+        client = _clients[loop] = _build_client()
+    return client
+
+async def open_client():
+    get_client()
+
+async def close_client():
+    client = _clients.pop(asyncio.get_running_loop(), None)
+    if client is not None:
+        await client.aclose()
+
+# ---------- Rate limiting, retries and telemetry ----------
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds, histogram upper bounds
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_sleep = asyncio.sleep  # indirection so tests can skip real waits
+
+class ZohoUnavailable(RuntimeError):
+    """Raised without calling Zoho while the circuit breaker is open."""
+
+class ZohoTelemetry:
+    """Process-wide counters and a latency histogram for Zoho API calls."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.counters = Counter()  # requests, throttles, retries, failures, rejected
+            self.statuses = Counter()
+            self.latency_buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+            self.latency_sum = 0.0
+            self.rate_limit_wait_seconds = 0.0
+
+    def count(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] += n
+
+    def waited(self, seconds: float):
+        with self._lock:
+            self.rate_limit_wait_seconds += seconds
+
+    def observe(self, status: int | str, seconds: float):
+        with self._lock:
+            self.counters["requests"] += 1
+            self.statuses[str(status)] += 1
+            self.latency_sum += seconds
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.latency_buckets[i] += 1
+                    break
+            else:
+                self.latency_buckets[-1] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, n in zip((*map(str, LATENCY_BUCKETS), "+Inf"), self.latency_buckets):
+                running += n
+                cumulative[bound] = running
+            return {
+                **{k: self.counters[k] for k in ("requests", "throttles", "retries", "failures", "rejected")},
+                "statuses": dict(self.statuses),
+                "latency_seconds": {"buckets": cumulative, "sum": round(self.latency_sum, 6), "count": running},
+                "rate_limit_wait_seconds": round(self.rate_limit_wait_seconds, 3),
+                "circuit": breaker.state,
+            }
+
+class TokenBucket:
+    """
+    Paces requests to `rate_per_minute` with bursts up to `burst`. Shared by
+    every event loop in the process. A 429 pauses the whole bucket for the
+    server's Retry-After, so concurrent callers back off together.
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token (possibly on credit); returns how long to wait before using it."""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    async def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            telemetry.waited(wait)
+            await _sleep(wait)
+
+    def pause(self, seconds: float):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive failed requests (5xx / transport
+    errors left after all retries) and rejects calls for `reset_after`
+    seconds; then lets a single trial request through (half-open) and
+    closes again on success. Callers report each request's outcome once.
+    """
+
+    def __init__(self, threshold: int, reset_after: float):
+        self.threshold = threshold
+        self.reset_after = reset_after
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_after:
+                    return False
+                self.state = "half_open"
+            if self.state == "half_open":
+                # One trial at a time; everyone else fails fast until it resolves
+                if self._probing:
+                    return False
+                self._probing = True
+            return True
+
+    def success(self):
+        with self._lock:
+            self.state = "closed"
+            self._failures = 0
+            self._probing = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            self._probing = False
+            if self.state == "half_open" or self._failures >= self.threshold:
+                if self.state != "open":
+                    logger.warning("Zoho circuit breaker open after %d failed requests", self._failures)
+                self.state = "open"
+                self._opened_at = time.monotonic()
+
+    def release(self):
+        """A request ended without a verdict (throttled, cancelled): free the trial slot."""
+        with self._lock:
+            self._probing = False
+
+telemetry = ZohoTelemetry()
+bucket = TokenBucket(settings.ZOHO_RATE_LIMIT_PER_MINUTE, settings.ZOHO_RATE_LIMIT_BURST)
+breaker = CircuitBreaker(settings.ZOHO_CIRCUIT_FAILURE_THRESHOLD, settings.ZOHO_CIRCUIT_RESET_SECONDS)
+
+def _retry_after(response: httpx.Response) -> float | None:
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+def _backoff(attempt: int) -> float:
+    """Exponential backoff with full jitter."""
+    ceiling = min(settings.ZOHO_BACKOFF_MAX_SECONDS, settings.ZOHO_BACKOFF_BASE_SECONDS * 2 ** attempt)
+    return random.uniform(0, ceiling)
+
+async def _request(method: str, url: str, stream: bool = False, **kwargs) -> httpx.Response:
+    """
+    Send a Zoho request through the rate limiter and circuit breaker,
+    retrying 429 / 5xx / transport errors with backoff (Retry-After wins
+    when the server sends one). Non-retryable responses, including 4xx,
+    are returned to the caller as-is. With `stream` the body is left unread
+    and the caller must `aclose()` the response.
+    """
+    # The breaker sees one outcome per request, not per attempt: a request's
+    # own retries neither trip it nor get cut short by it
+    if not breaker.allow():
+        telemetry.count("rejected")
+        raise ZohoUnavailable("Zoho API circuit breaker is open")
+    judged = False
+    try:
+        for attempt in range(settings.ZOHO_MAX_RETRIES + 1):
+            await bucket.acquire()
+
+            started = time.monotonic()
+            client = get_client()
+            try:
+                if stream:
+                    response = await client.send(client.build_request(method, url, **kwargs), stream=True)
+                else:
+                    response = await client.request(method, url, **kwargs)
+            except httpx.TransportError as e:
+                telemetry.observe("error", time.monotonic() - started)
+                if attempt == settings.ZOHO_MAX_RETRIES:
+                    telemetry.count("failures")
+                    breaker.failure()
+                    judged = True
+                    raise
+                delay = _backoff(attempt)
+                logger.info("Zoho %s %s failed (%s), retrying in %.1fs", method, url, e, delay)
+            else:
+                telemetry.observe(response.status_code, time.monotonic() - started)
+                if response.status_code not in RETRY_STATUSES:
+                    breaker.success()
+                    judged = True
+                    return response
+                if response.status_code == 429:
+                    telemetry.count("throttles")
+                if attempt == settings.ZOHO_MAX_RETRIES:
+                    telemetry.count("failures")
+                    if response.status_code != 429:  # throttling says nothing about Zoho's health
+                        breaker.failure()
+                        judged = True
+                    return response
+                if stream:
+                    await response.aclose()
+                delay = _retry_after(response)
+                if delay is None:
+                    delay = _backoff(attempt)
+                logger.info("Zoho %s %s returned %d, retrying in %.1fs", method, url, response.status_code, delay)
+                if response.status_code == 429:
+                    # Throttling is account-wide: hold every caller, this retry waits in acquire()
+                    bucket.pause(delay)
+                    telemetry.count("retries")
+                    continue
+            telemetry.count("retries")
+            await _sleep(delay)
+    finally:
+        if not judged:
+            breaker.release()
+
+# ---------- Access token cache ----------
+
+# provider -> (decrypted access token, expires_at)
+_token_cache: dict[str, tuple[str, datetime]] = {}
+
+def _as_utc(dt: datetime) -> datetime:
+    return dt.replace(tzinfo=timezone.utc) if dt.tzinfo is None else dt
+
+def _expiring(expires_at: datetime | None) -> bool:
+    if not expires_at:
+        return False
+    return _as_utc(expires_at) - datetime.now(timezone.utc) < TOKEN_REFRESH_MARGIN
+
+def invalidate_token_cache():
+    _token_cache.clear()
 
 async def get_valid_token(db: Session) -> str:
-    cred = db.query(OAuthCredentials).filter_by(provider="zoho_expense").first()
+    cached = _token_cache.get(PROVIDER)
+    if cached and not _expiring(cached[1]):
+        return cached[0]
+    cred = db.query(OAuthCredentials).filter_by(provider=PROVIDER).first()
     if not cred:
         raise RuntimeError("Zoho OAuth not configured")
     # refresh if about to expire
-    if cred.expires_at and (cred.expires_at - datetime.utcnow()).total_seconds() < 120:
+    if _expiring(cred.expires_at):
         await refresh_token(db, cred)
-    return decrypt(cred.access_token)
+    token = decrypt(cred.access_token)
+    if cred.expires_at:
+        _token_cache[PROVIDER] = (token, cred.expires_at)
+    return token
 
 async def refresh_token(db: Session, cred: OAuthCredentials):
     token_url = f"{ACCOUNTS_BASE}/oauth/v2/token"
@@ -25,37 +323,65 @@ async def refresh_token(db: Session, cred: OAuthCredentials):
         "client_secret": settings.ZOHO_CLIENT_SECRET,
         "refresh_token": decrypt(cred.refresh_token),
     }
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.post(token_url, data=data)
-        r.raise_for_status()
-        payload = r.json()
+    r = await _request("POST", token_url, data=data)
+    r.raise_for_status()
+    payload = r.json()
     new_access = payload["access_token"]
     expires_in = int(payload.get("expires_in", 3600))
     cred.access_token = encrypt(new_access)
-    cred.expires_at = datetime.utcnow() + timedelta(seconds=expires_in)
+    cred.expires_at = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
     db.commit()
+    _token_cache[PROVIDER] = (new_access, cred.expires_at)
+
+# ---------- API calls ----------
 
 async def list_expenses(db: Session, modified_after: datetime | None = None, page: int = 1, per_page: int = 200):
     token = await get_valid_token(db)
     headers = {"Authorization": f"Zoho-oauthtoken {token}"}
-    params = {"page": page, "per_page": per_page}
-    # NOTE: adjust query params to match Zoho Expense API filters for modified_time if available
+    # Oldest change first: an interrupted pass resumes from the newest modified time it committed (app.sync)
+    params = {"page": page, "per_page": per_page, "sort_column": "last_modified_time", "sort_order": "A"}
+    # Not a documented Zoho Expense filter: app.sync logs a warning when it
+    # has no effect, which turns incremental passes into full re-reads
     if modified_after:
         params["modified_time"] = modified_after.isoformat()
     url = f"{API_BASE}/expense/v1/expenses"
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(url, params=params, headers=headers)
-        r.raise_for_status()
-        return r.json()
+    r = await _request("GET", url, params=params, headers=headers)
+    r.raise_for_status()
+    return r.json()
 
 async def list_reports(db: Session, modified_after: datetime | None = None, page: int = 1, per_page: int = 200):
     token = await get_valid_token(db)
     headers = {"Authorization": f"Zoho-oauthtoken {token}"}
-    params = {"page": page, "per_page": per_page}
+    params = {"page": page, "per_page": per_page, "sort_column": "last_modified_time", "sort_order": "A"}
     if modified_after:
         params["modified_time"] = modified_after.isoformat()
     url = f"{API_BASE}/expense/v1/reports"
-    async with httpx.AsyncClient(timeout=30) as client:
-        r = await client.get(url, params=params, headers=headers)
-        r.raise_for_status()
-        return r.json()
+    r = await _request("GET", url, params=params, headers=headers)
+    r.raise_for_status()
+    return r.json()
+
+async def _get_record(db: Session, path: str, key: str) -> dict | None:
+    token = await get_valid_token(db)
+    headers = {"Authorization": f"Zoho-oauthtoken {token}"}
+    r = await _request("GET", f"{API_BASE}/expense/v1/{path}", headers=headers)
+    if r.status_code == 404:
+        return None
+    r.raise_for_status()
+    return r.json().get(key)
+
+async def get_expense(db: Session, expense_id: str) -> dict | None:
+    """Single expense, or None if it no longer exists."""
+    return await _get_record(db, f"expenses/{expense_id}", "expense")
+
+async def get_report(db: Session, report_id: str) -> dict | None:
+    """Single report, or None if it no longer exists."""
+    return await _get_record(db, f"reports/{report_id}", "report")
+
+async def open_receipt(db: Session, expense_id: str, document_id: str | None = None) -> httpx.Response:
+    """Receipt file of an expense as an unread streaming response; the caller must aclose() it."""
+    token = await get_valid_token(db)
+    headers = {"Authorization": f"Zoho-oauthtoken {token}"}
+    # Without a document id Zoho returns the expense's primary receipt
+    params = {"document_id": document_id} if document_id else None
+    url = f"{API_BASE}/expense/v1/expenses/{expense_id}/receipt"
+    return await _request("GET", url, stream=True, params=params, headers=headers)
@@ -36,7 +36,7 @@ export default function Dashboard() {
 
     try {
       const res = await triggerSync();
-      setSyncMsg(`✅ Sync completed: ${res.expenses_synced || 0} expenses processed`);
+      setSyncMsg(`✅ ${res.message || 'Sync started'}`);
       // Refresh data after sync
       mutateExpenses();
     } catch (e: any) {
@@ -89,7 +89,7 @@ export default function Dashboard() {
       <div className="grid md:grid-cols-3 gap-4">
         <PieCard title="Spend by Category" data={byCategory || []} nameKey="category" valueKey="total" />
         <BarCard title="Top Merchants" data={byMerchant || []} xKey="merchant" yKey="total" />
-        <LineCard title="Spending Trend" data={trends || []} xKey="date" yKey="total" />
+        <LineCard title="Spending Trend" data={trends || []} xKey="period" yKey="total" />
       </div>
 
       {/* Reconciliation */}
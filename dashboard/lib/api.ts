@@ -1,7 +1,8 @@
 export const API_BASE = process.env.NEXT_PUBLIC_API_BASE || "http://localhost:8000";
 
 async function get<T>(path: string): Promise<T> {
-  const res = await fetch(`${API_BASE}${path}`, { cache: "no-store" });
+  // "no-cache" revalidates with ETag / Last-Modified, so unchanged reports come back as 304s
+  const res = await fetch(`${API_BASE}${path}`, { cache: "no-cache" });
   if (!res.ok) throw new Error(`GET ${path} failed: ${res.status}`);
   return res.json();
 }
@@ -36,17 +37,27 @@ export async function fetchAgeing() {
   return get(`/reports/ageing`);
 }
 
-// Analytics endpoints for charts
+// Analytics endpoints for charts (columnar JSON: {data: {column: values[]}})
+type Columnar = { data: Record<string, any[]> };
+
+function toRows<T>(payload: Columnar): T[] {
+  const columns = Object.keys(payload.data);
+  const n = columns.length ? payload.data[columns[0]].length : 0;
+  return Array.from({ length: n }, (_, i) =>
+    Object.fromEntries(columns.map((c) => [c, payload.data[c][i]])) as T
+  );
+}
+
 export async function fetchByCategory() {
-  return get<{category:string; total:number;}[]>(`/reports/by_category`);
+  return toRows<{category:string; total:number;}>(await get<Columnar>(`/reports/by_category`));
 }
 
 export async function fetchByMerchant() {
-  return get<{merchant:string; total:number;}[]>(`/reports/by_merchant`);
+  return toRows<{merchant:string; total:number;}>(await get<Columnar>(`/reports/by_merchant`));
 }
 
 export async function fetchTrends() {
-  return get<{date:string; total:number;}[]>(`/reports/trends`);
+  return toRows<{period:string; total:number;}>(await get<Columnar>(`/reports/trends`));
 }
 
 // Secure endpoints via Next.js API routes
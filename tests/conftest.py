@@ -1,4 +1,6 @@
 import os
+import re
+
 import pytest
 from fastapi.testclient import TestClient
 from app.main import app
@@ -13,4 +15,23 @@ def client():
     os.environ.setdefault("ENCRYPTION_KEY", "test_key_32_chars_long_exactly!!")
     os.environ.setdefault("APP_BASE_URL", "http://localhost:8000")
 
-    return TestClient(app)
\ No newline at end of file
+    return TestClient(app)
+
+SERVER_TIMING_STATEMENTS = re.compile(r'db;dur=[\d.]+;desc="(\d+) statements"')
+
+@pytest.fixture
+def assert_max_queries(client):
+    """
+    Send a request with X-Query-Profile on and assert on the SQL statement
+    count app.profiling reports in its Server-Timing header:
+    assert_max_queries("GET", "/reports/summary", 1)
+    """
+    def request(method, url, max_statements, **kwargs):
+        headers = {**kwargs.pop("headers", {}), "X-Query-Profile": "1"}
+        r = client.request(method, url, headers=headers, **kwargs)
+        match = SERVER_TIMING_STATEMENTS.search(r.headers.get("server-timing", ""))
+        assert match, f"{method} {url} returned no Server-Timing statement count"
+        count = int(match.group(1))
+        assert count <= max_statements, f"{method} {url} ran {count} SQL statements (max {max_statements})"
+        return r
+    return request
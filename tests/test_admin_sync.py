@@ -14,25 +14,28 @@ def test_admin_sync_rejects_invalid_token(client):
 
 def test_admin_sync_accepts_valid_header(client, monkeypatch):
     """Test admin sync endpoint accepts valid token in header"""
-    def fake_run_sync(db):  # Mock to avoid hitting DB/Zoho
+    def fake_run_sync_job(progress=None):  # Mock to avoid hitting DB/Zoho
         return {"status": "success", "reports_synced": 0, "expenses_synced": 0}
 
     from app.routers import expenses as mod
-    monkeypatch.setattr(mod, "run_sync", fake_run_sync)
+    monkeypatch.setattr(mod, "run_sync_job", fake_run_sync_job)
+    monkeypatch.setattr(mod, "sync_lock_held", lambda db: False)
 
     r = client.post("/expenses/admin/sync", headers={"x-admin-token": "test-admin"})
     assert r.status_code == 200
     body = r.json()
     assert body["ok"] is True
     assert "message" in body
+    assert "job_id" in body
 
 def test_admin_sync_rate_limiting(client, monkeypatch):
     """Test admin sync endpoint is rate limited"""
-    def fake_run_sync(db):
+    def fake_run_sync_job(progress=None):
         return {"status": "success", "reports_synced": 0, "expenses_synced": 0}
 
     from app.routers import expenses as mod
-    monkeypatch.setattr(mod, "run_sync", fake_run_sync)
+    monkeypatch.setattr(mod, "run_sync_job", fake_run_sync_job)
+    monkeypatch.setattr(mod, "sync_lock_held", lambda db: False)
 
     # Make multiple rapid requests to trigger rate limit
     for _ in range(12):  # Limit is 10/minute
@@ -40,4 +43,50 @@ def test_admin_sync_rate_limiting(client, monkeypatch):
 
     # This should be rate limited
     r = client.post("/expenses/admin/sync", headers={"x-admin-token": "test-admin"})
-    assert r.status_code == 429  # Rate limited
\ No newline at end of file
+    assert r.status_code == 429  # Rate limited
+
+def test_admin_sync_status_unknown_job(client, monkeypatch):
+    """Test polling an unknown sync job returns 404"""
+    from app.config import settings
+    monkeypatch.setattr(settings, "ADMIN_TOKEN", "test-admin")
+
+    r = client.get("/expenses/admin/sync/does-not-exist", headers={"x-admin-token": "test-admin"})
+    assert r.status_code == 404
+
+def test_admin_sync_status_requires_token(client):
+    """Test sync job status is admin-only"""
+    r = client.get("/expenses/admin/sync/anything", headers={"x-admin-token": "wrong-token"})
+    assert r.status_code == 401
+
+def test_sync_jobs_dedupe_and_report_progress():
+    """Test repeated enqueues share one job and progress is reported"""
+    import threading
+    from app.jobs import SyncJobQueue
+    from app.worker import SyncWorker
+
+    release = threading.Event()
+
+    def fake_run(progress):
+        progress.start("expenses")
+        progress.page_fetched({"page_context": {"total": 400}})
+        progress.rows_written(200)
+        release.wait(5)
+        return {"status": "success"}
+
+    worker = SyncWorker()
+    jobs = SyncJobQueue(worker)
+    try:
+        first, created = jobs.enqueue(fake_run)
+        second, created_again = jobs.enqueue(fake_run)
+        assert created and not created_again
+        assert second is first
+
+        release.set()
+        worker.submit(lambda: None).result(5)  # drain the worker
+        status = jobs.get(first.id).to_dict()
+        assert status["status"] == "success"
+        assert status["progress"]["pages_fetched"] == 1
+        assert status["progress"]["rows_upserted"] == 200
+        assert status["progress"]["rows_expected"] == 400
+    finally:
+        worker.shutdown()
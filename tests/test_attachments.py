@@ -0,0 +1,152 @@
+import asyncio
+import hashlib
+
+import httpx
+import pytest
+
+from app import attachments
+from app.db import get_db
+from app.main import app
+from app.models import Attachment
+
+
+async def _chunks(*parts):
+    for p in parts:
+        yield p
+
+
+def test_store_is_content_addressed_and_dedupes(tmp_path):
+    """Test streamed files are stored under their SHA-256 once, with no temp files left"""
+    store = attachments.AttachmentStore(str(tmp_path))
+    digest, size = asyncio.run(store.save_stream(_chunks(b"receipt ", b"bytes")))
+
+    assert digest == hashlib.sha256(b"receipt bytes").hexdigest() and size == 13
+    path = store.path_for(digest)
+    assert path.read_bytes() == b"receipt bytes"
+    assert path.parent == tmp_path / digest[:2] / digest[2:4]
+    assert asyncio.run(store.save_stream(_chunks(b"receipt bytes"))) == (digest, 13)
+    assert list((tmp_path / "tmp").iterdir()) == []
+
+
+def test_documents_fall_back_to_primary_receipt():
+    """Test Zoho documents become attachment rows and a bare receipt flag maps to ''"""
+    rows = attachments._documents({"documents": [{"document_id": 7, "file_name": "a.pdf", "file_size": 10}]})
+    assert rows == [{"zoho_file_id": "7", "filename": "a.pdf", "mime_type": None, "size_bytes": 10}]
+    assert attachments._documents({"has_attachment": True})[0]["zoho_file_id"] == ""
+    assert attachments._documents({"merchant": "x"}) == []
+
+
+def test_download_attachments_bounds_concurrency(tmp_path, monkeypatch):
+    """Test downloads stream to the store with a bounded number in flight and report failures"""
+    in_flight = []
+    peak = []
+
+    async def fake_open(db, expense_id, document_id=None):
+        in_flight.append(expense_id)
+        peak.append(len(in_flight))
+        await asyncio.sleep(0)
+        in_flight.remove(expense_id)
+        request = httpx.Request("GET", "https://zoho.test/receipt")
+        if expense_id == "bad":
+            return httpx.Response(404, request=request)
+        return httpx.Response(200, content=f"file-{expense_id}".encode(),
+                              headers={"content-type": "image/png"}, request=request)
+
+    monkeypatch.setattr(attachments, "open_receipt", fake_open)
+    pending = [{"id": i, "zoho_file_id": "", "zoho_expense_id": z} for i, z in enumerate(["a", "b", "bad", "c"])]
+    store = attachments.AttachmentStore(str(tmp_path))
+
+    stored, failed = asyncio.run(attachments.download_attachments(None, pending, concurrency=2, target=store))
+
+    assert max(peak) <= 2
+    assert failed == [2]
+    assert [r["id"] for r in stored] == [0, 1, 3]
+    assert stored[0]["mime"] == "image/png" and stored[0]["size"] == 6
+    assert store.path_for(stored[0]["sha"]).read_bytes() == b"file-a"
+
+
+def test_parse_range():
+    """Test single byte ranges, suffix ranges and unsatisfiable ranges"""
+    assert attachments.parse_range(None, 100) is None
+    assert attachments.parse_range("bytes=0-9", 100) == (0, 9)
+    assert attachments.parse_range("bytes=90-", 100) == (90, 99)
+    assert attachments.parse_range("bytes=-10", 100) == (90, 99)
+    assert attachments.parse_range("bytes=95-200", 100) == (95, 99)
+    assert attachments.parse_range("bytes=0-1,5-6", 100) is None
+    with pytest.raises(ValueError):
+        attachments.parse_range("bytes=100-", 100)
+
+
+class _AttachmentSession:
+    def __init__(self, att):
+        self.att = att
+
+    def query(self, model):
+        return self
+
+    def filter(self, *conditions):
+        return self
+
+    def first(self):
+        return self.att
+
+
+@pytest.fixture
+def stored_receipt(tmp_path, monkeypatch):
+    store = attachments.AttachmentStore(str(tmp_path))
+    digest, _ = asyncio.run(store.save_stream(_chunks(b"0123456789")))
+    monkeypatch.setattr(attachments, "store", store)
+    att = Attachment(id=3, expense_id=1, filename="r.pdf", mime_type="application/pdf", content_sha256=digest)
+    app.dependency_overrides[get_db] = lambda: _AttachmentSession(att)
+    yield digest
+    app.dependency_overrides.pop(get_db, None)
+
+
+def test_get_attachment_serves_ranges(client, stored_receipt):
+    """Test receipts are served whole, by byte range (206) and 416 past the end"""
+    r = client.get("/expenses/1/attachments/3")
+    assert r.status_code == 200 and r.content == b"0123456789"
+    assert r.headers["etag"] == f'"{stored_receipt}"'
+    assert r.headers["accept-ranges"] == "bytes"
+
+    r = client.get("/expenses/1/attachments/3", headers={"Range": "bytes=2-5"})
+    assert r.status_code == 206 and r.content == b"2345"
+    assert r.headers["content-range"] == "bytes 2-5/10"
+    assert r.headers["content-length"] == "4"
+
+    r = client.get("/expenses/1/attachments/3", headers={"Range": "bytes=2-5", "If-Range": '"stale"'})
+    assert r.status_code == 200
+
+    r = client.get("/expenses/1/attachments/3", headers={"Range": "bytes=20-"})
+    assert r.status_code == 416 and r.headers["content-range"] == "bytes */10"
+
+
+def test_range_response_streams_multi_chunk_ranges(tmp_path):
+    """Test a range spanning several chunks is sent chunk by chunk, exactly"""
+    path = tmp_path / "receipt.bin"
+    data = bytes(range(256)) * 40
+    path.write_bytes(data)
+    response = attachments.RangeFileResponse(path, (100, 9000), path.stat())
+    response.chunk_size = 1024
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(response({"type": "http", "method": "GET", "headers": []}, None, send))
+    start, *bodies = sent
+    assert start["status"] == 206
+    assert (b"content-range", b"bytes 100-9000/10240") in start["headers"]
+    chunks = [m["body"] for m in bodies if m["body"]]
+    assert len(chunks) == 9 and max(map(len, chunks)) == 1024
+    assert b"".join(chunks) == data[100:9001]
+    assert bodies[-1] == {"type": "http.response.body", "body": b"", "more_body": False}
+
+
+def test_get_attachment_not_mirrored(client):
+    """Test an attachment without a stored file is a 404"""
+    app.dependency_overrides[get_db] = lambda: _AttachmentSession(Attachment(id=3, expense_id=1))
+    try:
+        assert client.get("/expenses/1/attachments/3").status_code == 404
+    finally:
+        app.dependency_overrides.pop(get_db, None)
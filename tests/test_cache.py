@@ -0,0 +1,70 @@
+from starlette.requests import Request
+
+from app.cache import MemoryBackend, ResponseCache
+
+
+def _request(path="/reports/summary", query=b"", headers=()):
+    return Request({
+        "type": "http",
+        "method": "GET",
+        "path": path,
+        "query_string": query,
+        "headers": [(k.lower().encode(), v.encode()) for k, v in headers],
+    })
+
+
+def test_report_cache_serves_hits_without_recomputing():
+    """Test repeated requests reuse the cached body until invalidated"""
+    calls = []
+    cache = ResponseCache(MemoryBackend(maxsize=8), ttl=60)
+
+    def compute():
+        calls.append(1)
+        return {"by_currency": [{"currency": "USD", "n": len(calls)}]}
+
+    first = cache.respond(_request(), compute)
+    second = cache.respond(_request(), compute)
+    assert len(calls) == 1
+    assert first.body == second.body
+    assert first.headers["etag"] == second.headers["etag"]
+
+    cache.invalidate()
+    third = cache.respond(_request(), compute)
+    assert len(calls) == 2
+    assert third.headers["etag"] != first.headers["etag"]
+
+
+def test_report_cache_keys_on_query_params():
+    """Test different query parameters are cached separately"""
+    calls = []
+    cache = ResponseCache(MemoryBackend(maxsize=8), ttl=60)
+    cache.respond(_request(query=b"from_=2025-01-01"), lambda: calls.append(1) or {})
+    cache.respond(_request(query=b"from_=2025-02-01"), lambda: calls.append(1) or {})
+    assert len(calls) == 2
+
+
+def test_report_cache_conditional_get_returns_304():
+    """Test If-None-Match / If-Modified-Since revalidation"""
+    cache = ResponseCache(MemoryBackend(maxsize=8), ttl=60)
+    first = cache.respond(_request(), lambda: {"ok": True})
+
+    etag = first.headers["etag"]
+    assert cache.respond(_request(headers=[("If-None-Match", etag)]), dict).status_code == 304
+    assert cache.respond(_request(headers=[("If-None-Match", '"stale"')]), dict).status_code == 200
+
+    last_modified = first.headers["last-modified"]
+    assert cache.respond(_request(headers=[("If-Modified-Since", last_modified)]), dict).status_code == 304
+
+
+def test_memory_backend_expires_and_evicts():
+    """Test entries honour both the TTL and the LRU bound"""
+    backend = MemoryBackend(maxsize=2)
+    backend.set("a", {"v": 1}, ttl=60)
+    backend.set("b", {"v": 2}, ttl=60)
+    backend.get("a")
+    backend.set("c", {"v": 3}, ttl=60)
+    assert backend.get("b") is None
+    assert backend.get("a") == {"v": 1}
+
+    backend.set("d", {"v": 4}, ttl=-1)
+    assert backend.get("d") is None
@@ -0,0 +1,94 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import fx
+
+
+def _rates():
+    rates = fx.FxRates("USD")
+    rates.add("EUR", date(2025, 1, 10), Decimal("1.10"))
+    rates.add("EUR", date(2025, 1, 1), Decimal("1.05"))
+    rates.add("eur", date(2025, 1, 10), Decimal("1.08"))  # same day replaces
+    return rates
+
+
+def test_rate_is_as_of_latest_earlier_day():
+    """Test lookups use the latest rate on or before the date and none before the first"""
+    rates = _rates()
+    assert len(rates) == 2
+    assert rates.rate("EUR", date(2025, 1, 1)) == Decimal("1.05")
+    assert rates.rate("EUR", "2025-01-09") == Decimal("1.05")
+    assert rates.rate("eur", date(2025, 2, 1)) == Decimal("1.08")
+    assert rates.rate("EUR", date(2024, 12, 31)) is None
+    assert rates.rate("GBP", date(2025, 1, 5)) is None
+    assert rates.rate("usd", None) == Decimal(1)
+
+
+def test_convert_rounds_to_cents():
+    """Test conversion multiplies by the as-of rate and rounds to cents"""
+    rates = _rates()
+    assert rates.convert(10.01, "EUR", "2025-01-02") == Decimal("10.51")
+    assert rates.convert("7", "USD", "2025-01-02") == Decimal("7.00")
+    assert rates.convert(None, "EUR", "2025-01-02") is None
+    assert rates.convert(5, "JPY", "2025-01-02") is None
+
+
+class _RowsSession:
+    def __init__(self, rows):
+        self.rows = rows
+        self.params = None
+
+    def execute(self, stmt, params=None):
+        self.params = params
+        return iter(self.rows)
+
+
+def test_load_prefers_direct_rates_and_inverts_the_rest():
+    """Test one query loads home-quoted rates and inverts home-based ones for other days"""
+    db = _RowsSession([
+        (date(2025, 1, 1), "EUR", "USD", Decimal("1.10")),
+        (date(2025, 1, 1), "USD", "EUR", Decimal("0.50")),  # shadowed by the direct rate
+        (date(2025, 1, 2), "USD", "EUR", Decimal("0.80")),
+    ])
+    rates = fx.FxRates.load(db, "usd")
+    assert db.params == {"home": "USD"}
+    assert rates.rate("EUR", date(2025, 1, 1)) == Decimal("1.10")
+    assert rates.rate("EUR", date(2025, 1, 2)) == Decimal("1.25")
+
+
+def test_parse_rates_csv_validates_rows():
+    """Test the CSV parser normalizes codes and rejects missing columns or bad rates"""
+    rows = list(fx.parse_rates_csv(io.StringIO("date,base_currency,quote_currency,rate\n2025-01-01,eur,usd,1.1\n")))
+    assert rows == [{"rate_date": date(2025, 1, 1), "base_currency": "EUR", "quote_currency": "USD", "rate": Decimal("1.1")}]
+
+    with pytest.raises(fx.FxCsvError, match="Missing columns: rate"):
+        list(fx.parse_rates_csv(io.StringIO("date,base_currency,quote_currency\n")))
+    with pytest.raises(fx.FxCsvError, match="Line 3"):
+        list(fx.parse_rates_csv(io.StringIO(
+            "date,base_currency,quote_currency,rate\n2025-01-01,EUR,USD,1.1\n2025-01-02,EUR,USD,0\n"
+        )))
+
+
+def test_load_rates_csv_upserts_in_batches(monkeypatch):
+    """Test rate files are written in multi-row batches with duplicates collapsed"""
+    batches = []
+    monkeypatch.setattr(fx, "_upsert_rates", lambda db, rows: batches.append(rows))
+
+    class _Session:
+        committed = False
+
+        def commit(self):
+            self.committed = True
+
+    db = _Session()
+    csv_text = (
+        "date,base_currency,quote_currency,rate\n"
+        "2025-01-01,EUR,USD,1.1\n2025-01-01,EUR,USD,1.15\n2025-01-02,EUR,USD,1.2\n2025-01-03,EUR,USD,1.3\n"
+    )
+    assert fx.load_rates_csv(db, io.StringIO(csv_text), batch_size=2) == 3
+    assert [len(b) for b in batches] == [2, 1]
+    assert batches[0][0]["rate"] == Decimal("1.15")
+    assert db.committed
@@ -0,0 +1,73 @@
+import asyncio
+import io
+from datetime import date
+
+import pytest
+
+from app.matching import match, normalize_merchant, trigram_matrix
+
+def test_normalize_merchant_strips_descriptors_and_suffixes():
+    assert normalize_merchant("UBER *TRIP") == "uber"
+    assert normalize_merchant("Uber BV") == "uber"
+    assert normalize_merchant("SQ *BLUE BOTTLE #123") == "blue bottle"
+    assert normalize_merchant("Starbucks Store 4521") == "starbucks"
+    assert normalize_merchant(None) == ""
+
+def test_normalize_merchant_strips_only_trailing_corporate_suffixes():
+    assert normalize_merchant("Co Op Cafe") == "co op cafe"
+    assert normalize_merchant("Inc Bar Co") == "inc bar"
+    assert normalize_merchant("Acme Co., Ltd.") == "acme"
+    assert normalize_merchant("Coop Co") == "coop"
+
+def test_trigram_matrix_rows_are_unit_length():
+    m = trigram_matrix(["uber", "", "blue bottle"])
+    assert abs((m[0] @ m[0]) - 1.0) < 1e-6
+    assert not m[1].any()
+
+def test_match_assigns_one_to_one_by_score():
+    rows = [
+        {"date": date(2025, 1, 2), "merchant": "UBER *TRIP", "amount": 12.75},
+        {"date": date(2025, 1, 3), "merchant": "STARBUCKS", "amount": 5.50},
+        {"date": date(2025, 1, 3), "merchant": "HILTON", "amount": 300.0},
+    ]
+    candidates = [
+        {"id": 10, "txn_date": date(2025, 1, 3), "merchant": "Starbucks Coffee", "amount": 5.50},
+        {"id": 11, "txn_date": date(2025, 1, 2), "merchant": "Uber BV", "amount": 12.80},
+        {"id": 12, "txn_date": date(2025, 1, 2), "merchant": "Uber BV", "amount": 12.75},
+    ]
+    proposals = match(rows, candidates)
+    assert [(p["row_index"], p["expense_id"]) for p in proposals] == [(0, 12), (1, 10)]
+
+def test_match_rejects_pairs_outside_tolerance_or_window():
+    rows = [{"date": date(2025, 1, 1), "merchant": "Uber", "amount": 10.0}]
+    assert match(rows, [{"id": 1, "txn_date": date(2025, 1, 1), "merchant": "Uber", "amount": 20.0}]) == []
+    assert match(rows, [{"id": 1, "txn_date": date(2025, 2, 1), "merchant": "Uber", "amount": 10.0}]) == []
+    assert match(rows, []) == []
+
+def test_auto_match_endpoint(client, monkeypatch):
+    import app.routers.recon as mod
+
+    seen = {}
+    def fake_candidates(db, date_from, date_to):
+        seen["window"] = (date_from, date_to)
+        return [{"id": 7, "txn_date": date(2025, 1, 1), "merchant": "Starbucks", "amount": 5.5}]
+
+    def off_loop_match(*args):
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()  # scoring must not block the event loop
+        seen["matched"] = True
+        return match(*args)
+
+    monkeypatch.setattr(mod, "load_match_candidates", fake_candidates)
+    monkeypatch.setattr(mod, "match", off_loop_match)
+    content = "date,merchant,amount,reference\n2025-01-01,STARBUCKS #12,5.50,R1\n2025-01-05,UBER,12.75,R2\nbad,X,1\n"
+    files = {"file": ("report.csv", io.BytesIO(content.encode()), "text/csv")}
+
+    r = client.post("/recon/auto-match", files=files)
+    assert r.status_code == 200
+    data = r.json()
+    assert seen["window"] == (date(2024, 12, 25), date(2025, 1, 12))
+    assert data["total_rows"] == 3 and seen["matched"]
+    assert [(m["row_number"], m["expense_id"], m["reference"]) for m in data["matches"]] == [(1, 7, "R1")]
+    assert data["unmatched_rows"] == [2]
+    assert data["errors"][0]["row_number"] == 3
@@ -0,0 +1,80 @@
+from sqlalchemy import create_engine, text
+from sqlalchemy.orm import sessionmaker
+
+from app import metrics, zoho
+
+
+def _sample(name, **labels):
+    return metrics.registry.get_sample_value(name, labels) or 0
+
+
+def test_requests_are_recorded_per_route_template(client):
+    """Test the middleware labels requests by route template, not raw path"""
+    before = _sample("http_requests_total", method="GET", route="/expenses/search", status="422")
+    client.get("/expenses/search")
+    client.get("/no/such/path")
+
+    assert _sample("http_requests_total", method="GET", route="/expenses/search", status="422") == before + 1
+    assert _sample("http_requests_total", method="GET", route="unmatched", status="404") >= 1
+    assert _sample("http_request_duration_seconds_count", method="GET", route="/expenses/search") >= 1
+
+    body = client.get("/metrics").text
+    assert "# TYPE http_request_duration_seconds histogram" in body
+    assert 'zoho_circuit_open' in body
+
+
+def test_engine_hooks_time_statements_and_count_per_request():
+    """Test every statement is timed and attributed to the active request stats"""
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    metrics.instrument_engine(engine)  # idempotent
+    before = _sample("db_statement_duration_seconds_count", scope="http", operation="SELECT")
+
+    with metrics.statement_stats() as stats, engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        conn.execute(text("select 2"))
+
+    assert stats.statements == 2 and stats.db_seconds > 0
+    assert _sample("db_statement_duration_seconds_count", scope="http", operation="SELECT") == before + 2
+    assert metrics._operation("  with x as (select 1) select * from x") == "WITH"
+    assert metrics._operation("VACUUM") == "OTHER"
+
+
+def test_commit_time_is_recorded_by_scope():
+    """Test session commits are timed under the active scope"""
+    factory = sessionmaker(bind=create_engine("sqlite://"))
+    metrics.instrument_sessions(factory)
+    before = _sample("db_commit_duration_seconds_count", scope="sync")
+    with metrics.statement_stats("sync"):
+        session = factory()
+        session.execute(text("SELECT 1"))
+        session.commit()
+        session.close()
+    assert _sample("db_commit_duration_seconds_count", scope="sync") == before + 1
+
+
+def test_sync_run_counts_status_and_rows():
+    """Test sync runs and row outcomes feed the sync counters"""
+    before = _sample("sync_runs_total", status="success")
+    with metrics.sync_run() as outcome:
+        outcome["result"] = {"status": "success"}
+    metrics.record_sync_rows("expenses", {"inserted": 2, "updated": 0, "unchanged": 5, "skipped": 0})
+
+    assert _sample("sync_runs_total", status="success") == before + 1
+    assert _sample("sync_rows_total", resource="expenses", outcome="unchanged") >= 5
+    assert _sample("sync_rows_total", resource="expenses", outcome="updated") == 0
+
+
+def test_zoho_collector_exports_telemetry(monkeypatch):
+    """Test the Zoho telemetry behind /health is exported as Prometheus metrics"""
+    telemetry = zoho.ZohoTelemetry()
+    telemetry.observe(200, 0.07)
+    telemetry.observe(429, 20.0)
+    telemetry.count("throttles")
+    monkeypatch.setattr(zoho, "telemetry", telemetry)
+
+    assert _sample("zoho_requests_total") == 2
+    assert _sample("zoho_throttles_total") == 1
+    assert _sample("zoho_responses_total", status="429") == 1
+    assert _sample("zoho_request_duration_seconds_bucket", le="0.1") == 1
+    assert _sample("zoho_request_duration_seconds_bucket", le="+Inf") == 2
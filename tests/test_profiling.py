@@ -0,0 +1,99 @@
+import logging
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, text
+
+from app import metrics, profiling
+
+
+@pytest.fixture
+def loop_app():
+    """App whose /loop route runs `n` identical statements on an instrumented engine"""
+    engine = create_engine("sqlite://")
+    metrics.instrument_engine(engine)
+    app = FastAPI()
+
+    @app.get("/loop")
+    def loop(n: int = 6):
+        with engine.connect() as conn:
+            for i in range(n):
+                conn.execute(text("SELECT :i"), {"i": i})
+        return {"n": n}
+
+    app.add_middleware(profiling.QueryProfilingMiddleware)
+    app.add_middleware(metrics.MetricsMiddleware)
+    return TestClient(app)
+
+
+def test_profiled_request_gets_server_timing_and_n_plus_one_warning(loop_app, monkeypatch, caplog):
+    """Test X-Query-Profile adds Server-Timing and repeated statements are flagged"""
+    monkeypatch.setitem(profiling.ROUTE_BUDGETS, "GET /loop", 3)
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        r = loop_app.get("/loop", headers={"X-Query-Profile": "1"})
+
+    timing = r.headers["server-timing"]
+    assert 'desc="6 statements"' in timing
+    assert 'db-shapes;desc="1 distinct, max repeat 6"' in timing
+    assert "app;dur=" in timing
+    messages = [rec.getMessage() for rec in caplog.records]
+    assert any("GET /loop ran 6 SQL statements (budget 3" in m for m in messages)
+    assert any("same statement 6 times (likely N+1): SELECT ?" in m for m in messages)
+
+
+def test_unprofiled_request_only_checks_budget(loop_app, monkeypatch, caplog):
+    """Test budgets are enforced without profiling while headers and shapes stay off"""
+    monkeypatch.setitem(profiling.ROUTE_BUDGETS, "GET /loop", 3)
+    with caplog.at_level(logging.WARNING, logger="app.profiling"):
+        r = loop_app.get("/loop", params={"n": 2})
+        assert "server-timing" not in r.headers
+        assert not caplog.records
+        loop_app.get("/loop", params={"n": 4})
+
+    assert [rec.getMessage().split(" (")[0] for rec in caplog.records] == ["GET /loop ran 4 SQL statements"]
+
+
+def test_profiling_setting_enables_every_request(loop_app, monkeypatch):
+    """Test QUERY_PROFILING turns profiling on without the header"""
+    monkeypatch.setattr(profiling.settings, "QUERY_PROFILING", True)
+    assert 'desc="2 statements"' in loop_app.get("/loop", params={"n": 2}).headers["server-timing"]
+
+
+def test_repeated_shapes_ignore_whitespace():
+    """Test statement shapes collapse formatting differences"""
+    stats = metrics.StatementStats()
+    stats.shapes = profiling.Counter()
+    for sql in ("SELECT 1\n  FROM t", "SELECT 1 FROM t", "SELECT 2"):
+        stats.record(sql, 0.001)
+    assert profiling.repeated_shapes(stats, 2) == [("SELECT 1 FROM t", 2)]
+
+
+def test_health_stays_within_query_budget(assert_max_queries):
+    """Test /health runs at most its single sync_state lookup"""
+    r = assert_max_queries("GET", "/health", profiling.ROUTE_BUDGETS["GET /health"])
+    assert r.status_code == 200
+
+
+# Unknown ids: the UPDATEs match nothing, so the endpoints leave data alone.
+# 2500 ids take three chunked UPDATEs; a per-expense loop would blow the budget.
+UNKNOWN_IDS = list(range(10**9, 10**9 + 2500))
+
+
+@pytest.mark.parametrize("ids", [UNKNOWN_IDS[:1], UNKNOWN_IDS])
+def test_mark_reimbursed_stays_within_query_budget(assert_max_queries, ids):
+    """Test marking reimbursed runs one UPDATE per chunk, not one per expense"""
+    r = assert_max_queries("POST", "/expenses/reimburse/mark",
+                           profiling.ROUTE_BUDGETS["POST /expenses/reimburse/mark"], json=ids)
+    assert r.status_code == 200
+    assert r.json()["not_found"] == len(ids)
+
+
+@pytest.mark.parametrize("ids", [UNKNOWN_IDS[:1], UNKNOWN_IDS])
+def test_assign_te_report_stays_within_query_budget(assert_max_queries, ids):
+    """Test assigning a T&E report runs one UPDATE per chunk, not one per expense"""
+    r = assert_max_queries("POST", "/expenses/kirkland-te/assign",
+                           profiling.ROUTE_BUDGETS["POST /expenses/kirkland-te/assign"],
+                           json={"expense_ids": ids, "te_report_number": "TE-BUDGET"})
+    assert r.status_code == 200
+    assert r.json()["not_found"] == len(ids)
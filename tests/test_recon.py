@@ -1,6 +1,22 @@
 import io
 import pytest
 
+from app import staging
+from app.routers import recon
+
+class _NoDbSession:
+    def add(self, obj): pass
+    def flush(self): pass
+    def commit(self): pass
+    def rollback(self): pass
+
+@pytest.fixture(autouse=True)
+def _no_staging_writes(monkeypatch):
+    """Uploads create a session and COPY staged rows; keep these endpoint tests off the database"""
+    monkeypatch.setattr(staging, "copy_staged_rows", lambda db, upload_id, rows: None)
+    monkeypatch.setattr(recon, "stage_upload",
+                        lambda db, fileobj, filename=None: staging.stage_upload(_NoDbSession(), fileobj, filename))
+
 def test_recon_upload_valid_csv(client):
     """Test reconciliation CSV upload with valid data"""
     content = "date,merchant,amount\n2025-01-01,STARBUCKS,5.50\n2025-01-02,UBER,12.75\n"
@@ -13,6 +29,7 @@ def test_recon_upload_valid_csv(client):
     assert data["total_rows"] == 2
     assert data["successful_rows"] == 2
     assert data["error_rows"] == 0
+    assert data["upload_id"]
 
 def test_recon_upload_invalid_file_type(client):
     """Test reconciliation upload rejects non-CSV files"""
@@ -71,9 +88,9 @@ def test_match_candidates_valid_merchant(client):
     assert "count" in data
     assert data["query"]["merchant"] == "starbucks"
 
-def test_create_match_invalid_expense(client):
+def test_create_match_invalid_expense(assert_max_queries):
     """Test create match with non-existent expense"""
-    r = client.post("/recon/match", json={
+    r = assert_max_queries("POST", "/recon/match", 1, json={
         "expense_id": 99999,
         "company_reference": "TEST-REF-001"
     })
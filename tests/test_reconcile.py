@@ -0,0 +1,77 @@
+import uuid
+
+from app import reconcile
+from app.routers import recon
+
+
+def test_values_clause_binds_and_casts_every_cell():
+    """Test VALUES rows are fully parameterised and typed"""
+    sql, params = reconcile.values_clause([(1, "A-1"), (2, "x'); DROP TABLE expenses; --")], ("bigint", "text"))
+    assert sql == "VALUES (CAST(:v0_0 AS bigint), CAST(:v0_1 AS text)), (CAST(:v1_0 AS bigint), CAST(:v1_1 AS text))"
+    assert params["v1_1"].startswith("x')")
+
+
+class _AcceptDb:
+    """Just enough Session for accept_matches: records the UPDATEs it runs"""
+
+    def __init__(self):
+        self.statements = []
+
+    def get(self, model, key, with_for_update=False):
+        return object()
+
+    def execute(self, stmt, params):
+        self.statements.append(str(stmt))
+        return type("Result", (), {"scalars": lambda self: [1, 2]})()
+
+    def commit(self):
+        pass
+
+
+def test_accept_empty_row_numbers_accepts_nothing():
+    """Test an explicit empty row_numbers list is not treated as 'accept all'"""
+    db = _AcceptDb()
+    assert reconcile.accept_matches(db, uuid.uuid4(), row_numbers=[]) == {"accepted": 0, "row_numbers": []}
+    assert db.statements == []
+
+    db = _AcceptDb()
+    assert reconcile.accept_matches(db, uuid.uuid4())["accepted"] == 2
+    assert len(db.statements) == 1 and "ANY(:rows)" not in db.statements[0]
+
+
+def test_session_not_found_is_404(client, monkeypatch):
+    """Test unknown reconciliation sessions return 404"""
+    def missing(db, session_id, *args):
+        raise reconcile.SessionNotFound(str(session_id))
+
+    monkeypatch.setattr(recon, "session_summary", missing)
+    r = client.get(f"/recon/sessions/{uuid.uuid4()}")
+    assert r.status_code == 404
+
+
+def test_accept_conflict_is_409(client, monkeypatch):
+    """Test accepting one expense for two rows is rejected"""
+    seen = {}
+    def conflict(db, session_id, row_numbers, overrides):
+        seen.update(row_numbers=row_numbers, overrides=overrides)
+        raise reconcile.MatchConflict("Each expense can be accepted for only one row, and must exist")
+
+    monkeypatch.setattr(recon, "accept_matches", conflict)
+    r = client.post(f"/recon/sessions/{uuid.uuid4()}/accept", json={
+        "matches": [{"row_number": 1, "expense_id": 7}, {"row_number": 2, "expense_id": 7}],
+    })
+    assert r.status_code == 409
+    assert seen == {"row_numbers": None, "overrides": [(1, 7), (2, 7)]}
+
+
+def test_commit_invalidates_reports_only_when_something_changed(client, monkeypatch):
+    """Test a retried (no-op) commit leaves the report cache alone"""
+    results = iter([{"committed": 3, "conflicts": [4]}, {"committed": 0, "conflicts": []}])
+    invalidations = []
+    monkeypatch.setattr(recon, "commit_matches", lambda db, session_id: next(results))
+    monkeypatch.setattr(recon.report_cache, "invalidate", lambda: invalidations.append(1))
+
+    session_id = uuid.uuid4()
+    assert client.post(f"/recon/sessions/{session_id}/commit").json() == {"committed": 3, "conflicts": [4]}
+    assert client.post(f"/recon/sessions/{session_id}/commit").json()["committed"] == 0
+    assert len(invalidations) == 1
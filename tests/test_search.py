@@ -0,0 +1,114 @@
+import pytest
+
+from app import search
+from app.routers import expenses as expenses_router
+
+
+class _RecordingSession:
+    def __init__(self, rows=()):
+        self.rows = rows
+        self.calls = []
+        self.commits = 0
+
+    def execute(self, stmt, params=None):
+        self.calls.append((str(stmt), params))
+        rows = self.rows
+        return type("Result", (), {"rowcount": 3, "__iter__": lambda self: iter(rows)})()
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_refresh_search_vectors_is_one_set_based_update():
+    """Test changed expenses and reports are reindexed by a single UPDATE"""
+    db = _RecordingSession()
+    assert search.refresh_search_vectors(db, {"E1"}, ["R1"]) == 3
+    (sql, params), = db.calls
+    assert sql.startswith("UPDATE expenses e SET search_vector =")
+    assert "setweight(to_tsvector('english', coalesce(x.merchant, '')), 'A')" in sql
+    assert "LEFT JOIN expense_reports r" in sql
+    assert params == {"expense_ids": ["E1"], "report_ids": ["R1"]}
+    assert db.commits == 1
+
+
+def test_refresh_search_vectors_skips_empty_input():
+    """Test nothing is executed when no rows changed"""
+    db = _RecordingSession()
+    assert search.refresh_search_vectors(db) == 0
+    assert db.calls == []
+
+
+def test_search_query_uses_keyset_after_first_page():
+    """Test later pages continue strictly after the last (rank, id)"""
+    db = _RecordingSession()
+    search.search_expenses(db, "taxi -uber", 21)
+    first_sql, first_params = db.calls[0]
+    assert "websearch_to_tsquery('english', :q)" in first_sql
+    assert "< (:after_rank, :after_id)" not in first_sql
+    assert first_params == {"q": "taxi -uber", "limit": 21}
+
+    search.search_expenses(db, "taxi", 21, after=(0.5, 42))
+    sql, params = db.calls[1]
+    assert "(ts_rank_cd(e.search_vector, q.query)::float8, e.id) < (:after_rank, :after_id)" in sql
+    assert "ts_rank_cd(e.search_vector, q.query)::float8 AS rank" in sql
+    assert params["after_rank"] == 0.5 and params["after_id"] == 42
+
+
+def test_search_pages_through_rows_tied_on_rank():
+    """Test keyset pages neither skip nor repeat hits sharing the boundary rank"""
+    from datetime import date
+    from sqlalchemy import text
+    from app.db import SessionLocal
+
+    db = SessionLocal()
+    try:
+        # Identical documents tie on rank; rolled back at the end
+        ids = [db.execute(text(
+            "INSERT INTO expenses (zoho_expense_id, txn_date, merchant, amount, currency, search_vector) "
+            "VALUES (:z, :d, 'Zyzzyvatie', 1, 'USD', to_tsvector('english', 'Zyzzyvatie')) RETURNING id"
+        ), {"z": f"search-tie-{i}", "d": date(2025, 1, 1)}).scalar() for i in range(5)]
+
+        seen, after = [], None
+        while True:
+            page = search.search_expenses(db, "zyzzyvatie", 2, after)
+            if not page:
+                break
+            seen += [r["id"] for r in page]
+            after = (page[-1]["rank"], page[-1]["id"])
+        assert seen == sorted(ids, reverse=True)
+    finally:
+        db.rollback()
+        db.close()
+
+
+def _hit(i, rank):
+    return {
+        "id": i, "txn_date": "2025-01-01", "merchant": "Taxi Co", "amount": 12, "currency": "USD",
+        "reimbursement_status": None, "category": "Travel", "report_title": None,
+        "rank": rank, "snippet": "<mark>Taxi</mark> Co",
+    }
+
+
+def test_search_endpoint_pages_with_cursor(client, monkeypatch):
+    """Test /expenses/search returns ranked hits and a cursor that round-trips"""
+    seen = []
+
+    def fake_search(db, q, limit, after):
+        seen.append((q, limit, after))
+        return [_hit(9, 0.8), _hit(7, 0.5), _hit(3, 0.1)][:limit]
+
+    monkeypatch.setattr(expenses_router, "search_expenses", fake_search)
+
+    r = client.get("/expenses/search", params={"q": "taxi", "limit": 2})
+    assert r.status_code == 200
+    assert [h["id"] for h in r.json()] == [9, 7]
+    assert r.json()[0]["snippet"] == "<mark>Taxi</mark> Co"
+
+    client.get("/expenses/search", params={"q": "taxi", "cursor": r.headers["x-next-cursor"]})
+    assert seen[1][2] == (0.5, 7)
+
+
+@pytest.mark.parametrize("params,status", [({"q": ""}, 422), ({"q": "taxi", "cursor": "!!"}, 400)])
+def test_search_endpoint_rejects_bad_input(client, params, status):
+    """Test empty queries and malformed cursors are rejected"""
+    assert client.get("/expenses/search", params=params).status_code == status
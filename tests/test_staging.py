@@ -0,0 +1,96 @@
+import io
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from app import staging
+
+
+class _FakeSession:
+    def __init__(self):
+        self.added = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def add(self, obj):
+        self.added.append(obj)
+
+    def flush(self):
+        pass
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_iter_lines_handles_chunk_boundaries_and_bom():
+    """Test lines and multi-byte characters split across chunks are reassembled"""
+    data = "﻿date,merchant\r\n2025-01-01,Café Zoë\n2025-01-02,Uber".encode()
+    lines = list(staging.iter_lines(io.BytesIO(data), chunk_size=3))
+    assert lines == ["date,merchant\r\n", "2025-01-01,Café Zoë\n", "2025-01-02,Uber"]
+
+
+def test_iter_company_rows_validates_each_row():
+    """Test rows are parsed lazily and bad rows are reported, not raised"""
+    content = 'date,merchant,amount\n2025-01-01,"SQ *CAFE, NYC",5.50\n01/02/2025,UBER,3\n2025-01-03,HOTEL,x\n'
+    rows = list(staging.iter_company_rows(io.BytesIO(content.encode()), chunk_size=8))
+    assert rows[0] == (1, {"date": date(2025, 1, 1), "merchant": "SQ *CAFE, NYC", "amount": 5.5, "reference": ""}, None)
+    assert rows[1][2].startswith("Invalid date")
+    assert rows[2][2].startswith("Invalid amount")
+
+
+@pytest.mark.parametrize("amount", ["inf", "-Infinity", "nan", "1e30", "10000000000000000", "9999999999999999.999"])
+def test_parse_company_row_rejects_amounts_outside_numeric_18_2(amount):
+    """Test amounts the COPY into numeric(18,2) would reject are row errors"""
+    with pytest.raises(ValueError, match="Invalid amount"):
+        staging.parse_company_row({"date": "2025-01-01", "merchant": "X", "amount": amount})
+
+
+def test_parse_company_row_rounds_amount_to_cents():
+    """Test amounts are parsed exactly and rounded like the numeric column"""
+    row = staging.parse_company_row({"date": "2025-01-01", "merchant": "X", "amount": " 9999999999999999.994 "})
+    assert row["amount"] == Decimal("9999999999999999.99")
+    assert staging.parse_company_row({"date": "2025-01-01", "merchant": "X", "amount": "2.005"})["amount"] == Decimal("2.01")
+
+
+@pytest.mark.parametrize("content", [b"wrong,columns\n1,2\n", b"\xff\xfe\x00d"])
+def test_iter_company_rows_rejects_unusable_files(content):
+    """Test missing columns and non-UTF-8 input raise CsvFormatError"""
+    with pytest.raises(staging.CsvFormatError):
+        list(staging.iter_company_rows(io.BytesIO(content)))
+
+
+def test_stage_upload_copies_in_batches_and_caps_errors(monkeypatch):
+    """Test valid rows are COPYed batch by batch and only the first K errors are returned"""
+    batches = []
+    monkeypatch.setattr(staging, "copy_staged_rows", lambda db, upload_id, rows: batches.append((upload_id, rows)))
+    lines = ["date,merchant,amount"]
+    lines += [f"2025-01-{i % 28 + 1:02d},M{i},{i}.50" for i in range(7)]
+    lines += ["bad,X,1"] * 4
+    db = _FakeSession()
+
+    result = staging.stage_upload(db, io.BytesIO("\n".join(lines).encode()), batch_size=3, max_errors=2)
+
+    assert [len(rows) for _, rows in batches] == [3, 3, 1]
+    assert {str(upload_id) for upload_id, _ in batches} == {result["upload_id"]}
+    assert (result["total_rows"], result["successful_rows"], result["error_rows"]) == (11, 7, 4)
+    assert len(result["errors"]) == 2 and result["errors_truncated"]
+    session, = db.added
+    assert str(session.id) == result["upload_id"]
+    assert (session.total_rows, session.staged_rows, session.error_rows) == (11, 7, 4)
+    assert db.commits == 1
+
+
+def test_stage_upload_rolls_back_on_copy_failure(monkeypatch):
+    """Test a failed COPY leaves nothing staged"""
+    def fail(db, upload_id, rows):
+        raise RuntimeError("copy failed")
+
+    monkeypatch.setattr(staging, "copy_staged_rows", fail)
+    db = _FakeSession()
+    with pytest.raises(RuntimeError):
+        staging.stage_upload(db, io.BytesIO(b"date,merchant,amount\n2025-01-01,A,1\n"))
+    assert (db.commits, db.rollbacks) == (0, 1)
@@ -0,0 +1,337 @@
+import asyncio
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from sqlalchemy.dialects import postgresql
+
+from app import sync
+from app.fx import FxRates
+from app.lookups import NameIdCache, SyncLookups
+from app.models import Vendor
+
+
+def _zoho_expense(z_id, **extra):
+    item = {
+        "expense_id": z_id,
+        "date": "2025-01-01",
+        "merchant": "STARBUCKS",
+        "category_name": "Meals",
+        "amount": 5.5,
+        "currency": {"code": "USD"},
+    }
+    item.update(extra)
+    return item
+
+
+def test_expense_upsert_stmt_is_single_multi_row_statement():
+    """Test a page of expenses compiles to one INSERT ... ON CONFLICT statement"""
+    rows = [
+        sync._expense_payload(_zoho_expense(str(i)), str(i), {}, None, None)
+        for i in range(3)
+    ]
+    sql = str(sync._expense_upsert_stmt(rows).compile(dialect=postgresql.dialect()))
+    assert sql.count("INSERT INTO expenses") == 1
+    assert "ON CONFLICT (zoho_expense_id) DO UPDATE" in sql
+    assert "excluded.amount" in sql
+    assert "zoho_expense_id = excluded" not in sql
+    assert "merchant_normalized = excluded.merchant_normalized" in sql
+    assert "WHERE expenses.payload_hash IS DISTINCT FROM excluded.payload_hash" in sql
+    assert "RETURNING expenses.zoho_expense_id, (xmax = 0) AS inserted" in sql
+
+
+def test_payload_hash_ignores_key_order_and_tracks_content():
+    """Test identical Zoho payloads hash equal and any field change alters the hash"""
+    a = sync._expense_payload(_zoho_expense("1"), "1", {}, None, None)
+    b = sync._expense_payload(dict(reversed(list(_zoho_expense("1").items()))), "1", {}, None, None)
+    c = sync._expense_payload(_zoho_expense("1", amount=5.51), "1", {}, None, None)
+    assert a["payload_hash"] == b["payload_hash"] != c["payload_hash"]
+
+
+def test_expense_payload_normalizes_merchant():
+    """Test the upsert payload carries the trigram-indexed merchant key"""
+    row = sync._expense_payload(_zoho_expense("1", merchant="SQ *BLUE BOTTLE #12"), "1", {}, None, None)
+    assert row["merchant_normalized"] == "blue bottle"
+
+
+def test_expense_payload_converts_amount_home():
+    """Test amount_home comes from Zoho when sent, else from the as-of FX rate"""
+    rates = FxRates("USD")
+    rates.add("EUR", date(2024, 12, 31), Decimal("1.10"))
+    eur = _zoho_expense("1", amount=10, currency={"code": "EUR"})
+
+    assert sync._expense_payload(eur, "1", {}, None, None, rates)["amount_home"] == Decimal("11.00")
+    assert sync._expense_payload(dict(eur, converted_amount=12), "1", {}, None, None, rates)["amount_home"] == 12
+    assert sync._expense_payload(_zoho_expense("1"), "1", {}, None, None, rates)["amount_home"] == Decimal("5.50")
+    assert sync._expense_payload(dict(eur, date="2024-12-30"), "1", {}, None, None, rates)["amount_home"] is None
+
+
+def test_category_name_prefers_explicit_name():
+    """Test category_name is used even when category is not a dict"""
+    assert sync._category_name({"category_name": "Travel", "category": "x"}) == "Travel"
+    assert sync._category_name({"category": {"name": "Meals"}}) == "Meals"
+    assert sync._category_name({"category": "Hotel"}) == "Hotel"
+
+
+def test_upsert_expenses_batches_and_dedupes(monkeypatch):
+    """Test upsert_expenses writes pages in batches, dedupes ids and skips invalid rows"""
+    batches = []
+    lookups = SyncLookups(maxsize=10)
+    lookups.vendors.put("STARBUCKS", 1)
+    lookups.categories.put("Meals", 2)
+    def fake_write(db, rows):
+        batches.append(rows)
+        counts = sync.UpsertCounts()
+        for r in rows[:1]:
+            counts.record(r["zoho_expense_id"], inserted=True)
+        counts.unchanged = len(rows) - 1
+        return counts
+
+    monkeypatch.setattr(sync, "_write_expense_batch", fake_write)
+    reindexed = []
+    monkeypatch.setattr(sync, "refresh_search_vectors", lambda db, ids: reindexed.append(set(ids)))
+
+    items = [_zoho_expense(str(i)) for i in range(5)]
+    items.append(_zoho_expense("3", amount=9.0))   # duplicate id, last one wins
+    items.append(_zoho_expense("bad", date=None))  # fails validation
+    items.append({"merchant": "no id"})
+
+    counts = sync.upsert_expenses(None, items, {}, lookups, batch_size=2)
+
+    assert counts.processed == 5
+    assert counts.to_dict() == {"inserted": 3, "updated": 0, "unchanged": 2, "skipped": 1}
+    assert [len(b) for b in batches] == [2, 2, 1]
+    by_id = {r["zoho_expense_id"]: r for b in batches for r in b}
+    assert by_id["3"]["amount"] == 9.0
+    assert by_id["0"]["vendor_id"] == 1 and by_id["0"]["category_id"] == 2
+    assert "bad" not in by_id
+    assert reindexed == [{"0", "2", "4"}]  # one UPDATE for the rows actually written
+
+
+def test_name_id_cache_evicts_least_recently_used():
+    """Test the lookup cache stays bounded and keeps recently used names"""
+    cache = NameIdCache(Vendor, maxsize=2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # touch "a" so "b" is the oldest
+    cache.put("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+
+
+def test_name_id_cache_resolves_cached_names_without_db():
+    """Test fully cached pages need no database round trip"""
+    cache = NameIdCache(Vendor, maxsize=10)
+    cache.put("UBER", 7)
+    assert cache.resolve(None, ["UBER", None, "", "UBER"]) == {"UBER": 7}
+
+
+def _fake_pages(n, calls):
+    async def fetch(page):
+        calls.append(page)
+        await asyncio.sleep(0)
+        return {"data": [page], "has_more": page < n}
+    return fetch
+
+
+def test_pipeline_writes_every_page_in_order():
+    """Test the prefetch pipeline writes each page once, in order, and stops at the last page"""
+    calls, written = [], []
+    total = asyncio.run(sync._run_pipeline(
+        _fake_pages(5, calls),
+        lambda page, data: written.extend(data["data"]) or len(data["data"]),
+        concurrency=3, prefetch=2,
+    ))
+    assert total == 5
+    assert written == [1, 2, 3, 4, 5]
+    assert max(calls) <= 5 + 2  # at most concurrency - 1 speculative requests
+
+
+def test_checkpoint_tracks_source_modified_times():
+    """Test pages advance the checkpoint and a finished pass moves the cursor to the newest modified time"""
+    from datetime import datetime, timezone
+    from app.models import SyncCheckpoint
+
+    class _Db:
+        commits = 0
+        def commit(self):
+            self.commits += 1
+
+    db = _Db()
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    cp = SyncCheckpoint(resource="expenses", cursor=start, since=start, page=0, max_modified=start, in_progress=True)
+
+    sync._checkpoint_page(db, cp, 1, [
+        {"last_modified_time": "2025-01-03T10:00:00+0000"},
+        {"last_modified_time": "2025-01-02T09:00:00+0000"},
+        {"last_modified_time": None},
+    ])
+    sync._checkpoint_page(db, cp, 2, [{"last_modified_time": "2024-12-30T00:00:00+0000"}])
+    assert cp.page == 2 and cp.in_progress
+    assert cp.since == start  # a resumed pass keeps listing with its original filter
+
+    sync._finish_checkpoint(db, cp)
+    assert cp.cursor == datetime(2025, 1, 3, 10, tzinfo=timezone.utc)
+    assert (cp.page, cp.in_progress, cp.since) == (0, False, None)
+    assert db.commits == 3
+
+
+def test_resumed_checkpoint_lists_from_newest_committed_time(monkeypatch):
+    """Test an interrupted pass resumes from page 1, listing from just before its newest committed change"""
+    from datetime import datetime, timedelta, timezone
+    from app.models import SyncCheckpoint
+
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    committed = datetime(2025, 1, 5, tzinfo=timezone.utc)
+    interrupted = SyncCheckpoint(resource="expenses", cursor=start, since=start, page=3,
+                                 max_modified=committed, in_progress=True)
+
+    class _Db:
+        def get(self, model, key):
+            return interrupted
+        def commit(self):
+            pass
+
+    monkeypatch.setattr(sync.settings, "SYNC_RESUME_OVERLAP_SECONDS", 60)
+    cp = sync._load_checkpoint(_Db(), "expenses", None)
+    # Rows edited since the interruption moved past later pages; listing from
+    # page 4 would skip whichever row shifted onto page 3
+    assert (cp.since, cp.page, cp.in_progress) == (committed - timedelta(minutes=1), 0, True)
+    assert cp.cursor == start
+
+
+def test_record_listed_twice_holds_the_cursor_back(caplog):
+    """Test a record edited mid-pass keeps the next pass from starting past records it may have shifted"""
+    from datetime import datetime, timezone
+    from app.models import SyncCheckpoint
+
+    class _Db:
+        def commit(self):
+            pass
+
+    tracker = sync.PassTracker("expense_id")
+    tracker.add([{"expense_id": "A", "last_modified_time": "2025-01-02T00:00:00+0000"},
+                 {"expense_id": "B", "last_modified_time": "2025-01-03T00:00:00+0000"}])
+    tracker.add([{"expense_id": "C", "last_modified_time": "2025-01-04T00:00:00+0000"},
+                 {"expense_id": "B", "last_modified_time": "2025-01-09T00:00:00+0000"}])
+    assert tracker.hold_back == datetime(2025, 1, 3, tzinfo=timezone.utc)
+
+    cp = SyncCheckpoint(resource="expenses", max_modified=datetime(2025, 1, 9, tzinfo=timezone.utc), in_progress=True)
+    sync._finish_checkpoint(_Db(), cp, tracker.hold_back)
+    assert cp.cursor == datetime(2025, 1, 3, tzinfo=timezone.utc)
+    assert "re-reads from 2025-01-03" in caplog.text
+
+    clean = sync.PassTracker("expense_id")
+    clean.add([{"expense_id": "A", "last_modified_time": "2025-01-02T00:00:00+0000"}])
+    assert clean.hold_back is None
+
+
+def test_ignored_modified_filter_is_logged(caplog):
+    """Test a first page older than the requested since is reported as a full re-read"""
+    from datetime import datetime, timezone
+
+    since = datetime(2025, 1, 5, tzinfo=timezone.utc)
+    sync._check_modified_filter("expenses", since, [{"last_modified_time": "2025-01-06T00:00:00+0000"}])
+    assert not caplog.records
+    sync._check_modified_filter("expenses", since, [{"last_modified_time": "2024-06-01T00:00:00+0000"}])
+    assert "ignored the modified-time filter for expenses" in caplog.text
+
+
+def test_pipeline_propagates_fetch_errors():
+    """Test a failed page fetch aborts the pipeline instead of being skipped"""
+    async def fetch(page):
+        if page == 2:
+            raise RuntimeError("boom")
+        return {"data": [page], "has_more": True}
+
+    written = []
+    with pytest.raises(RuntimeError, match="boom"):
+        asyncio.run(sync._run_pipeline(fetch, lambda page, data: written.append(data) or 1, concurrency=2, prefetch=1))
+    assert len(written) <= 1
+
+
+def test_pipeline_propagates_write_errors_with_full_queue():
+    """Test a failed write stops the pipeline even while the producer waits on a full queue"""
+    calls = []
+
+    def write(page, data):
+        if page == 2:
+            raise RuntimeError("write failed")
+        return 1
+
+    async def run():
+        task = asyncio.create_task(sync._run_pipeline(_fake_pages(50, calls), write, concurrency=3, prefetch=4))
+        done, _ = await asyncio.wait({task}, timeout=5)
+        assert done, "pipeline hung after the writer failed"
+        return task.result()
+
+    with pytest.raises(RuntimeError, match="write failed"):
+        asyncio.run(run())
+
+
+def test_apply_changes_fetches_and_upserts_only_changed_records(monkeypatch):
+    """Test webhook changes fetch single records, skip deleted ones and upsert reports first"""
+    calls = []
+
+    async def fake_token(db):
+        return "token"
+
+    async def fake_get_expense(db, expense_id):
+        return None if expense_id == "gone" else _zoho_expense(expense_id, report_id="R1")
+
+    async def fake_get_report(db, report_id):
+        return {"report_id": report_id}
+
+    def fake_upsert_expenses(db, items, report_map, touched_days=None, rates=None):
+        assert rates.home == "USD"
+        calls.append(("expenses", [it["expense_id"] for it in items], report_map))
+        counts = sync.UpsertCounts()
+        for it in items:
+            counts.record(it["expense_id"], inserted=False)
+        return counts
+
+    def fake_upsert_report(db, it, counts):
+        calls.append(("report", it["report_id"]))
+        counts.unchanged += 1
+
+    monkeypatch.setattr(sync, "get_valid_token", fake_token)
+    monkeypatch.setattr(sync, "get_expense", fake_get_expense)
+    monkeypatch.setattr(sync, "get_report", fake_get_report)
+    monkeypatch.setattr(sync, "upsert_report", fake_upsert_report)
+    monkeypatch.setattr(sync, "upsert_expenses", fake_upsert_expenses)
+    monkeypatch.setattr(sync, "_report_map_for", lambda db, items: {"R1": 5})
+    monkeypatch.setattr(sync.FxRates, "load", classmethod(lambda cls, db: cls("USD")))
+    monkeypatch.setattr(sync, "mirror_attachments", lambda db: {"stored": 1, "failed": 0})
+    monkeypatch.setattr(sync, "try_refresh_aggregates", lambda db, days: calls.append(("refresh",)))
+    monkeypatch.setattr(sync.report_cache, "invalidate", lambda: None)
+
+    result = sync.apply_changes(None, ["E1", "gone"], ["R1"])
+
+    assert result["reports"]["unchanged"] == 1
+    assert result["expenses"] == {"inserted": 0, "updated": 1, "unchanged": 0, "skipped": 0}
+    assert result["attachments"] == {"stored": 1, "failed": 0}
+    assert calls == [("report", "R1"), ("expenses", ["E1"], {"R1": 5}), ("refresh",)]
+
+
+def test_aggregates_outdated_compares_view_date_with_today():
+    """Test the daily refresh check reads expense_totals.as_of against CURRENT_DATE"""
+    from app.aggregates import aggregates_outdated
+
+    class _Result:
+        def __init__(self, value):
+            self.value = value
+        def scalar(self):
+            return self.value
+
+    class _Db:
+        def __init__(self, value):
+            self.value, self.sql = value, []
+        def execute(self, stmt):
+            self.sql.append(str(stmt))
+            return _Result(self.value)
+
+    db = _Db(True)
+    assert aggregates_outdated(db) is True
+    assert "MAX(as_of) < CURRENT_DATE" in db.sql[0] and "expense_totals" in db.sql[0]
+    assert aggregates_outdated(_Db(False)) is False
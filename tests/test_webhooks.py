@@ -0,0 +1,96 @@
+import json
+
+from app.config import settings
+from app.jobs import ChangeQueue
+from app.routers import webhooks
+
+
+class _InlineWorker:
+    """Runs submitted work only when told to, so tests control drain timing"""
+
+    def __init__(self):
+        self.queued = []
+
+    def submit(self, fn, *args):
+        self.queued.append((fn, args))
+
+    def run_all(self):
+        while self.queued:
+            fn, args = self.queued.pop(0)
+            fn(*args)
+
+
+def _send(client, payload, secret="whsec-test", signature=None):
+    """Fake Zoho sender: signs the exact bytes it posts"""
+    body = json.dumps(payload).encode()
+    headers = {
+        "Content-Type": "application/json",
+        webhooks.SIGNATURE_HEADER: webhooks.sign(body, secret) if signature is None else signature,
+    }
+    return client.post("/webhooks/zoho", content=body, headers=headers)
+
+
+def test_webhook_queues_signed_changes(client, monkeypatch):
+    """Test a signed notification queues the changed ids"""
+    queued = []
+    monkeypatch.setattr(settings, "ZOHO_WEBHOOK_SECRET", "whsec-test")
+    monkeypatch.setattr(webhooks.change_queue, "add", lambda changes: queued.append(changes) or {"expense": 2, "report": 1})
+
+    r = _send(client, {"events": [
+        {"expense": {"expense_id": "E1", "report_id": "R9"}},
+        {"expense_id": "E2", "report_id": "R9"},
+        {"report_id": "R1"},
+    ]})
+    assert r.status_code == 202
+    assert queued == [{"expense": {"E1", "E2"}, "report": {"R1"}}]
+
+
+def test_webhook_rejects_bad_signature(client, monkeypatch):
+    """Test tampered or unsigned bodies are rejected"""
+    monkeypatch.setattr(settings, "ZOHO_WEBHOOK_SECRET", "whsec-test")
+    assert _send(client, {"expense_id": "E1"}, secret="wrong").status_code == 401
+    assert _send(client, {"expense_id": "E1"}, signature="").status_code == 401
+    assert _send(client, {"expense_id": "E1"}, signature="é".encode()).status_code == 401
+
+
+def test_webhook_disabled_without_secret(client, monkeypatch):
+    """Test the receiver is off unless a secret is configured"""
+    monkeypatch.setattr(settings, "ZOHO_WEBHOOK_SECRET", "")
+    assert _send(client, {"expense_id": "E1"}).status_code == 404
+
+
+def test_change_queue_dedupes_and_drains_in_batches():
+    """Test repeated ids are fetched once, reports first, in bounded batches"""
+    worker = _InlineWorker()
+    applied = []
+    queue = ChangeQueue(worker, lambda expenses, reports: applied.append((expenses, reports)), batch_size=3)
+
+    assert queue.add({"expense": ["E1", "E2"]}) == {"expense": 2, "report": 0}
+    assert queue.add({"expense": ["E2", "E3"], "report": ["R1"]}) == {"expense": 1, "report": 1}
+    assert len(worker.queued) == 1  # one drain scheduled for both notifications
+
+    worker.run_all()
+    assert applied == [(["E1", "E2"], ["R1"]), (["E3"], [])]
+    assert queue.pending() == {"expense": 0, "report": 0}
+
+
+def test_change_queue_keeps_ids_when_apply_fails():
+    """Test failed batches stay pending for the next drain"""
+    worker = _InlineWorker()
+    calls = []
+
+    def apply(expenses, reports):
+        calls.append(expenses)
+        if len(calls) == 1:
+            raise RuntimeError("zoho down")
+
+    queue = ChangeQueue(worker, apply)
+    queue.add({"expense": ["E1"]})
+    worker.run_all()
+    assert queue.pending() == {"expense": 1, "report": 0}
+    assert queue.last_error == "zoho down"
+
+    queue.add({"expense": ["E2"]})
+    worker.run_all()
+    assert calls[-1] == ["E1", "E2"]
+    assert queue.pending()["expense"] == 0
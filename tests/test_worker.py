@@ -0,0 +1,30 @@
+import asyncio
+import threading
+
+from app.worker import SyncWorker
+
+
+def test_worker_runs_jobs_off_the_event_loop_thread():
+    """Test sync jobs run on the dedicated worker thread, not the caller's loop"""
+    worker = SyncWorker()
+
+    async def scenario():
+        return await worker.run(lambda: threading.current_thread().name)
+
+    try:
+        name = asyncio.run(scenario())
+    finally:
+        worker.shutdown()
+    assert name.startswith("sync-worker")
+    assert name != threading.current_thread().name
+
+
+def test_worker_runs_cleanup_after_queued_jobs():
+    """Test shutdown cleanup runs on the worker thread once queued jobs finish"""
+    worker = SyncWorker()
+    order = []
+    worker.submit(order.append, "job")
+    done = threading.Event()
+    worker.shutdown(cleanup=lambda: (order.append("cleanup"), done.set()))
+    assert done.wait(5)
+    assert order == ["job", "cleanup"]
@@ -0,0 +1,181 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import httpx
+import pytest
+
+from app import zoho
+
+
+def test_client_is_pooled_per_event_loop():
+    """Test the Zoho client is shared within a loop and closed on shutdown"""
+    async def scenario():
+        first = zoho.get_client()
+        assert zoho.get_client() is first
+        await zoho.close_client()
+        assert first.is_closed
+        second = zoho.get_client()
+        assert second is not first
+        await zoho.close_client()
+
+    asyncio.run(scenario())
+
+
+def test_cached_token_skips_database(monkeypatch):
+    """Test a fresh cached token is returned without querying or decrypting"""
+    expires = datetime.now(timezone.utc) + timedelta(hours=1)
+    monkeypatch.setitem(zoho._token_cache, zoho.PROVIDER, ("cached-token", expires))
+
+    assert asyncio.run(zoho.get_valid_token(None)) == "cached-token"
+
+
+def test_expiring_token_is_not_served_from_cache(monkeypatch):
+    """Test tokens inside the refresh margin fall through to the database"""
+    expires = datetime.utcnow() + timedelta(seconds=30)  # naive, as stored by oauth callback
+    monkeypatch.setitem(zoho._token_cache, zoho.PROVIDER, ("stale-token", expires))
+
+    assert zoho._expiring(expires)
+    with pytest.raises(AttributeError):  # fell through to db.query on the None session
+        asyncio.run(zoho.get_valid_token(None))
+
+
+@pytest.fixture
+def zoho_transport(monkeypatch):
+    """Route Zoho calls to a scripted MockTransport with fresh limiter state and no real sleeps"""
+    responses = []
+    sleeps = []
+
+    def handler(request):
+        item = responses.pop(0)
+        if isinstance(item, Exception):
+            raise item
+        return item
+
+    async def fake_sleep(seconds):
+        sleeps.append(seconds)
+
+    monkeypatch.setattr(zoho, "_build_client", lambda: httpx.AsyncClient(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(zoho, "_sleep", fake_sleep)
+    monkeypatch.setattr(zoho, "bucket", zoho.TokenBucket(6000, 100))
+    monkeypatch.setattr(zoho, "breaker", zoho.CircuitBreaker(3, 60))
+    monkeypatch.setattr(zoho, "telemetry", zoho.ZohoTelemetry())
+    return responses, sleeps
+
+
+def _call(method="GET", url="https://zoho.test/x"):
+    async def scenario():
+        try:
+            return await zoho._request(method, url)
+        finally:
+            await zoho.close_client()
+    return asyncio.run(scenario())
+
+
+def test_request_retries_throttles_honoring_retry_after(zoho_transport):
+    """Test a 429 waits for Retry-After and the retry succeeds"""
+    responses, sleeps = zoho_transport
+    responses += [httpx.Response(429, headers={"Retry-After": "7"}), httpx.Response(200, json={"ok": True})]
+
+    assert _call().json() == {"ok": True}
+    assert sleeps == [pytest.approx(7.0, abs=0.05)]
+    snap = zoho.telemetry.snapshot()
+    assert (snap["requests"], snap["throttles"], snap["retries"]) == (2, 1, 1)
+    assert snap["statuses"] == {"429": 1, "200": 1}
+    assert snap["latency_seconds"]["count"] == 2
+
+
+def test_request_backs_off_on_server_errors_then_gives_up(zoho_transport, monkeypatch):
+    """Test 5xx responses back off exponentially and the last one is returned"""
+    responses, sleeps = zoho_transport
+    monkeypatch.setattr(zoho.settings, "ZOHO_MAX_RETRIES", 2)
+    monkeypatch.setattr(zoho, "breaker", zoho.CircuitBreaker(10, 60))
+    monkeypatch.setattr(zoho.random, "uniform", lambda lo, hi: hi)
+    responses += [httpx.Response(503), httpx.Response(502), httpx.Response(500)]
+
+    assert _call().status_code == 500
+    assert sleeps == [1.0, 2.0]
+    assert zoho.telemetry.snapshot()["failures"] == 1
+
+
+def test_circuit_breaker_fails_fast_once_open(zoho_transport, monkeypatch):
+    """Test requests that fail after all retries open the breaker and later calls never reach Zoho"""
+    responses, _ = zoho_transport
+    monkeypatch.setattr(zoho.settings, "ZOHO_MAX_RETRIES", 1)
+    responses += [httpx.ConnectError("boom")] * 6
+
+    for _ in range(3):
+        with pytest.raises(httpx.ConnectError):
+            _call()
+    assert zoho.breaker.state == "open"
+    assert responses == []
+    with pytest.raises(zoho.ZohoUnavailable):
+        _call()
+    assert zoho.telemetry.snapshot()["rejected"] == 1
+
+
+def test_one_request_retrying_does_not_trip_the_breaker(zoho_transport, monkeypatch):
+    """Test retries beyond the threshold count once and the last response is still returned"""
+    responses, _ = zoho_transport
+    monkeypatch.setattr(zoho.settings, "ZOHO_MAX_RETRIES", 5)
+    responses += [httpx.Response(503)] * 6
+
+    assert _call().status_code == 503
+    assert zoho.breaker.state == "closed"
+    assert zoho.breaker._failures == 1
+
+
+def test_half_open_breaker_lets_one_trial_through(monkeypatch):
+    """Test only one caller probes a recovering Zoho; its outcome closes or reopens the breaker"""
+    now = [0.0]
+    monkeypatch.setattr(zoho.time, "monotonic", lambda: now[0])
+    breaker = zoho.CircuitBreaker(1, 60)
+    breaker.failure()
+    assert not breaker.allow()
+
+    now[0] = 61
+    assert [breaker.allow() for _ in range(3)] == [True, False, False]
+    breaker.failure()
+    assert breaker.state == "open" and not breaker.allow()
+
+    now[0] = 122
+    assert breaker.allow() and not breaker.allow()
+    breaker.release()  # a throttled or cancelled trial frees the slot
+    assert breaker.allow()
+    breaker.success()
+    assert breaker.state == "closed"
+    assert [breaker.allow() for _ in range(3)] == [True, True, True]
+
+
+def test_client_errors_are_not_retried(zoho_transport):
+    """Test 4xx other than 429 are returned straight away"""
+    responses, sleeps = zoho_transport
+    responses.append(httpx.Response(404))
+    assert _call().status_code == 404
+    assert sleeps == []
+
+
+def test_token_bucket_paces_after_burst():
+    """Test requests beyond the burst are delayed at the sustained rate"""
+    bucket = zoho.TokenBucket(rate_per_minute=60, burst=2)
+    waits = [bucket._reserve() for _ in range(4)]
+    assert waits[:2] == [0.0, 0.0]
+    assert waits[2] == pytest.approx(1.0, abs=0.05)
+    assert waits[3] == pytest.approx(2.0, abs=0.05)
+
+
+def test_streamed_request_retries_and_returns_unread_body(zoho_transport):
+    """Test stream=True retries like any request and hands back an open response"""
+    responses, _ = zoho_transport
+    responses += [httpx.Response(503), httpx.Response(200, content=b"receipt")]
+
+    async def scenario():
+        try:
+            response = await zoho._request("GET", "https://zoho.test/receipt", stream=True)
+            body = b"".join([chunk async for chunk in response.aiter_bytes()])
+            await response.aclose()
+            return body
+        finally:
+            await zoho.close_client()
+
+    assert asyncio.run(scenario()) == b"receipt"
+    assert zoho.telemetry.snapshot()["retries"] == 1